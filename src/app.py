@@ -4,6 +4,12 @@ from blueprints.users_bp import users_bp
 from blueprints.teams_bp import teams_bp
 from blueprints.leagues_bp import leagues_bp
 from blueprints.sports_bp import sports_bp 
+from blueprints.admin_bp import admin_bp
+from blueprints.matches_bp import matches_bp
+from blueprints.export_bp import export_bp
+from blueprints.metrics_bp import metrics_bp
+from blueprints.search_bp import search_bp
+from serializers import compile_all
 
 
 # All blueprint modules are imported from
@@ -17,4 +23,13 @@ app.register_blueprint(users_bp)
 app.register_blueprint(teams_bp)
 app.register_blueprint(leagues_bp)
 app.register_blueprint(sports_bp)
+app.register_blueprint(admin_bp)
+app.register_blueprint(matches_bp)
+app.register_blueprint(export_bp)
+app.register_blueprint(metrics_bp)
+app.register_blueprint(search_bp)
 
+
+# Every model schema is now imported, so the serializers the
+# blueprints asked for can be compiled before the first request.
+compile_all()
@@ -0,0 +1,278 @@
+import asyncio
+import io
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from os import environ
+from flask.cli import load_dotenv
+
+# "flask run" reads .flaskenv before importing the app; ASGI servers
+# don't, so it is loaded here before setup.py reads the environment.
+load_dotenv()
+
+from flask_jwt_extended import verify_jwt_in_request
+from werkzeug.exceptions import HTTPException
+from app import app
+from setup import db
+from async_db import AsyncDatabase
+from etags import versions_statement, format_etag, not_modified, with_etag
+from pagination import page_statement, page_rows
+from models.team import Team
+from models.user import User
+from models.league import League
+from models.sport import Sport
+from blueprints.teams_bp import TEAM_LOAD_PLAN, dump_teams, dump_team
+from blueprints.users_bp import USER_LIST_LOAD_PLAN, dump_users
+from blueprints.leagues_bp import LEAGUE_LOAD_PLAN, dump_league
+from blueprints.sports_bp import SPORT_LOAD_PLAN, dump_sport
+
+
+# asgi.py is an optional ASGI entry point for the same app, e.g.
+#
+#   uvicorn asgi:application --port 5550
+#
+# The busiest read routes are served by the async views below, which
+# wait on the database without holding a thread, so one process can
+# keep many slow clients going at once. Every other route is passed
+# to the Flask app unchanged and runs in a pool of ASGI_THREADS
+# threads (default 8), just as it would under a WSGI server.
+#
+# Requests are matched against Flask's own url_map, and the async
+# views run inside a Flask request context. So the JWT check, the
+# auth guards, abort(), the error handlers, the schemas and the
+# serializers are all the ones the blueprints use.
+async_db = AsyncDatabase(app, environ)
+
+# How many chunks of a streamed response may wait for the client
+STREAM_BUFFER = 8
+
+
+async def async_etag(session, *keys):
+    versions = dict((await session.execute(versions_statement(keys))).all())
+    return format_etag(keys, versions)
+
+
+async def async_paginate(session, stmt, *columns):
+    stmt, limit = page_statement(stmt, *columns)
+    return page_rows((await session.scalars(stmt)).all(), limit, *columns)
+
+
+# The async views mirror the blueprint routes of the same endpoint.
+async def all_teams(session):
+    etag = await async_etag(session, "teams")
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    teams, next_cursor = await async_paginate(session, db.select(Team), Team.team_name, Team.id)
+    return with_etag({"data": dump_teams(teams), "next": next_cursor}, etag)
+
+
+async def one_team(session, id):
+    etag = await async_etag(session, f"team:{id}")
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    team = await session.scalar(db.select(Team).filter_by(id=id).options(*TEAM_LOAD_PLAN))
+    if team:
+        return with_etag(dump_team(team), etag)
+    return {"error": "Team not found"}, 404
+
+
+async def captains(session):
+    stmt = db.select(User).where(User.captain).options(*USER_LIST_LOAD_PLAN)
+    users, next_cursor = await async_paginate(session, stmt, User.id)
+    return {"data": dump_users(users), "next": next_cursor}
+
+
+async def get_league(session, id):
+    etag = await async_etag(session, f"league:{id}")
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    league = await session.scalar(db.select(League).filter_by(id=id).options(*LEAGUE_LOAD_PLAN))
+    if league:
+        return with_etag(dump_league(league), etag)
+    return {"error": "League not found"}, 404
+
+
+async def get_sport(session, id):
+    etag = await async_etag(session, f"sport:{id}")
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    sport = await session.scalar(db.select(Sport).filter_by(id=id).options(*SPORT_LOAD_PLAN))
+    if sport:
+        return with_etag(dump_sport(sport), etag)
+    return {"error": "League not found"}, 404
+
+
+# ASYNC_VIEWS maps Flask endpoint names to the async views that
+# replace them. All of them are @jwt_required() GET routes.
+ASYNC_VIEWS = {
+    "teams.all_teams": all_teams,
+    "teams.one_team": one_team,
+    "users.captains": captains,
+    "leagues.get_league": get_league,
+    "sports.get_sport": get_sport,
+}
+
+
+# wsgi_environ translates an ASGI http scope and its body into the
+# WSGI environ Flask expects.
+def wsgi_environ(scope, body):
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf8").decode("latin1"),
+        "PATH_INFO": scope["path"].encode("utf8").decode("latin1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope.get("headers", []):
+        name, value = name.decode("latin1").upper().replace("-", "_"), value.decode("latin1")
+        if name not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            name = f"HTTP_{name}"
+        environ[name] = f"{environ[name]},{value}" if name in environ else value
+    return environ
+
+
+def response_start(status, headers):
+    return {
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(name.lower().encode("latin1"), value.encode("latin1")) for name, value in headers],
+    }
+
+
+class AsgiApp:
+    def __init__(self, app, views, threads):
+        self.app = app
+        self.views = views
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="wsgi")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self.lifespan(receive, send)
+        if scope["type"] != "http":
+            return
+
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        environ = wsgi_environ(scope, body)
+
+        try:
+            endpoint, args = self.app.url_map.bind_to_environ(environ).match()
+        except HTTPException:
+            # 404s, 405s and trailing slash redirects are left to Flask
+            endpoint, args = None, {}
+        view = self.views.get(endpoint)
+        if not view:
+            return await self.stream_wsgi(environ, scope["method"] == "HEAD", send)
+        status, headers, body = await self.call_view(view, environ, args)
+        if scope["method"] == "HEAD":
+            body = b""
+
+        await send(response_start(status, headers))
+        await send({"type": "http.response.body", "body": body})
+
+    # call_view runs an async view the way Flask would run the
+    # blueprint view: inside a request context, after the app's
+    # before_request hooks and behind the same JWT check, with
+    # exceptions passed to the app's error handlers.
+    async def call_view(self, view, environ, args):
+        with self.app.request_context(environ):
+            try:
+                try:
+                    rv = self.app.preprocess_request()
+                    if rv is None:
+                        verify_jwt_in_request()
+                        async with async_db.session() as session:
+                            rv = await view(session, **args)
+                except Exception as err:
+                    rv = self.app.handle_user_exception(err)
+                response = self.app.make_response(rv)
+            except Exception as err:
+                response = self.app.make_response(self.app.handle_exception(err))
+            response = self.app.process_response(response)
+            return response.status_code, response.headers.to_wsgi_list(), response.get_data()
+
+    # stream_wsgi runs a request through the Flask app in a worker
+    # thread and sends the response on as the app produces it, so a
+    # streamed response (such as an export) is never held in memory
+    # whole. The thread hands chunks over through a small queue and
+    # waits when the client falls behind. If the client goes away,
+    # the thread stops reading the response and closes it.
+    async def stream_wsgi(self, environ, head, send):
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=STREAM_BUFFER)
+        cancelled = threading.Event()
+        done = loop.run_in_executor(self.executor, self.call_wsgi, environ, loop, queue, cancelled)
+        try:
+            status, headers = await queue.get()
+            await send(response_start(status, headers))
+            while (chunk := await queue.get()) is not None:
+                if chunk and not head:
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+        except BaseException:
+            cancelled.set()
+            while not queue.empty():
+                queue.get_nowait()
+            raise
+        finally:
+            await done
+
+    # call_wsgi runs in a worker thread. The response is read in this
+    # one thread from start to finish, since a streamed response keeps
+    # its request context in the thread that started it.
+    def call_wsgi(self, environ, loop, queue, cancelled):
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started["status"] = int(status.split(" ", 1)[0])
+            started["headers"] = headers
+
+        def put(item):
+            asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+        result = self.app(environ, start_response)
+        try:
+            put((started["status"], started["headers"]))
+            for chunk in result:
+                if cancelled.is_set():
+                    return
+                put(chunk)
+        finally:
+            if hasattr(result, "close"):
+                result.close()
+            if not cancelled.is_set():
+                put(None)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await async_db.dispose()
+                self.executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+application = AsgiApp(app, ASYNC_VIEWS, int(environ.get("ASGI_THREADS") or 8))
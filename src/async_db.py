@@ -0,0 +1,75 @@
+import random
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from pooling import engine_options
+from routing import replica_keys, wrote_recently
+
+
+# The async_db module is the database layer of the ASGI server in
+# asgi.py. It opens the same primary and replica databases as
+# db.session, through SQLAlchemy's asyncio extension, so a request
+# waiting on the database gives the event loop back instead of
+# holding a thread. Models, statements and load plans are the
+# ordinary ones from models/ and the blueprints.
+#
+# The async drivers are only needed to run asgi.py, see
+# requirements-asgi.txt.
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def async_url(uri):
+    url = make_url(uri)
+    return url.set(drivername=ASYNC_DRIVERS[url.get_backend_name()])
+
+
+# async_engine_options reuses the DB_POOL_* settings. The async
+# engines use SQLAlchemy's own async pool, and asyncpg takes the
+# statement timeout as a server setting instead of psql options.
+def async_engine_options(uri, environ):
+    options = engine_options(uri, environ)
+    options.pop("poolclass", None)
+    connect_args = options.pop("connect_args", {})
+    if "options" in connect_args:
+        timeout = connect_args["options"].rsplit("=", 1)[1]
+        options["connect_args"] = {"server_settings": {"statement_timeout": timeout}}
+    return options
+
+
+class AsyncDatabase:
+    def __init__(self, app, environ):
+        self.app = app
+        self.environ = environ
+        self._sessions = None
+
+    # The engines are created on first use, inside the server's event
+    # loop, since asyncio connections can't move between loops.
+    def _sessionmakers(self):
+        if self._sessions is None:
+            uris = {None: self.app.config["SQLALCHEMY_DATABASE_URI"]}
+            for key, bind in self.app.config["SQLALCHEMY_BINDS"].items():
+                uris[key] = bind["url"] if isinstance(bind, dict) else bind
+            self._sessions = {
+                key: async_sessionmaker(
+                    create_async_engine(async_url(uri), **async_engine_options(uri, self.environ)),
+                    class_=AsyncSession, expire_on_commit=False)
+                for key, uri in uris.items()
+            }
+        return self._sessions
+
+    # session opens a session for a read-only request, on a replica
+    # when there are any and the client hasn't written recently, the
+    # same rule RoutingSession applies to db.session.
+    def session(self):
+        sessions = self._sessionmakers()
+        replicas = replica_keys(sessions)
+        if replicas and not wrote_recently():
+            return sessions[random.choice(replicas)]()
+        return sessions[None]()
+
+    async def dispose(self):
+        for sessionmaker in (self._sessions or {}).values():
+            await sessionmaker.kw["bind"].dispose()
+        self._sessions = None
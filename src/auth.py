@@ -1,6 +1,8 @@
+import time
+from datetime import timedelta
 from models.user import User
-from flask import abort
-from flask_jwt_extended import get_jwt_identity
+from flask import abort, g
+from flask_jwt_extended import get_jwt, get_jwt_identity
 from setup import db
 
 
@@ -8,18 +10,70 @@ from setup import db
 # functions that assist with authentication on our
 # bluprint routes.
 
+# Access tokens from login are valid for this long, unless revoked
+# (see revocation.py).
+TOKEN_LIFETIME = timedelta(hours=10)
+
+
+# user_claims builds the role claims that login stores in the
+# access token alongside the email identity. Because the roles
+# travel with the token, the guards below can usually authorise a
+# request without a database round trip.
+def user_claims(user):
+    return {
+        "user_id": user.id,
+        "admin": bool(user.admin),
+        "captain": bool(user.captain),
+        "team_id": user.team_id,
+    }
+
+
+# token_claims are the claims of a new access token: the role claims
+# and "issued", the time it was issued to the microsecond. Revoking
+# all of a user's tokens covers those issued up to the revocation,
+# and the standard "iat" claim is in whole seconds, so it would also
+# cover a token issued later in the same second, such as the one
+# from logging in again straight after.
+def token_claims(user):
+    return dict(user_claims(user), issued=time.time())
+
+
+# current_user loads the User matching the JWT email identity.
+# The result is kept on flask.g, so it is looked up at most once
+# per request however many guards or handlers ask for it.
+def current_user():
+    if "current_user" not in g:
+        user_email = get_jwt_identity()
+        stmt = db.select(User).where(User.email == user_email)
+        g.current_user = db.session.scalar(stmt)
+    return g.current_user
+
+
+# current_claims returns the roles of the requesting user. By
+# default they are read straight from the token. Strict mode is
+# used on sensitive writes and re-reads the roles from the
+# database, so a user who was demoted since logging in can't use
+# their old token to delete data. Tokens issued before the role
+# claims existed fall back to the database as well.
+def current_claims(strict=False):
+    claims = get_jwt()
+    if strict or "admin" not in claims:
+        user = current_user()
+        if not user:
+            abort(401)
+        return user_claims(user)
+    return claims
+
+
 # The admin_required function allows us to modularise
-# for reuse later. This function finds whether a user
-# exists and whether that users' email matches the
-# the one entered.
+# for reuse later. This function checks the admin claim
+# of the requesting user.
 
 # If the user is not an admin, the function will
 # abort the operation immediately, returning 401.
-def admin_required():
-    user_email = get_jwt_identity()
-    stmt = db.select(User).where(User.email == user_email)
-    user = db.session.scalar(stmt)
-    if not (user and user.admin):
+def admin_required(strict=False):
+    claims = current_claims(strict)
+    if not claims["admin"]:
         abort(401)
 
 
@@ -27,11 +81,9 @@ def admin_required():
 # captain_required checks if the user, identified by JWT email,
 # is a captain or admin; if not, it aborts with a 401 error,
 # ensuring secure team updates.
-def captain_required():
-    user_email = get_jwt_identity()
-    stmt = db.select(User).where(User.email == user_email)
-    user = db.session.scalar(stmt)
-    if not (user and (user.admin or user.captain)):
+def captain_required(strict=False):
+    claims = current_claims(strict)
+    if not (claims["admin"] or claims["captain"]):
         abort(401)
 
 
@@ -39,11 +91,9 @@ def captain_required():
 # identified by JWT email, matches the team ID and holds
 # captain or admin status; if not, it aborts with a 401,
 # ensuring authorized team detail updates.
-def captain_id_required(id):
-    user_email = get_jwt_identity()
-    stmt = db.select(User).where(User.email == user_email)
-    user = db.session.scalar(stmt)
-    if not (user.team_id == id and (user.admin or user.captain)):
+def captain_id_required(id, strict=False):
+    claims = current_claims(strict)
+    if not (claims["team_id"] == id and (claims["admin"] or claims["captain"])):
         abort(401)
 
 
@@ -51,9 +101,7 @@ def captain_id_required(id):
 # user_id_required verifies that the user, identified by JWT email
 # and matching user ID, exists; otherwise, it aborts with a 401 error,
 # ensuring authorized user data access.
-def user_id_required(id):
-    user_email = get_jwt_identity()
-    stmt = db.select(User).where(User.email == user_email, User.id == id)
-    user = db.session.scalar(stmt)
-    if not user:
+def user_id_required(id, strict=False):
+    claims = current_claims(strict)
+    if claims["user_id"] != id:
         abort(401)
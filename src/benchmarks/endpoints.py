@@ -0,0 +1,454 @@
+import argparse
+import http.client
+import itertools
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from serving import SRC, login, percentile, server_command, start_server, stop_server, wait_for_port
+
+
+# endpoints.py benchmarks every route of the users, teams, leagues
+# and sports blueprints, so a change to a view, a schema or a query
+# can be checked for its effect on latency before it is merged.
+#
+# "run" creates the app against the local database in --db-uri, which
+# is dropped and seeded with "flask db seed" at the chosen --scale,
+# so give it a scratch database, and adds the spare rows the write
+# routes use up, such as teams to delete. It then starts the server
+# with SQL_PROFILE on, logs in as the admin and, one route at a time,
+# has --concurrency clients send requests back to back for
+# --duration seconds. Each route reports requests per second, the
+# p50, p95 and p99 latency and the queries per request (from the
+# X-Query-Count header, see profiling.py). --output saves the results
+# as a JSON baseline.
+#
+#   python benchmarks/endpoints.py run --db-uri postgresql+psycopg2://localhost/bench --output main.json
+#   python benchmarks/endpoints.py run --db-uri postgresql+psycopg2://localhost/bench --output branch.json
+#   python benchmarks/endpoints.py compare main.json branch.json
+#
+# "compare" lists every route whose p95 or p99 latency grew, or whose
+# throughput fell, by more than --threshold, and every route that
+# runs more queries, then exits with status 1 if there were any.
+# Compare runs made on the same machine, scale and database only.
+BLUEPRINTS = ("users", "teams", "leagues", "sports")
+
+# The "flask db seed" options for each --scale
+SCALES = {
+    "small": {"sports": 2, "leagues_per_sport": 4, "teams_per_league": 8, "users": 2000, "rounds": 4},
+    "medium": {"sports": 5, "leagues_per_sport": 10, "teams_per_league": 10, "users": 20000, "rounds": 8},
+    "large": {"sports": 10, "leagues_per_sport": 20, "teams_per_league": 12, "users": 200000, "rounds": 10},
+}
+
+# Latencies below this many milliseconds are never reported as
+# regressions, as a change of a few tenths of a millisecond is noise
+MIN_MS = 1.0
+
+# Free agents made for POST /leagues/<id>/build, four teams' worth
+BUILD_PLAYERS = 48
+
+
+def letters(n):
+    code = ""
+    n += 1
+    while n:
+        n, letter = divmod(n - 1, 26)
+        code = chr(ord("A") + letter) + code
+    return code
+
+
+def seed(app, args):
+    scale = dict(SCALES[args.scale])
+    for key in scale:
+        if getattr(args, key) is not None:
+            scale[key] = getattr(args, key)
+    runner = app.test_cli_runner()
+    commands = [
+        ["db", "drop"],
+        ["db", "create"],
+        ["db", "seed", "--sports", scale["sports"], "--leagues-per-sport", scale["leagues_per_sport"],
+         "--teams-per-league", scale["teams_per_league"], "--users", scale["users"],
+         "--rounds", scale["rounds"], "--seed", 1],
+    ]
+    for command in commands:
+        result = runner.invoke(args=[str(arg) for arg in command])
+        if result.exit_code:
+            raise SystemExit(f"flask {' '.join(map(str, command))} failed:\n{result.output}{result.exception}")
+    return scale
+
+
+# spare_rows adds the rows that the write routes change or use up, so
+# that no route eats into the seeded data another one reads. Each of
+# the delete and commit routes gets --spare-rows rows and stops early
+# if it runs out.
+def spare_rows(db, email, count):
+    from models.league import League
+    from models.match import Match
+    from models.sport import Sport
+    from models.team import Team
+    from models.user import User
+
+    def insert(model, rows):
+        return db.session.scalars(db.insert(model).returning(model.id, sort_by_parameter_order=True), rows).all()
+
+    admin = db.session.scalar(db.select(User).where(User.email == email))
+    if not admin:
+        raise SystemExit(f"No user {email} in the seeded database")
+    team = db.session.get(Team, admin.team_id)
+    # The league with the most matches, for the fixtures and standings
+    league = db.session.scalar(
+        db.select(Match.league).group_by(Match.league).order_by(db.func.count().desc()).limit(1)) or team.league
+
+    sport, other_sport = insert(Sport, [{"name": "Bench Sport", "max_players": 12},
+                                        {"name": "Spare Sport", "max_players": 12}])
+    season = {"start_date": datetime(2024, 1, 1).date(), "end_date": datetime(2024, 12, 31).date()}
+    fixtures_league, commit_league = insert(League, [{"name": "Bench Fixtures", "sport": sport, **season},
+                                                     {"name": "Bench Commit", "sport": sport, **season}])
+    insert(Team, [{"team_name": f"Fixture {letters(n)}", "league": fixtures_league} for n in range(12)])
+    bulk_teams = insert(Team, [{"team_name": f"Bulk {letters(n)}"} for n in range(20)])
+    # The players for the build route are the only available ones
+    users = [{"first": "Spare", "last": "User", "email": f"spare{n}@bench.example", "password": admin.password,
+              "available": n >= count * 3 + 20, "skill": n % 10, "team_id": None}
+             for n in range(count * 3 + 20 + BUILD_PLAYERS)]
+    user_ids = insert(User, users)
+    pools = {
+        "delete_teams": insert(Team, [{"team_name": f"Spare {letters(n)}"} for n in range(count)]),
+        "delete_sports": insert(Sport, [{"name": f"Spare {letters(n)}", "max_players": 12} for n in range(count)]),
+        "delete_leagues": insert(League, [{"name": f"Spare {letters(n)}", "sport": other_sport, **season}
+                                          for n in range(count)]),
+        "delete_users": user_ids[:count],
+        "commit_players": user_ids[count:count * 3],
+    }
+    db.session.commit()
+    return {
+        "admin": admin.id,
+        "team": team.id,
+        "team_name": team.team_name,
+        "league": league,
+        "sport": db.session.get(League, league).sport,
+        "bench_sport": sport,
+        "other_sport": other_sport,
+        "fixtures_league": fixtures_league,
+        "commit_league": commit_league,
+        "bulk_teams": [[id, f"Bulk {letters(n)}"] for n, id in enumerate(bulk_teams)],
+        "bulk_users": user_ids[count * 3:count * 3 + 20],
+        **pools,
+    }
+
+
+def pooled(pool, request):
+    return lambda n: request(pool[n]) if n < len(pool) else None
+
+
+# scenarios lists a request for every route, in the order they run:
+# reads first, then writes, then deletes. Each request function is
+# given the number of the request and returns its method, path and
+# body, or None once the route's spare rows have run out.
+def scenarios(ids, email, password):
+    players = ids["commit_players"]
+    season = {"start_date": "2024-01-01", "end_date": "2024-12-31"}
+    return [
+        ("users.captains", "GET /users/captains", lambda n: ("GET", "/users/captains", None)),
+        ("users.free_agents", "GET /users/freeagents", lambda n: ("GET", "/users/freeagents", None)),
+        ("teams.all_teams", "GET /teams/", lambda n: ("GET", "/teams/", None)),
+        ("teams.one_team", "GET /teams/<id>", lambda n: ("GET", f"/teams/{ids['team']}", None)),
+        ("leagues.get_league", "GET /leagues/<id>", lambda n: ("GET", f"/leagues/{ids['league']}", None)),
+        ("leagues.get_standings", "GET /leagues/<id>/standings",
+         lambda n: ("GET", f"/leagues/{ids['league']}/standings", None)),
+        ("leagues.get_fixtures", "GET /leagues/<id>/fixtures",
+         lambda n: ("GET", f"/leagues/{ids['league']}/fixtures", None)),
+        ("sports.get_sport", "GET /sports/<id>", lambda n: ("GET", f"/sports/{ids['sport']}", None)),
+        ("leagues.build_teams", "POST /leagues/<id>/build",
+         lambda n: ("POST", f"/leagues/{ids['fixtures_league']}/build", {"seed": 1})),
+        ("users.login", "POST /users/login",
+         lambda n: ("POST", "/users/login", {"email": email, "password": password})),
+        ("users.register_user", "POST /users/register",
+         lambda n: ("POST", "/users/register", {"first": "Bench", "last": "User", "email": f"register{n}@bench.example",
+                                                "password": "Password123!"})),
+        ("users.update_user", "PATCH /users/<id>",
+         lambda n: ("PATCH", f"/users/{ids['admin']}", {"bio": f"Benchmark {n}"})),
+        ("users.bulk_update_users", "PATCH /users/bulk",
+         lambda n: ("PATCH", "/users/bulk", [{"id": id, "available": n % 2 == 0} for id in ids["bulk_users"]])),
+        ("teams.register_team", "POST /teams/",
+         lambda n: ("POST", "/teams/", {"team_name": f"Bench {letters(n)}"})),
+        ("teams.update_team", "PATCH /teams/<id>",
+         lambda n: ("PATCH", f"/teams/{ids['team']}", {"team_name": ids["team_name"]})),
+        ("teams.bulk_update_teams", "PATCH /teams/bulk",
+         lambda n: ("PATCH", "/teams/bulk", [{"id": id, "team_name": name} for id, name in ids["bulk_teams"]])),
+        ("leagues.register_league", "POST /leagues/",
+         lambda n: ("POST", "/leagues/", {"name": f"Bench {letters(n)}", "sport": ids["other_sport"], **season})),
+        ("leagues.update_league", "PATCH /leagues/<id>",
+         lambda n: ("PATCH", f"/leagues/{ids['fixtures_league']}", {"name": "Bench Fixtures", **season})),
+        ("leagues.generate_season", "POST /leagues/<id>/fixtures",
+         lambda n: ("POST", f"/leagues/{ids['fixtures_league']}/fixtures", {"replace": True})),
+        ("sports.generate_seasons", "POST /sports/<id>/fixtures",
+         lambda n: ("POST", f"/sports/{ids['bench_sport']}/fixtures", {"replace": True})),
+        ("leagues.commit_teams", "POST /leagues/<id>/build/commit",
+         lambda n: ("POST", f"/leagues/{ids['commit_league']}/build/commit",
+                    {"teams": [{"team_name": f"Built {letters(n)}", "players": players[2 * n:2 * n + 2]}]})
+         if 2 * n + 2 <= len(players) else None),
+        ("sports.register_sport", "POST /sports/",
+         lambda n: ("POST", "/sports/", {"name": f"Bench {letters(n)}", "max_players": 12})),
+        ("sports.update_sport", "PATCH /sports/<id>",
+         lambda n: ("PATCH", f"/sports/{ids['bench_sport']}", {"name": "Bench Sport", "max_players": 12})),
+        ("users.delete_user", "DELETE /users/<id>",
+         pooled(ids["delete_users"], lambda id: ("DELETE", f"/users/{id}", None))),
+        ("teams.delete_team", "DELETE /teams/<id>",
+         pooled(ids["delete_teams"], lambda id: ("DELETE", f"/teams/{id}", None))),
+        ("leagues.delete_league", "DELETE /leagues/<id>",
+         pooled(ids["delete_leagues"], lambda id: ("DELETE", f"/leagues/{id}", None))),
+        ("sports.delete_sport", "DELETE /sports/<id>",
+         pooled(ids["delete_sports"], lambda id: ("DELETE", f"/sports/{id}", None))),
+    ]
+
+
+# unbenchmarked names the routes of the four blueprints that have no
+# scenario, so a new route can't be left out of the baselines unseen.
+def unbenchmarked(app, endpoints):
+    return sorted(
+        rule.endpoint for rule in app.url_map.iter_rules()
+        if rule.endpoint.split(".")[0] in BLUEPRINTS and rule.endpoint not in endpoints
+    )
+
+
+# client sends the route's requests on one kept-alive connection until
+# the deadline or until the requests run out. A response is an error
+# if its status is 400 or more or its body is {"error": ...}, as some
+# routes return errors with a 200. A 412 is counted as a conflict
+# instead: the write routes' clients all update the same rows, and
+# concurrent updates of a row fail by design (see etags.py).
+def client(port, token, request, counter, deadline, results):
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+    while time.monotonic() < deadline:
+        planned = request(next(counter))
+        if planned is None:
+            break
+        method, path, body = planned
+        body = json.dumps(body) if body is not None else None
+        start = time.perf_counter()
+        try:
+            connection.request(method, path, body, headers)
+            response = connection.getresponse()
+            content = response.read()
+        except (OSError, http.client.HTTPException):
+            results["errors"].append("connection")
+            connection.close()
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+            continue
+        results["latencies"].append(time.perf_counter() - start)
+        if response.status == 412:
+            results["conflicts"].append(response.status)
+        elif response.status >= 400 or content.startswith(b'{"error"'):
+            results["errors"].append(response.status)
+        if response.getheader("X-Query-Count") is not None:
+            results["queries"].append(int(response.getheader("X-Query-Count")))
+    connection.close()
+
+
+def drive(port, token, request, concurrency, duration, counter):
+    results = {"latencies": [], "errors": [], "conflicts": [], "queries": []}
+    deadline = time.monotonic() + duration
+    clients = [
+        threading.Thread(target=client, args=(port, token, request, counter, deadline, results))
+        for _ in range(concurrency)
+    ]
+    started = time.monotonic()
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    return results, time.monotonic() - started
+
+
+def measure(port, token, request, args):
+    counter = itertools.count()
+    if args.warmup:
+        drive(port, token, request, args.concurrency, args.warmup, counter)
+    results, elapsed = drive(port, token, request, args.concurrency, args.duration, counter)
+    latencies, queries = results["latencies"], results["queries"]
+    return {
+        "requests": len(latencies),
+        "errors": len(results["errors"]),
+        "conflicts": len(results["conflicts"]),
+        "requests_per_sec": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "queries_per_request": round(sum(queries) / len(queries), 2) if queries else None,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=SRC, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    db_uri = args.db_uri
+    os.environ["DB_URI"] = db_uri
+    os.environ.setdefault("JWT_KEY", "benchmark")
+    sys.path.insert(0, SRC)
+    from app import app
+    from setup import db
+
+    print(f"Seeding {db_uri} at {args.scale} scale", file=sys.stderr)
+    scale = seed(app, args)
+    with app.app_context():
+        ids = spare_rows(db, args.email, args.spare_rows)
+        db.engine.dispose()
+    routes = scenarios(ids, args.email, args.password)
+    if args.route:
+        routes = [route for route in routes if route[0] in args.route or route[1] in args.route]
+    missing = unbenchmarked(app, {route[0] for route in routes})
+    if missing and not args.route:
+        print(f"Routes without a benchmark: {', '.join(missing)}", file=sys.stderr)
+
+    try:
+        socket.create_connection(("127.0.0.1", args.port), timeout=1).close()
+        raise SystemExit(f"Port {args.port} is already in use")
+    except OSError:
+        pass
+    env = dict(os.environ, SQL_PROFILE="true")
+    output = None if args.server_logs else subprocess.DEVNULL
+    server = start_server(server_command(args.mode, args.port, args.threads), output, env)
+    results = {}
+    try:
+        wait_for_port(args.port)
+        token = login(args.port, args.email, args.password)
+        for endpoint, name, request in routes:
+            print(f"{name} ...", file=sys.stderr)
+            results[name] = {"endpoint": endpoint, **measure(args.port, token, request, args)}
+    finally:
+        stop_server(server)
+
+    return {
+        "meta": {
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "database": db_uri.split(":", 1)[0],
+            "scale": args.scale,
+            "seed": scale,
+            "mode": args.mode,
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "threads": args.threads,
+        },
+        "routes": results,
+    }
+
+
+def print_results(results):
+    print(f"{'route':<34}{'requests':>9}{'errors':>8}{'conflicts':>10}{'req/s':>9}{'p50 ms':>9}"
+          f"{'p95 ms':>9}{'p99 ms':>9}{'queries':>9}")
+    for name, route in results["routes"].items():
+        queries = route["queries_per_request"]
+        print(f"{name:<34}{route['requests']:>9}{route['errors']:>8}{route.get('conflicts', 0):>10}"
+              f"{route['requests_per_sec']:>9}"
+              f"{route['p50_ms']:>9}{route['p95_ms']:>9}{route['p99_ms']:>9}"
+              f"{'-' if queries is None else queries:>9}")
+
+
+# regressions compares one route's results with its baseline and
+# returns a line for each way it got worse.
+def regressions(baseline, current, threshold, min_ms):
+    found = []
+    for key in ("p95_ms", "p99_ms"):
+        before, after = baseline[key], current[key]
+        if after > max(before, min_ms) * (1 + threshold):
+            found.append(f"{key} {before} -> {after}")
+    before, after = baseline["requests_per_sec"], current["requests_per_sec"]
+    if after < before * (1 - threshold):
+        found.append(f"requests_per_sec {before} -> {after}")
+    before, after = baseline["queries_per_request"], current["queries_per_request"]
+    if before is not None and after is not None and after > before + 0.5:
+        found.append(f"queries_per_request {before} -> {after}")
+    before, after = baseline["errors"], current["errors"]
+    if after > before:
+        found.append(f"errors {before} -> {after}")
+    return found
+
+
+def compare(args):
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    with open(args.current) as file:
+        current = json.load(file)
+    for key in ("database", "scale", "seed", "mode", "concurrency", "threads"):
+        if baseline["meta"].get(key) != current["meta"].get(key):
+            print(f"Warning: {key} differs: {baseline['meta'].get(key)} -> {current['meta'].get(key)}")
+
+    failed = False
+    for name, route in current["routes"].items():
+        if name not in baseline["routes"]:
+            print(f"NEW   {name}")
+            continue
+        found = regressions(baseline["routes"][name], route, args.threshold, args.min_ms)
+        if found:
+            failed = True
+            print(f"WORSE {name}: {'; '.join(found)}")
+    for name in baseline["routes"]:
+        if name not in current["routes"]:
+            print(f"GONE  {name}")
+    if not failed:
+        print(f"No regressions beyond {args.threshold:.0%}")
+    return 1 if failed else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the API's routes and compare baselines")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Seed a database and benchmark every route")
+    run_parser.add_argument("--db-uri", required=True, help="Scratch database to seed, which is dropped first")
+    run_parser.add_argument("--scale", choices=SCALES, default="small")
+    run_parser.add_argument("--sports", type=int, help="Override the scale's generated sports")
+    run_parser.add_argument("--leagues-per-sport", type=int, help="Override the scale's leagues per sport")
+    run_parser.add_argument("--teams-per-league", type=int, help="Override the scale's teams per league")
+    run_parser.add_argument("--users", type=int, help="Override the scale's generated users")
+    run_parser.add_argument("--rounds", type=int, help="Override the scale's rounds of results")
+    run_parser.add_argument("--spare-rows", type=int, default=2000,
+                            help="Rows made for each route that deletes or moves them")
+    run_parser.add_argument("--route", action="append",
+                            help="Only run this route, by endpoint or name (e.g. teams.one_team), may be repeated")
+    run_parser.add_argument("--mode", choices=["wsgi", "asgi"], default="wsgi")
+    run_parser.add_argument("--concurrency", type=int, default=8)
+    run_parser.add_argument("--duration", type=float, default=5, help="Seconds each route is measured")
+    run_parser.add_argument("--warmup", type=float, default=1, help="Seconds each route runs before measuring")
+    run_parser.add_argument("--threads", type=int, default=8, help="WSGI server threads")
+    run_parser.add_argument("--port", type=int, default=5570)
+    run_parser.add_argument("--email", default="admin@email.com")
+    run_parser.add_argument("--password", default="Password123!")
+    run_parser.add_argument("--output", help="Write the results to this JSON file")
+    run_parser.add_argument("--server-logs", action="store_true", help="Show the server's output")
+
+    compare_parser = commands.add_parser("compare", help="Compare results with a baseline")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.10,
+                                help="Fraction a latency or throughput may worsen by (default: 0.10)")
+    compare_parser.add_argument("--min-ms", type=float, default=MIN_MS,
+                                help="Latencies below this are never regressions")
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        sys.exit(compare(args))
+    results = run(args)
+    print_results(results)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+            file.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+import argparse
+import http.client
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+
+# serving.py compares the WSGI and ASGI modes of the app. It starts
+# the server in each mode against the database in DB_URI (seed it
+# first with "flask db seed"), logs in, then has --concurrency
+# clients request each path back to back for --duration seconds and
+# reports requests per second and latency percentiles. --delay holds
+# every connection open for a while before each request, standing in
+# for slow mobile clients.
+#
+#   python benchmarks/serving.py --concurrency 64 --duration 10
+#
+# WSGI mode uses gunicorn with --threads if it is installed and the
+# Werkzeug development server otherwise; ASGI mode uses uvicorn.
+SRC = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PATHS = ["/teams/", "/teams/2", "/leagues/1", "/sports/1", "/users/captains"]
+
+
+def server_command(mode, port, threads):
+    if mode == "asgi":
+        return [sys.executable, "-m", "uvicorn", "asgi:application", "--port", str(port),
+                "--log-level", "warning", "--no-access-log"]
+    try:
+        import gunicorn  # noqa: F401
+        return [sys.executable, "-m", "gunicorn", "app:app", "--bind", f"127.0.0.1:{port}",
+                "--workers", "1", "--threads", str(threads), "--log-level", "warning"]
+    except ImportError:
+        return [sys.executable, "-m", "flask", "run", "--port", str(port), "--with-threads", "--no-reload"]
+
+
+# start_server runs the server in a session of its own, so that
+# stop_server stops it together with the processes it forked, such
+# as the password hashing workers. Those would otherwise outlive it
+# and keep its port open.
+def start_server(command, output, env=None):
+    return subprocess.Popen(command, cwd=SRC, env=env or dict(os.environ), stdout=output, stderr=output,
+                            start_new_session=True)
+
+
+def stop_server(server):
+    try:
+        os.killpg(server.pid, signal.SIGTERM)
+    except ProcessLookupError:
+        pass
+    server.wait()
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise SystemExit(f"Server didn't start on port {port}")
+
+
+def login(port, email, password):
+    connection = http.client.HTTPConnection("127.0.0.1", port)
+    connection.request("POST", "/users/login", json.dumps({"email": email, "password": password}),
+                       {"Content-Type": "application/json"})
+    response = connection.getresponse()
+    body = json.loads(response.read())
+    if "token" not in body:
+        raise SystemExit(f"Login failed: {body}")
+    return body["token"]
+
+
+# client keeps one connection open and requests the paths in turn
+# until the deadline, recording the latency of every request.
+def client(port, token, paths, deadline, delay, latencies, errors):
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    headers = {"Authorization": f"Bearer {token}"}
+    n = 0
+    while time.monotonic() < deadline:
+        path = paths[n % len(paths)]
+        n += 1
+        if delay:
+            time.sleep(delay)
+        start = time.perf_counter()
+        try:
+            connection.request("GET", path, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            if response.status >= 400:
+                errors.append(response.status)
+        except (OSError, http.client.HTTPException):
+            errors.append("connection")
+            connection.close()
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+            continue
+        latencies.append(time.perf_counter() - start)
+    connection.close()
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def run(mode, args):
+    port = args.port + (1 if mode == "asgi" else 0)
+    output = None if args.server_logs else subprocess.DEVNULL
+    server = start_server(server_command(mode, port, args.threads), output)
+    try:
+        wait_for_port(port)
+        token = login(port, args.email, args.password)
+        latencies, errors = [], []
+        deadline = time.monotonic() + args.duration
+        clients = [
+            threading.Thread(target=client, args=(port, token, PATHS if not args.path else args.path,
+                                                  deadline, args.delay, latencies, errors))
+            for _ in range(args.concurrency)
+        ]
+        started = time.monotonic()
+        for thread in clients:
+            thread.start()
+        for thread in clients:
+            thread.join()
+        elapsed = time.monotonic() - started
+    finally:
+        stop_server(server)
+    return {
+        "mode": mode,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "requests_per_sec": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare WSGI and ASGI serving")
+    parser.add_argument("--mode", action="append", choices=["wsgi", "asgi"],
+                        help="Mode to run, may be repeated (default: both)")
+    parser.add_argument("--path", action="append", help="Path to request, may be repeated")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--delay", type=float, default=0, help="Seconds each client idles between requests")
+    parser.add_argument("--threads", type=int, default=8, help="WSGI server threads")
+    parser.add_argument("--port", type=int, default=5560)
+    parser.add_argument("--email", default="admin@email.com")
+    parser.add_argument("--password", default="Password123!")
+    parser.add_argument("--server-logs", action="store_true", help="Show the servers' output")
+    args = parser.parse_args()
+
+    results = [run(mode, args) for mode in args.mode or ["wsgi", "asgi"]]
+    print(f"{'mode':<6}{'requests':>10}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    for result in results:
+        print(f"{result['mode']:<6}{result['requests']:>10}{result['errors']:>8}"
+              f"{result['requests_per_sec']:>10}{result['p50_ms']:>10}{result['p99_ms']:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+from flask import Blueprint, current_app, request
+from flask_jwt_extended import jwt_required
+from setup import db
+from auth import admin_required
+from pooling import pool_stats
+from routing import replica_keys
+from profiling import report
+
+
+# The admin blueprint, under "/admin", holds operational endpoints
+# that are only useful to whoever runs the server.
+admin_bp = Blueprint("admin", __name__, url_prefix="/admin")
+
+
+# get_pool reports this worker process's connection pool: its size,
+# connections in use and in overflow, and how many checkouts there
+# have been and how long they waited. Every worker has its own pool,
+# so compare a few workers before resizing. Each read replica has
+# its own pool, listed under "replicas".
+@admin_bp.route("/pool")
+@jwt_required()
+def get_pool():
+    admin_required()
+    replicas = {key: pool_stats(db.engines[key]) for key in replica_keys(db.engines)}
+    return {"pool": pool_stats(db.engine), "replicas": replicas}
+
+
+# get_profile returns the per-route query report collected while
+# SQL_PROFILE is on, see profiling.py. DELETE starts a new one.
+@admin_bp.route("/profile", methods=["GET", "DELETE"])
+@jwt_required()
+def get_profile():
+    admin_required()
+    if request.method == "DELETE":
+        report.clear()
+        return {}, 200
+    return {"profiling": current_app.config["SQL_PROFILE"], "routes": report.as_dict()}
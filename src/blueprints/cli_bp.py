@@ -1,9 +1,26 @@
 from models.user import User
-from models.team import Team 
+from models.team import Team, FREE_AGENTS_TEAM_ID
 from models.sport import Sport
 from models.league import League 
 from setup import db, bcrypt
-from flask import Blueprint 
+from seeding import generate, generate_results
+from serializers import registered
+from models.version import Version
+from models.migration import Migration
+from models.match import Match, Result
+from ledger import recompute
+from rosters import RECOUNT
+from etags import bump, team_keys
+from datetime import date
+import random
+import migrate
+import query_plans
+import profiling
+import json
+from auth import token_claims
+from flask import Blueprint, current_app
+from flask_jwt_extended import create_access_token
+import click
 
 # Here Blueprint is defined 
 db_commands = Blueprint("db", __name__)
@@ -12,8 +29,21 @@ db_commands = Blueprint("db", __name__)
 # with predefined data, enhancing development efficiency by 
 # providing a consistent initial data state for testing and 
 # development purposes.
+# The options add generated data on top of the predefined rows for
+# capacity testing, e.g.
+# flask db seed --sports 10 --leagues-per-sport 20 --teams-per-league 12 --users 1000000 --rounds 10
+# The same --seed always produces the same data. The password is
+# hashed once and everything is written in a single transaction.
 @db_commands.cli.command("seed")
-def db_seed():
+@click.option("--sports", "sport_count", default=0, help="Number of sports to generate.")
+@click.option("--leagues-per-sport", default=0, help="Leagues generated for each sport.")
+@click.option("--teams-per-league", default=0, help="Teams generated for each league.")
+@click.option("--users", "user_count", default=0, help="Number of users to generate.")
+@click.option("--rounds", default=0, help="Rounds of results played in each generated league.")
+@click.option("--seed", default=0, help="Random seed for the generated data.")
+def db_seed(sport_count, leagues_per_sport, teams_per_league, user_count, rounds, seed):
+    password = bcrypt.generate_password_hash("Password123!").decode("utf8")
+
     sports = [
         Sport(
             name="Touch Football",
@@ -49,158 +79,129 @@ def db_seed():
         )
     ]
     db.session.add_all(sports)
-    db.session.commit()
+    db.session.flush()
 
     leagues = [
         League(
             name="A",
-            start_date="2024-01-11",
-            end_date="2024-04-04",
+            start_date=date(2024, 1, 11),
+            end_date=date(2024, 4, 4),
             sport=sports[0].id,
         ),
         League(
             name="B",
-            start_date="2024-01-11",
-            end_date="2024-04-04",
+            start_date=date(2024, 1, 11),
+            end_date=date(2024, 4, 4),
             sport=sports[0].id,
         ),
         League(
             name="C",
-            start_date="2024-01-11",
-            end_date="2024-04-04",
+            start_date=date(2024, 1, 11),
+            end_date=date(2024, 4, 4),
             sport=sports[0].id,
         ),
         League(
             name="D",
-            start_date="2024-01-11",
-            end_date="2024-04-04",
+            start_date=date(2024, 1, 11),
+            end_date=date(2024, 4, 4),
             sport=sports[0].id,
         ),
         League(
             name="E",
-            start_date="2024-01-11",
-            end_date="2024-04-04",
+            start_date=date(2024, 1, 11),
+            end_date=date(2024, 4, 4),
             sport=sports[0].id,
         ),
         League(
             name="F",
-            start_date="2024-01-11",
-            end_date="2024-04-04",
+            start_date=date(2024, 1, 11),
+            end_date=date(2024, 4, 4),
             sport=sports[0].id,
         ),
         League(
             name="A",
-            start_date="2024-01-11",
-            end_date="2024-04-04",
+            start_date=date(2024, 1, 11),
+            end_date=date(2024, 4, 4),
             sport=sports[1].id,
         ),
         League(
             name="B",
-            start_date="2024-01-11",
-            end_date="2024-04-04",
+            start_date=date(2024, 1, 11),
+            end_date=date(2024, 4, 4),
             sport=sports[1].id,
         ),
         League(
             name="C",
-            start_date="2024-01-11",
-            end_date="2024-04-04",
+            start_date=date(2024, 1, 11),
+            end_date=date(2024, 4, 4),
             sport=sports[1].id,
         ),
         League(
             name="D",
-            start_date="2024-01-11",
-            end_date="2024-04-04",
+            start_date=date(2024, 1, 11),
+            end_date=date(2024, 4, 4),
             sport=sports[1].id,
         ),
         League(
             name="E",
-            start_date="2024-01-11",
-            end_date="2024-04-04",
+            start_date=date(2024, 1, 11),
+            end_date=date(2024, 4, 4),
             sport=sports[1].id,
         ),
         League(
             name="F",
-            start_date="2024-01-11",
-            end_date="2024-04-04",
+            start_date=date(2024, 1, 11),
+            end_date=date(2024, 4, 4),
             sport=sports[1].id,
         )
     ]
     db.session.add_all(leagues)
-    db.session.commit()
+    db.session.flush()
 
     teams = [
         Team(
             team_name="Free Agents",
-            points=0,
             league=leagues[0].id,
         ),
         Team(
             team_name="Get Plastered",
-            points=10,
-            win=5,
-            loss=1,
-            draw=0,
             league=leagues[0].id,
         ),
         Team(
             team_name="Bandits",
-            points=4,
-            win=2,
-            loss=3,
-            draw=0,
             league=leagues[0].id,
         ),
         Team(
             team_name="Potato Heads",
-            points=7,
-            win=3,
-            loss=1,
-            draw=1,
             league=leagues[0].id,
         ),
         Team(
             team_name="Deep Fryers",
-            points=2,
-            win=1,
-            loss=4,
-            draw=0,
             league=leagues[0].id,
         ),
         Team(
             team_name="The Gurus",
-            points=9,
-            win=4,
-            loss=1,
-            draw=1,
             league=leagues[0].id,
         ),
         Team(
             team_name="Side Steppers",
-            points=6,
-            win=3,
-            loss=2,
-            draw=0,
             league=leagues[0].id,
         ),
         Team(
             team_name="Flying X",
-            points=1,
-            win=0,
-            loss=5,
-            draw=1,
             league=leagues[0].id,
         ),
         Team(
             team_name="Ducks",
-            points=11,
-            win=5,
-            loss=0,
-            draw=1,
             league=leagues[0].id,
         ),
     ]
     db.session.add_all(teams)
-    db.session.commit()
+    db.session.flush()
+
+    # The demo league's table comes from five rounds of results
+    generate_results([(leagues[0].id, date(2024, 1, 11), [team.id for team in teams[1:]])],
+                     5, random.Random(seed))
 
     users = [
         User(
@@ -208,9 +209,9 @@ def db_seed():
             captain=True,
             first="John",
             last="Johnson",
-            dob="1986-08-12",
+            dob=date(1986, 8, 12),
             email="admin@email.com",
-            password=bcrypt.generate_password_hash("Password123!").decode("utf8"),
+            password=password,
             bio="Hi, I've been playing touch football for about 10 years. I play middle.",
             available=True,
             phone=123456789,
@@ -221,9 +222,9 @@ def db_seed():
             captain=True,
             first="Jasper",
             last="Fez",
-            dob="1989-02-03",
+            dob=date(1989, 2, 3),
             email="feral@email.com",
-            password=bcrypt.generate_password_hash("Password123!").decode("utf8"),
+            password=password,
             bio="Let me at 'em.",
             available=True,
             phone=33333333,
@@ -235,7 +236,7 @@ def db_seed():
             first="Gary",
             last="Smith",
             email="smith@email.com",
-            password=bcrypt.generate_password_hash("Password123!").decode("utf8"),
+            password=password,
             bio="I usually play on the wing. Not very experienced.",
             available=False,
             phone=87336762,
@@ -245,7 +246,7 @@ def db_seed():
             first="May",
             last="Pham",
             email="pham@email.com",
-            password=bcrypt.generate_password_hash("Password123!").decode("utf8"),
+            password=password,
             bio="Hi! Excited to meet everyone! Here to have fun and make friends.",
             available=False,
             phone=23398343,
@@ -254,12 +255,13 @@ def db_seed():
         User(
             first="Steven",
             last="Williams",
-            dob="1996-04-06",
+            dob=date(1996, 4, 6),
             email="steve@email.com",
-            password=bcrypt.generate_password_hash("Password123!").decode("utf8"),
+            password=password,
             bio="Where's the beers at?",
             available=True,
             phone=51678723,
+            skill=6.5,
             team_id=teams[0].id,
         ),
         User(
@@ -267,9 +269,9 @@ def db_seed():
             captain=False,
             first="John",
             last="Phillips",
-            dob="1983-02-04",
+            dob=date(1983, 2, 4),
             email="admin2@email.com",
-            password=bcrypt.generate_password_hash("Password123!").decode("utf8"),
+            password=password,
             bio="Hi, I've been playing touch football on and off for 4 years.",
             available=True,
             phone=12346790,
@@ -280,9 +282,9 @@ def db_seed():
             captain=False,
             first="Darren",
             last="Williams",
-            dob="2003-02-09",
+            dob=date(2003, 2, 9),
             email="daren@email.com",
-            password=bcrypt.generate_password_hash("Password123!").decode("utf8"),
+            password=password,
             bio="Here to meet new people",
             available=True,
             phone=33344433,
@@ -294,7 +296,7 @@ def db_seed():
             first="Sarah",
             last="Highland",
             email="sarah@email.com",
-            password=bcrypt.generate_password_hash("Password123!").decode("utf8"),
+            password=password,
             bio="I usually play on the wing. Not very experienced.",
             available=True,
             phone=87333322,
@@ -304,7 +306,7 @@ def db_seed():
             first="Sam",
             last="Taylor",
             email="sam@email.com",
-            password=bcrypt.generate_password_hash("Password123!").decode("utf8"),
+            password=password,
             bio="Hi everyone! Here to make friends.",
             available=False,
             phone=23399843,
@@ -313,16 +315,27 @@ def db_seed():
         User(
             first="Katherine",
             last="Platz",
-            dob="1999-04-12",
+            dob=date(1999, 4, 12),
             email="kath@email.com",
-            password=bcrypt.generate_password_hash("Password123!").decode("utf8"),
+            password=password,
             bio="Looking to make new friends.",
             available=True,
             phone=51647873,
+            skill=4.0,
             team_id=teams[0].id,
         ),
     ]
     db.session.add_all(users)
+    db.session.flush()
+
+    if sport_count or leagues_per_sport or teams_per_league or user_count:
+        counts = generate(sport_count, leagues_per_sport, teams_per_league, user_count, seed, password, rounds)
+        print(f"Generated {counts['sports']} sports, {counts['leagues']} leagues, "
+              f"{counts['teams']} teams, {counts['users']} users and {counts['results']} results")
+
+    # The users are inserted with their teams already set, so every
+    # team's roster_size is counted once at the end.
+    db.session.execute(RECOUNT)
     db.session.commit()
 
     print("Database Seeded")
@@ -339,7 +352,159 @@ def db_drop():
 # db_create() initializes the database by creating tables 
 # from SQLAlchemy models and prints a confirmation message, 
 # streamlining database setup in Flask applications.
+# The tables already match the latest migration, so every migration
+# is recorded as applied.
 @db_commands.cli.command("create")
 def db_create():
     db.create_all()
+    migrate.stamp()
     print("Created Tables")
+
+
+# db_upgrade applies the pending schema migrations in migrations/,
+# or those up to and including REVISION.
+@db_commands.cli.command("upgrade")
+@click.argument("revision", required=False)
+def db_upgrade(revision):
+    ran = migrate.upgrade(revision)
+    for migration in ran:
+        print(f"Applied {migration.revision}: {migration.description}")
+    print("Database is up to date" if not ran else f"Applied {len(ran)} migration(s)")
+
+
+# db_downgrade reverts the latest migration, every migration after
+# REVISION, or all of them with "base".
+@db_commands.cli.command("downgrade")
+@click.argument("revision", required=False)
+def db_downgrade(revision):
+    try:
+        reverted = migrate.downgrade(revision)
+    except ValueError as err:
+        raise click.BadParameter(str(err))
+    for migration in reverted:
+        print(f"Reverted {migration.revision}: {migration.description}")
+
+
+# db_explain runs EXPLAIN on the queries behind each endpoint and
+# fails if any of them scans a whole table larger than --min-rows.
+# Run it against a seeded database after changing queries or indexes.
+@db_commands.cli.command("explain")
+@click.option("--min-rows", default=10000, help="Only report scans of tables larger than this.")
+def db_explain(min_rows):
+    problems = query_plans.check(min_rows)
+    for endpoint, table_name, rows in problems:
+        print(f"{endpoint}: sequential scan on {table_name} ({rows} rows)")
+    if problems:
+        raise SystemExit(f"{len(problems)} query plan(s) scan large tables")
+    print("No sequential scans on large tables")
+
+
+# check_serializers is a differential test for the compiled
+# serializers. It dumps rows of each model through every registered
+# serializer and through marshmallow, and fails if the JSON differs
+# by a single byte. Run it after changing a schema.
+@db_commands.cli.command("check-serializers")
+@click.option("--rows", default=500, help="Rows of each model to compare.")
+def check_serializers(rows):
+    models = {"User": User, "Team": Team, "League": League, "Sport": Sport}
+    failures = 0
+    for entry in registered():
+        model = models[entry.schema_cls.__name__.replace("Input", "").replace("Schema", "")]
+        objects = db.session.scalars(db.select(model).limit(rows)).all()
+        samples = [objects] if entry.many else objects
+        for sample in samples:
+            expected = json.dumps(entry.schema().dump(sample))
+            actual = json.dumps(entry(sample))
+            if expected != actual:
+                failures += 1
+                print(f"{entry.schema_cls.__name__} only={entry.only} exclude={entry.exclude}:")
+                print(f"  marshmallow: {expected}")
+                print(f"  compiled:    {actual}")
+                break
+    if failures:
+        raise SystemExit(f"{failures} serializer(s) differ from marshmallow")
+    print(f"{len(registered())} serializers match marshmallow")
+
+
+# db_recompute_stats checks every team's points, wins, losses and
+# draws, and every match's score, against the results ledger. The
+# totals are worked out in the database, so it can run over millions
+# of results. --fix overwrites whatever differs with the ledger's
+# values. The fix bumps the teams' leagues, so running servers
+# rebuild their cached standings the next time they're read.
+@db_commands.cli.command("recompute-stats")
+@click.option("--fix", is_flag=True, help="Overwrite statistics that don't match the ledger.")
+def db_recompute_stats(fix):
+    teams_off, matches_off = recompute(fix)
+    for team in teams_off:
+        print(f"Team {team['team_id']}: stored (win, loss, draw, points) {team['stored']}, "
+              f"ledger {team['expected']}")
+    for match_id in matches_off:
+        print(f"Match {match_id}: score doesn't match its latest result")
+    if fix and (teams_off or matches_off):
+        bump("teams", *team_keys(*[team["team_id"] for team in teams_off]))
+        db.session.commit()
+        print(f"Fixed {len(teams_off)} team(s) and {len(matches_off)} match(es)")
+    elif teams_off or matches_off:
+        raise SystemExit(f"{len(teams_off)} team(s) and {len(matches_off)} match(es) differ from the ledger")
+    else:
+        print("Team statistics match the results ledger")
+
+
+# profile_urls lists the read routes "flask db profile" requests,
+# using the first rows of the database for their ids.
+def profile_urls():
+    first = lambda column, *where: db.session.scalar(db.select(db.func.min(column)).where(*where))
+    team = first(Team.id, Team.id != FREE_AGENTS_TEAM_ID)
+    league = first(League.id)
+    sport = first(Sport.id)
+    match = first(Match.id)
+    urls = ["/teams/", "/users/captains", "/users/freeagents"]
+    if team:
+        urls.append(f"/teams/{team}")
+    if league:
+        urls += [f"/leagues/{league}", f"/leagues/{league}/standings", f"/leagues/{league}/fixtures"]
+    if sport:
+        urls.append(f"/sports/{sport}")
+    if match:
+        urls += [f"/matches/{match}", f"/matches/{match}/results"]
+    return urls
+
+
+# db_profile requests each read route as the first admin with
+# SQL_PROFILE on, and prints the per-route query report as JSON, or
+# writes it to --output. Save one per release and diff them to see
+# which routes' queries changed, e.g.
+# flask db profile --output profile-1.4.json
+@db_commands.cli.command("profile")
+@click.option("--output", type=click.Path(dir_okay=False), help="File to write the report to.")
+@click.option("--requests", "repeat", default=3, help="Times each route is requested.")
+def db_profile(output, repeat):
+    admin = db.session.scalar(db.select(User).where(User.admin).order_by(User.id))
+    if not admin:
+        raise SystemExit("An admin user is needed to request the routes")
+    token = create_access_token(identity=admin.email, additional_claims=token_claims(admin))
+    headers = {"Authorization": f"Bearer {token}"}
+    urls = profile_urls()
+    db.session.remove()
+
+    # Each request gets its own app context, and so its own session
+    # and flask.g, as it would in a server.
+    app = current_app._get_current_object()
+    app.config["SQL_PROFILE"] = True
+    profiling.report.clear()
+    client = app.test_client()
+    for url in urls:
+        for _ in range(repeat):
+            with app.app_context():
+                response = client.get(url, headers=headers)
+            if response.status_code >= 400:
+                raise SystemExit(f"GET {url} returned {response.status_code}")
+
+    report = json.dumps(profiling.report.as_dict(), indent=2, sort_keys=True)
+    if output:
+        with open(output, "w") as file:
+            file.write(report + "\n")
+        print(f"Profiled {len(urls)} routes into {output}")
+    else:
+        print(report)
@@ -0,0 +1,86 @@
+import csv
+import io
+import json
+from flask import Blueprint, Response, request, stream_with_context
+from flask_jwt_extended import jwt_required
+from setup import db
+from auth import admin_required
+from models.user import User
+from models.team import Team
+from models.league import League
+
+
+# The export blueprint, under "/export", dumps whole tables for
+# admins as NDJSON (one JSON object per line) or CSV. The rows are
+# read with a server-side cursor, EXPORT_CHUNK at a time, and each
+# chunk is encoded and written to the response before the next is
+# fetched, so an export of ten million users uses the same memory as
+# one of a thousand. Rows are plain column tuples rather than ORM
+# objects, and nothing is ever dumped through a schema.
+export_bp = Blueprint("export", __name__, url_prefix="/export")
+
+EXPORT_CHUNK = 1000
+
+# The columns each export leaves out. Passwords are never exported.
+EXPORTS = {
+    "users": (User, {"password"}),
+    "teams": (Team, set()),
+    "leagues": (League, set()),
+}
+
+
+def json_value(value):
+    return value.isoformat()
+
+
+def ndjson_lines(names, rows):
+    return "".join(
+        json.dumps(dict(zip(names, row)), default=json_value, separators=(",", ":")) + "\n"
+        for row in rows
+    )
+
+
+def csv_lines(rows):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue()
+
+
+FORMATS = {
+    "ndjson": ("application/x-ndjson", lambda names, rows: ndjson_lines(names, rows)),
+    "csv": ("text/csv", lambda names, rows: csv_lines(rows)),
+}
+
+
+# export_rows yields the encoded table one chunk at a time, in id
+# order. yield_per makes the driver stream the result (a named cursor
+# on PostgreSQL) instead of buffering every row first.
+def export_rows(columns, format):
+    names = [column.name for column in columns]
+    encode = FORMATS[format][1]
+    if format == "csv":
+        yield csv_lines([names])
+    stmt = db.select(*columns).order_by(columns[0]).execution_options(yield_per=EXPORT_CHUNK)
+    for rows in db.session.execute(stmt).partitions():
+        yield encode(names, rows)
+
+
+# export_table streams /export/users, /export/teams or
+# /export/leagues as a download, in "?format=ndjson" (the default)
+# or "?format=csv".
+@export_bp.route("/<entity>")
+@jwt_required()
+def export_table(entity):
+    admin_required()
+    if entity not in EXPORTS:
+        return {"error": "Exports are users, teams and leagues"}, 404
+    format = request.args.get("format", "ndjson")
+    if format not in FORMATS:
+        return {"error": "Format must be ndjson or csv"}, 400
+    model, excluded = EXPORTS[entity]
+    columns = [column for column in model.__table__.c if column.name not in excluded]
+    return Response(
+        stream_with_context(export_rows(columns, format)),
+        mimetype=FORMATS[format][0],
+        headers={"Content-Disposition": f"attachment; filename={entity}.{format}"},
+    )
@@ -3,8 +3,20 @@ from setup import db
 from flask import request
 from flask_jwt_extended import jwt_required
 from models.league import League, LeagueSchema, LeagueInputSchema
+from models.match import Match, MatchSchema, FixtureOptionsSchema
 from sqlalchemy.exc import IntegrityError, DataError
+from sqlalchemy.orm import joinedload, selectinload
 from auth import admin_required
+from standings import standings
+from etags import bump, roster_keys, current_etag, not_modified, with_etag, precondition_failed
+from serializers import serializer
+from pagination import paginate
+from fixtures import generate_fixtures, FixtureError
+from models.sport import Sport
+from models.team import Team, TeamBuildOptionsSchema, TeamBuildSchema, FREE_AGENTS_TEAM_ID
+from matching import free_agent_index
+from team_builder import propose, commit, BuildError
+from revocation import deny_list, revoke_users
 
 
 # By defining this Blueprint, all routes and view 
@@ -15,6 +27,22 @@ from auth import admin_required
 leagues_bp = Blueprint("leagues", __name__, url_prefix="/leagues")
 
 
+# LeagueSchema nests the league's sport and its teams. Without a
+# loading plan each of those relationships would be lazy loaded
+# while the schema dumps, one query per relationship. The sport is
+# joined onto the league query and the teams are fetched with a
+# single "SELECT ... WHERE league IN (...)", so get_league always
+# runs two queries however many teams the league has.
+LEAGUE_LOAD_PLAN = (
+    joinedload(League.sport_id),
+    selectinload(League.teams),
+)
+
+
+# get_league dumps through a serializer compiled from LeagueSchema.
+dump_league = serializer(LeagueSchema)
+
+
 # The Register League uses the POST method and is secured 
 # with JWT authentication. It facilitates the registration of a new 
 # league. Admin privileges are required for access. The function 
@@ -40,6 +68,7 @@ def register_league():
         )
 
         db.session.add(league)
+        bump(f"sport:{league.sport}")
         db.session.commit()
 
         return LeagueInputSchema(exclude=["id"]).dump(league), 201
@@ -55,7 +84,8 @@ def register_league():
 # for data and integrity errors, committing changes to the database and 
 # returning updated league information. It's designed for secure data 
 # modification, adhering to RESTful standards and providing clear 
-# user feedback.
+# user feedback. Like PUT /teams/<id>, an If-Match header that isn't
+# the ETag of GET /leagues/<id> gets a 412.
 @leagues_bp.route("/<int:id>", methods=["PUT", "PATCH"])
 @jwt_required()
 def update_league(id):
@@ -65,12 +95,17 @@ def update_league(id):
         stmt = db.select(League).filter_by(id=id)
         league = db.session.scalar(stmt)
         if league:
+            failed = precondition_failed(current_etag(f"league:{id}"))
+            if failed:
+                return failed
+            old_sport = league.sport
             league.name = league_info.get("name", league.name)
             league.start_date = league_info.get("start_date", league.start_date)
             league.end_date = league_info.get("end_date", league.end_date)
             league.sport =league_info.get("sport", league.sport)
+            bump(f"league:{id}", f"sport:{old_sport}", f"sport:{league.sport}")
             db.session.commit()
-            return LeagueInputSchema(exclude=["id", "teams"]).dump(league)
+            return with_etag(LeagueInputSchema(exclude=["id", "teams"]).dump(league), current_etag(f"league:{id}"))
         else:
             return {"error": "League not found"}
     except DataError:
@@ -89,12 +124,14 @@ def update_league(id):
 @leagues_bp.route("/<int:id>", methods=["DELETE"])
 @jwt_required()
 def delete_league(id):
-    admin_required()
+    admin_required(strict=True)
     stmt = db.select(League).filter_by(id=id)
     league = db.session.scalar(stmt)
     if league:
         db.session.delete(league)
+        bump(f"league:{id}", f"sport:{league.sport}")
         db.session.commit()
+        standings.drop_league(id)
         return {}, 200
     else:
         return {"error": "League not found"}
@@ -107,12 +144,127 @@ def delete_league(id):
 # indicating the league was not found. It's designed for straightforward data 
 # retrieval, ensuring secure access and providing clear feedback for both 
 # successful and unsuccessful requests, adhering to RESTful API principles.
+# The response carries an ETag from the "league:<id>" version, which
+# the league, team, sport and roster write routes bump. A client that
+# sends it back in If-None-Match gets a 304 until something changes.
 @leagues_bp.route("/<int:id>")
 @jwt_required()
 def get_league(id):
-    stmt = db.select(League).filter_by(id=id)
+    etag = current_etag(f"league:{id}")
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    stmt = db.select(League).filter_by(id=id).options(*LEAGUE_LOAD_PLAN)
     league = db.session.scalar(stmt)
     if league:
-        return LeagueSchema().dump(league)
+        return with_etag(dump_league(league), etag)
     else:
-        return {"error": "League not found"}, 404
\ No newline at end of file
+        return {"error": "League not found"}, 404
+
+
+# get_standings returns the league ladder: every team ranked by
+# points, then wins, then fewest losses, then name. The table is
+# served from the in-memory standings, which update_team keeps in
+# order as results come in, so polling it doesn't sort anything.
+@leagues_bp.route("/<int:id>/standings")
+@jwt_required()
+def get_standings(id):
+    table = standings.table(id)
+    if table is None:
+        return {"error": "League not found"}, 404
+    return {"league": id, "standings": table}
+
+
+# generate_season creates a round robin season of fixtures for the
+# league between its start and end dates, see fixtures.py. The body
+# is optional and holds the FixtureOptionsSchema settings, e.g.
+# {"legs": 2, "slots_per_night": 4, "blackout_dates": ["2024-04-01"]}.
+# A league that already has fixtures keeps them unless "replace" is
+# sent, and once results are recorded its fixtures can't be replaced.
+# The matches are inserted with one executemany INSERT.
+@leagues_bp.route("/<int:id>/fixtures", methods=["POST"])
+@jwt_required()
+def generate_season(id):
+    admin_required()
+    options = FixtureOptionsSchema().load(request.get_json(silent=True) or {})
+    league = db.session.get(League, id)
+    if not league:
+        return {"error": "League not found"}, 404
+    try:
+        summary = generate_fixtures([league], options)
+    except FixtureError as err:
+        db.session.rollback()
+        return {"error": str(err)}, 409
+    db.session.commit()
+    return summary[0], 201
+
+
+# get_fixtures lists the league's matches in the order they were
+# generated, one page at a time like GET /teams/.
+@leagues_bp.route("/<int:id>/fixtures")
+@jwt_required()
+def get_fixtures(id):
+    if not db.session.get(League, id):
+        return {"error": "League not found"}, 404
+    stmt = db.select(Match).where(Match.league == id)
+    matches, next_cursor = paginate(stmt, Match.id)
+    return {"data": MatchSchema(many=True).dump(matches), "next": next_cursor}
+
+
+# league_team_size returns the league and its sport's max_players, the size
+# of the teams the builder makes.
+def league_team_size(id):
+    row = db.session.execute(
+        db.select(League, Sport.max_players).join(Sport, League.sport == Sport.id).where(League.id == id)
+    ).first()
+    return row if row else (None, None)
+
+
+# build_teams proposes how to split the free agents pool into
+# balanced new teams for the league, see team_builder.py. It changes
+# nothing: the proposal, edited or not, is sent to
+# POST /leagues/<id>/build/commit to create the teams.
+@leagues_bp.route("/<int:id>/build", methods=["POST"])
+@jwt_required()
+def build_teams(id):
+    admin_required()
+    options = TeamBuildOptionsSchema().load(request.get_json(silent=True) or {})
+    league, team_size = league_team_size(id)
+    if not league:
+        return {"error": "League not found"}, 404
+    if not team_size or team_size < 2:
+        return {"error": "The league's sport needs a max_players of at least 2"}, 409
+    try:
+        return propose(league, team_size, options)
+    except BuildError as err:
+        return {"error": str(err)}, 409
+
+
+# commit_teams creates the teams of a build proposal in one
+# transaction and moves their players off the free agents pool. If
+# any player has joined a team since the proposal, nothing changes.
+# The players' tokens carry their old team_id, so they're revoked in
+# the same transaction and the players log in again.
+@leagues_bp.route("/<int:id>/build/commit", methods=["POST"])
+@jwt_required()
+def commit_teams(id):
+    admin_required()
+    teams = TeamBuildSchema().load(request.json)["teams"]
+    league, team_size = league_team_size(id)
+    if not league:
+        return {"error": "League not found"}, 404
+    try:
+        team_ids = commit(league, team_size, teams)
+    except BuildError as err:
+        db.session.rollback()
+        return {"error": str(err)}, 409
+    bump(*roster_keys(FREE_AGENTS_TEAM_ID, *team_ids))
+    revocations = revoke_users([player for team in teams for player in team["players"]])
+    db.session.commit()
+    deny_list.add(*revocations)
+    free_agent_index.invalidate()
+    standings.update(db.session.scalars(db.select(Team).where(Team.id.in_(team_ids))).all())
+    return {"league": id, "teams": [
+        {"id": team_id, "team_name": team["team_name"], "players": team["players"]}
+        for team_id, team in zip(team_ids, teams)
+    ]}, 201
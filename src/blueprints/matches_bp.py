@@ -0,0 +1,135 @@
+from flask import Blueprint, request, abort
+from flask_jwt_extended import jwt_required
+from sqlalchemy.exc import IntegrityError
+from setup import db
+from models.match import Match, Result, MatchSchema, ResultSchema
+from models.team import Team
+from auth import admin_required, current_claims
+from ledger import record_results, StaleResult
+from standings import standings
+from etags import bump, league_keys
+from bulk import load_items, existing, add_error, bulk_result
+
+
+# A url prefix "/matches" is assigned to all routes. Matches are the
+# fixtures of a league, and their scores are recorded through the
+# results ledger in ledger.py, which also keeps the teams' points,
+# wins, losses and draws up to date.
+matches_bp = Blueprint("matches", __name__, url_prefix="/matches")
+
+
+# result_keys returns the version keys of the documents that show
+# the statistics of the teams a result changed.
+def result_keys(deltas):
+    leagues = db.session.scalars(db.select(Team.league).where(Team.id.in_(deltas)))
+    return ["teams", *[f"team:{id}" for id in deltas], *league_keys(*leagues)]
+
+
+# after_results runs once results are committed. The teams' new
+# statistics are read back and moved within the cached standings.
+def after_results(deltas):
+    standings.update(db.session.scalars(db.select(Team).where(Team.id.in_(deltas))).all())
+
+
+# create_match adds a fixture to a league. Both teams must belong to
+# the league. Fixtures for a whole season are generated by the
+# leagues routes instead.
+@matches_bp.route("/", methods=["POST"])
+@jwt_required()
+def create_match():
+    admin_required()
+    match_info = MatchSchema(exclude=["id", "home_score", "away_score"]).load(request.json)
+    if match_info["home_team"] == match_info["away_team"]:
+        return {"error": "A team can't play itself"}, 400
+    leagues = existing(Team.id, [match_info["home_team"], match_info["away_team"]], Team.league)
+    if any(leagues.get(team, (None,))[0] != match_info["league"]
+           for team in (match_info["home_team"], match_info["away_team"])):
+        return {"error": "Both teams must be in the league"}, 400
+    match = Match(**match_info)
+    db.session.add(match)
+    db.session.commit()
+    return MatchSchema().dump(match), 201
+
+
+@matches_bp.route("/<int:id>")
+@jwt_required()
+def get_match(id):
+    match = db.session.get(Match, id)
+    if not match:
+        return {"error": "Match not found"}, 404
+    return MatchSchema().dump(match)
+
+
+# get_results returns the ledger of a match, newest first. The first
+# entry is the current score and the rest are the results it
+# corrected.
+@matches_bp.route("/<int:id>/results")
+@jwt_required()
+def get_results(id):
+    if not db.session.get(Match, id):
+        return {"error": "Match not found"}, 404
+    stmt = db.select(Result).where(Result.match_id == id).order_by(Result.id.desc())
+    return {"match": id, "results": ResultSchema(many=True).dump(db.session.scalars(stmt))}
+
+
+# record_result records or corrects the score of a match. An admin,
+# or a captain of one of the two teams, can record it. The result is
+# appended to the ledger, and the teams' statistics are updated in
+# the same transaction. Team statistics can no longer be edited
+# directly through PATCH /teams/<id>. Like PATCH /teams/<id>, the
+# captain's team is read from the database, not the token.
+@matches_bp.route("/<int:id>/result", methods=["POST"])
+@jwt_required()
+def record_result(id):
+    claims = current_claims(strict=True)
+    result_info = ResultSchema(only=["home_score", "away_score"]).load(request.json)
+    match = db.session.get(Match, id)
+    if not match:
+        return {"error": "Match not found"}, 404
+    if not (claims["admin"] or (claims["captain"] and claims["team_id"] in (match.home_team, match.away_team))):
+        abort(401)
+    try:
+        results, deltas = record_results(
+            [(match, result_info["home_score"], result_info["away_score"])], claims["user_id"])
+        bump(*result_keys(deltas))
+        db.session.commit()
+    except StaleResult:
+        db.session.rollback()
+        return {"error": "The result was changed by another request, please try again"}, 409
+    after_results(deltas)
+    return {"match": MatchSchema().dump(match), "result": ResultSchema().dump(results[0])}, 201
+
+
+# record_results_bulk records a whole round in one request, e.g.
+# [{"id": 12, "home_score": 3, "away_score": 1}, ...] where "id" is
+# the match. Like the other bulk routes, bad items are reported by
+# their position and the rest are recorded in one transaction.
+@matches_bp.route("/results", methods=["POST"])
+@jwt_required()
+def record_results_bulk():
+    admin_required()
+    items, errors = load_items(
+        ResultSchema(many=True, only=["id", "home_score", "away_score"]), request.json)
+    found = {match.id: match for match in db.session.scalars(
+        db.select(Match).where(Match.id.in_([item["id"] for item in items.values()])))}
+    for index, item in list(items.items()):
+        if item["id"] not in found:
+            add_error(errors, index, "id", "Match not found")
+            del items[index]
+    if not items:
+        return bulk_result([], errors), 400
+
+    try:
+        results, deltas = record_results(
+            [(found[item["id"]], item["home_score"], item["away_score"]) for item in items.values()],
+            current_claims()["user_id"])
+        bump(*result_keys(deltas))
+        db.session.commit()
+    except StaleResult:
+        db.session.rollback()
+        return {"error": "A result was changed by another request, please try again"}, 409
+    except IntegrityError:
+        db.session.rollback()
+        return {"error": "Results could not be recorded"}, 409
+    after_results(deltas)
+    return bulk_result(items.values(), errors)
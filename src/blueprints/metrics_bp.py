@@ -0,0 +1,23 @@
+import hmac
+from flask import Blueprint, Response, current_app, request
+from flask_jwt_extended import verify_jwt_in_request
+from auth import admin_required
+from metrics import collect, render
+
+
+# The metrics blueprint serves GET /metrics in the Prometheus text
+# format, see metrics.py for what is counted.
+metrics_bp = Blueprint("metrics", __name__)
+
+
+# get_metrics is readable by admins, or by a scraper that sends
+# "Authorization: Bearer <METRICS_TOKEN>" when that is configured,
+# since a scraper can't log in for a JWT.
+@metrics_bp.route("/metrics")
+def get_metrics():
+    token = current_app.config.get("METRICS_TOKEN")
+    sent = request.headers.get("Authorization", "")
+    if not (token and hmac.compare_digest(sent, f"Bearer {token}")):
+        verify_jwt_in_request()
+        admin_required()
+    return Response(render(collect()), mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,51 @@
+from flask import Blueprint, request
+from flask_jwt_extended import jwt_required
+from sqlalchemy.orm import joinedload
+from setup import db
+from models.user import User, UserSchema
+from models.team import Team, TeamSchema
+from pagination import page_limit
+from serializers import serializer
+from search import query_terms, search_users, search_teams
+
+
+# The search blueprint serves GET /search, the full-text search of
+# players and teams described in search.py.
+search_bp = Blueprint("search", __name__)
+
+dump_user = serializer(UserSchema, exclude=[
+    "password", "team.league_id", "team.users", "team.points"])
+dump_team = serializer(TeamSchema, exclude=["league_id", "users"])
+
+SEARCHES = {
+    "users": (User, search_users, dump_user, (joinedload(User.team),)),
+    "teams": (Team, search_teams, dump_team, ()),
+}
+
+
+# load_ranked loads the matched rows in one query and dumps them in
+# rank order, each with its score.
+def load_ranked(model, matches, dump, load_plan):
+    stmt = db.select(model).where(model.id.in_([id for id, score in matches])).options(*load_plan)
+    rows = {row.id: row for row in db.session.scalars(stmt)}
+    return [dict(dump(rows[id]), score=round(float(score), 6)) for id, score in matches if id in rows]
+
+
+# search finds the players and teams matching "?q=", best first.
+# "?type=users" or "?type=teams" searches only one of them, and
+# "?limit=" is how many of each are returned.
+@search_bp.route("/search")
+@jwt_required()
+def search():
+    terms = query_terms(request.args.get("q"))
+    if not terms:
+        return {"error": "Enter one or more words to search for in q"}, 400
+    kind = request.args.get("type")
+    if kind is not None and kind not in SEARCHES:
+        return {"error": "Type must be users or teams"}, 400
+    limit = page_limit()
+    results = {}
+    for name, (model, find, dump, load_plan) in SEARCHES.items():
+        if kind in (None, name):
+            results[name] = load_ranked(model, find(terms, limit), dump, load_plan)
+    return results
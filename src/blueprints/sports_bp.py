@@ -4,7 +4,15 @@ from sqlalchemy.exc import IntegrityError
 from flask import request
 from flask_jwt_extended import jwt_required
 from models.sport import Sport, SportSchema
+from models.league import League
+from models.team import Team, FREE_AGENTS_TEAM_ID
+from models.match import FixtureOptionsSchema
+from sqlalchemy.orm import selectinload
 from auth import admin_required
+from etags import bump, sport_keys, current_etag, not_modified, with_etag
+from serializers import serializer
+from fixtures import generate_fixtures, FixtureError
+from standings import standings
 
 
 # A url prefix "/sports" is assigned to all routes,
@@ -15,6 +23,19 @@ from auth import admin_required
 sports_bp = Blueprint("sports", __name__, url_prefix="/sports")
 
 
+# get_sport dumps the sport with its leagues, but excludes the
+# teams nested inside each league. The leagues are loaded in one
+# extra query, so the number of queries stays fixed however many
+# leagues the sport has.
+SPORT_LOAD_PLAN = (
+    selectinload(Sport.leagues),
+)
+
+
+# get_sport dumps through a serializer compiled from SportSchema.
+dump_sport = serializer(SportSchema, exclude=["leagues.teams"])
+
+
 # This Flask route, register_sport, under sports_bp, is for
 # POST requests and requires JWT for authentication and
 # admin privileges for access. It registers a new sport,
@@ -61,6 +82,7 @@ def update_sport(id):
         if sport:
             sport.name = sport_info.get("name", sport.name)
             sport.max_players = sport_info.get("max_players", sport.max_players)
+            bump(*sport_keys(id))
             db.session.commit()
             return SportSchema(exclude=["id", "leagues"]).dump(sport)
         else:
@@ -80,12 +102,16 @@ def update_sport(id):
 @sports_bp.route("/<int:id>", methods=["DELETE"])
 @jwt_required()
 def delete_sport(id):
-    admin_required()
+    admin_required(strict=True)
     stmt = db.select(Sport).filter_by(id=id)
     sport = db.session.scalar(stmt)
     if sport:
+        leagues = db.session.scalars(db.select(League.id).where(League.sport == id)).all()
+        bump(*sport_keys(id))
         db.session.delete(sport)
         db.session.commit()
+        for league in leagues:
+            standings.drop_league(league)
         return {}, 200
     else:
         return {"error": "Sport not found"}
@@ -99,12 +125,55 @@ def delete_sport(id):
 # message "League not found" with a 404 status code. This approach 
 # ensures secure access and accurate data retrieval, providing 
 # clear feedback for both successful and unsuccessful queries.
+# Like get_league, it supports If-None-Match using the "sport:<id>"
+# version.
 @sports_bp.route("/<int:id>")
 @jwt_required()
 def get_sport(id):
-    stmt = db.select(Sport).filter_by(id=id) 
+    etag = current_etag(f"sport:{id}")
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    stmt = db.select(Sport).filter_by(id=id).options(*SPORT_LOAD_PLAN)
     league = db.session.scalar(stmt)
     if league:
-        return SportSchema(exclude=["leagues.teams"]).dump(league)
+        return with_etag(dump_sport(league), etag)
     else:
-        return {"error": "League not found"}, 404
\ No newline at end of file
+        return {"error": "League not found"}, 404
+
+
+# generate_seasons runs POST /leagues/<id>/fixtures for every league
+# of the sport at once, with the same options. All the seasons are
+# built before anything is written, so if one league doesn't fit its
+# dates none of them are changed, and every match of the sport is
+# inserted in the same executemany and commit. Leagues without at
+# least two teams are skipped and listed in "skipped".
+@sports_bp.route("/<int:id>/fixtures", methods=["POST"])
+@jwt_required()
+def generate_seasons(id):
+    admin_required()
+    options = FixtureOptionsSchema().load(request.get_json(silent=True) or {})
+    if not db.session.get(Sport, id):
+        return {"error": "Sport not found"}, 404
+    team_counts = (
+        db.select(Team.league, db.func.count().label("teams"))
+        .where(Team.id != FREE_AGENTS_TEAM_ID)
+        .group_by(Team.league)
+        .subquery()
+    )
+    leagues, skipped = [], []
+    for league, teams in db.session.execute(
+            db.select(League, team_counts.c.teams)
+            .outerjoin(team_counts, team_counts.c.league == League.id)
+            .where(League.sport == id).order_by(League.id)):
+        if (teams or 0) < 2:
+            skipped.append(league.id)
+        else:
+            leagues.append(league)
+    try:
+        summary = generate_fixtures(leagues, options)
+    except FixtureError as err:
+        db.session.rollback()
+        return {"error": str(err)}, 409
+    db.session.commit()
+    return {"sport": id, "leagues": summary, "skipped": skipped}, 201
@@ -4,7 +4,15 @@ from sqlalchemy.exc import IntegrityError, DataError
 from flask import request
 from flask_jwt_extended import jwt_required
 from models.team import Team, TeamSchema, TeamInputSchema
+from models.league import League
+from sqlalchemy.orm import selectinload
 from auth import captain_required, admin_required, captain_id_required
+from pagination import paginate
+from standings import standings
+from matching import free_agent_index
+from etags import bump, league_keys, current_etag, not_modified, with_etag, precondition_failed
+from serializers import serializer
+from bulk import load_items, existing, add_error, update_rows, bulk_result
 
 
 # A url prefix "/teams" is assigned to all routes,
@@ -15,6 +23,26 @@ from auth import captain_required, admin_required, captain_id_required
 teams_bp = Blueprint("teams", __name__, url_prefix="/teams")
 
 
+# one_team dumps the team with its players (the league is
+# excluded), so the users are loaded in a single extra query
+# instead of lazily. all_teams excludes both relationships and
+# needs no loading plan.
+TEAM_LOAD_PLAN = (
+    selectinload(Team.users),
+)
+
+
+# The read routes dump through serializers compiled from TeamSchema
+# (see serializers.py) instead of building a new schema per request.
+dump_teams = serializer(TeamSchema, many=True, exclude=["league_id", "users"])
+dump_team = serializer(TeamSchema, exclude=["league_id"])
+
+
+# The statistics columns are totals of the results ledger, so the
+# write routes don't accept them.
+TEAM_STATS = ["points", "win", "loss", "draw"]
+
+
 # All_teams, in the teams_bp Blueprint, 
 # is accessible to users with JWT authentication. It queries 
 # the database to retrieve all team records, sorting them in 
@@ -25,12 +53,25 @@ teams_bp = Blueprint("teams", __name__, url_prefix="/teams")
 # fields. The function returns a JSON response containing the 
 # serialized list of teams, providing a user-friendly and efficient 
 # way to access comprehensive team information within the application.
+# Teams are returned one page at a time. "?limit=" sets the page size
+# and the "next" cursor in the response is passed back as "?after="
+# to fetch the following page. The keyset on (team_name, id) is
+# backed by the index on teams.team_name, so deep pages cost the
+# same as the first one. Every team write bumps the "teams" version,
+# so clients polling with If-None-Match get a 304 until one happens.
 @teams_bp.route("/")
 @jwt_required()
 def all_teams():
-    stmt = db.select(Team).order_by(Team.team_name.asc())
-    users = db.session.scalars(stmt).all()
-    return TeamSchema(many=True, exclude=["league_id", "users"]).dump(users)
+    etag = current_etag("teams")
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    stmt = db.select(Team)
+    teams, next_cursor = paginate(stmt, Team.team_name, Team.id)
+    return with_etag({
+        "data": dump_teams(teams),
+        "next": next_cursor,
+    }, etag)
 
 
 # Get a Team
@@ -38,14 +79,20 @@ def all_teams():
 # to receive an integer type identifier. The
 # database can then be queried and return the
 # corresponding team that matches the id.
+# The ETag follows the "team:<id>" version, which changes with the
+# team's details and its roster.
 @teams_bp.route("/<int:id>")
 @jwt_required()
 def one_team(id):
-    stmt = db.select(Team).filter_by(id=id)
+    etag = current_etag(f"team:{id}")
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    stmt = db.select(Team).filter_by(id=id).options(*TEAM_LOAD_PLAN)
     team = db.session.scalar(stmt)
     if team:
         # The TeamSchema is returned and league_id.teams is excluded
-        return TeamSchema(exclude=["league_id"]).dump(team)
+        return with_etag(dump_team(team), etag)
     else:
         return {"error": "Team not found"}, 404
 
@@ -67,6 +114,7 @@ def register_team():
             team_name=team_info["team_name"])
 
         db.session.add(team)
+        bump("teams")
         db.session.commit()
 
         return TeamSchema(exclude=["users"]).dump(team), 201
@@ -81,29 +129,98 @@ def register_team():
 # The function commits changes to the database and returns updated team data. 
 # It handles errors related to league validity, team name uniqueness, and 
 # data types for team statistics, ensuring accurate and secure data updates.
+# Once committed, the team is moved within its league's cached
+# standings instead of the whole table being rebuilt.
+# Points, wins, losses and draws are derived from match results (see
+# ledger.py), so they can't be set here.
+# An If-Match header that isn't the team's current ETag, as returned
+# by GET /teams/<id>, gets a 412 (see etags.py). The team is read
+# before its ETag, so a change committed in between fails the check
+# rather than being missed by it.
+# The captain's team is checked against the database rather than the
+# token, as a captain who has just moved team may still hold a token
+# that another worker hasn't seen revoked yet.
 @teams_bp.route("/<int:id>", methods=["PUT", "PATCH"])
 @jwt_required()
 def update_team(id):
-    captain_id_required(id)
+    captain_id_required(id, strict=True)
     try:
-        team_info = TeamInputSchema(exclude=["id", "date_created"]).load(request.json)
+        team_info = TeamInputSchema(exclude=["id", "date_created", *TEAM_STATS]).load(request.json)
         stmt = db.select(Team).filter_by(id=id)
         team = db.session.scalar(stmt)
         if team:
+            failed = precondition_failed(current_etag(f"team:{id}"))
+            if failed:
+                return failed
+            old_league = team.league
             team.team_name = team_info.get("team_name", team.team_name)
-            team.points = team_info.get("points", team.points)
-            team.win = team_info.get("win", team.win)
-            team.loss = team_info.get("loss", team.loss)
-            team.draw = team_info.get("draw", team.draw)
             team.league = team_info.get("league", team.league)
+            bump(f"team:{id}", "teams", *league_keys(old_league, team.league))
             db.session.commit()
-            return TeamInputSchema(exclude=["id", "users"]).dump(team)
+            # Move the team to its new place in the league standings
+            standings.update([team], {id: old_league})
+            if team.league != old_league:
+                free_agent_index.invalidate()
+            return with_etag(TeamInputSchema(exclude=["id", "users"]).dump(team), current_etag(f"team:{id}"))
         else:
             return {"error": "Team not found"}
     except IntegrityError:
         return {"error": "Enter a valid league and unique team name."}, 409 # 409 is a conflict
-    except DataError:
-        return {"error": "Integers only for points, win, loss, and draw."}, 409 # 409 is a conflict
+
+
+# bulk_update_teams is the bulk version of update_team for admins.
+# The body is a list of partial team updates, each with an "id",
+# e.g. [{"id": 2, "league": 3}, ...]. Results of a round are
+# recorded with POST /matches/results instead. Items are
+# validated with TeamInputSchema(many=True), and leagues and team
+# names are checked with one query each. Every valid item is then
+# written in a single executemany UPDATE and one commit. The
+# response lists the ids that were updated, and the errors of the
+# rest by their position in the list.
+@teams_bp.route("/bulk", methods=["PATCH"])
+@jwt_required()
+def bulk_update_teams():
+    admin_required()
+    items, errors = load_items(
+        TeamInputSchema(many=True, exclude=["date_created", "users", *TEAM_STATS]), request.json)
+
+    found = existing(Team.id, [item["id"] for item in items.values()], Team.league, Team.version_id)
+    old_leagues = {id: row[0] for id, row in found.items()}
+    leagues = existing(League.id, [item.get("league") for item in items.values()])
+    owners = {name: row[0] for name, row in existing(
+        Team.team_name, [item.get("team_name") for item in items.values()], Team.id).items()}
+    names = {}
+    for index, item in list(items.items()):
+        if item["id"] not in old_leagues:
+            add_error(errors, index, "id", "Team not found")
+        if item.get("league") is not None and item["league"] not in leagues:
+            add_error(errors, index, "league", "League not found")
+        if "team_name" in item:
+            if owners.get(item["team_name"], item["id"]) != item["id"] or item["team_name"] in names:
+                add_error(errors, index, "team_name", "Team name already exists")
+            names[item["team_name"]] = index
+        if index in errors:
+            del items[index]
+
+    changed = [item["id"] for item in items.values()]
+    if not changed:
+        return bulk_result([], errors), 400
+    try:
+        update_rows(Team, items.values(), {id: row[1] for id, row in found.items()})
+        new_leagues = [item["league"] for item in items.values() if "league" in item]
+        bump("teams", *[f"team:{id}" for id in changed],
+             *league_keys(*[old_leagues[id] for id in changed], *new_leagues))
+        db.session.commit()
+    except (IntegrityError, DataError):
+        db.session.rollback()
+        return {"error": "Enter valid leagues and unique team names."}, 409
+
+    # Move every updated team within the cached standings
+    teams = db.session.scalars(db.select(Team).where(Team.id.in_(changed))).all()
+    standings.update(teams, old_leagues)
+    if any(team.league != old_leagues[team.id] for team in teams):
+        free_agent_index.invalidate()
+    return bulk_result(items.values(), errors)
 
 
 # The delete_team function in the teams_bp Blueprint, designated 
@@ -117,12 +234,20 @@ def update_team(id):
 @teams_bp.route("/<int:id>", methods=["DELETE"])
 @jwt_required()
 def delete_team(id):
-    admin_required()
+    admin_required(strict=True)
     stmt = db.select(Team).filter_by(id=id)
     team = db.session.scalar(stmt)
     if team:
+        league = team.league
         db.session.delete(team)
-        db.session.commit()
+        bump(f"team:{id}", "teams", *league_keys(league))
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Teams with fixtures keep their place in the results ledger
+            db.session.rollback()
+            return {"error": "Team has matches and can't be deleted"}, 409
+        standings.remove(id, league)
         return {}, 200
     else:
         return {"error": "team not found"}
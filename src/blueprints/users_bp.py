@@ -1,12 +1,22 @@
-from datetime import timedelta
-from flask_jwt_extended import create_access_token
+from flask_jwt_extended import create_access_token, get_jwt
 from flask import Blueprint
-from models.user import User, UserSchema, UserInputSchema
-from setup import bcrypt, db
+from models.user import User, UserSchema, UserInputSchema, FreeAgentSearchSchema
+from models.team import Team
+from models.sport import Sport
+from models.league import League
+from setup import db, hashing
 from sqlalchemy.exc import IntegrityError, DataError 
+from sqlalchemy.orm import joinedload
 from flask import request
 from flask_jwt_extended import jwt_required
-from auth import admin_required, captain_required, user_id_required
+from auth import admin_required, captain_required, user_id_required, token_claims, current_claims, TOKEN_LIFETIME
+from pagination import paginate, page_limit
+from matching import free_agent_index, team_needs, search
+from etags import bump, team_keys, roster_keys, user_etag, with_etag, precondition_failed
+from serializers import serializer
+from bulk import load_items, existing, add_error, update_rows, bulk_result
+from revocation import deny_list, revoke_token, revoke_user, revoke_users
+from rosters import move_players, RosterFull
 
 
 # A url prefix "/users" is assigned to all routes,
@@ -17,13 +27,43 @@ from auth import admin_required, captain_required, user_id_required
 users_bp = Blueprint("users", __name__, url_prefix="/users")
 
 
+# The captains and free agents lists nest each user's team (but
+# not the team's league or players). The team is joined onto the
+# users query so a page of users is fetched in one round trip.
+USER_LIST_LOAD_PLAN = (
+    joinedload(User.team),
+)
+
+
+# PREFERENCES are the sport and league a free agent can ask for (see
+# the User model), with the model each one refers to. SQLite doesn't
+# enforce the foreign keys, so they are checked here.
+PREFERENCES = {"sport_id": (Sport, "Sport not found"), "league_id": (League, "League not found")}
+
+
+def preference_error(user_info):
+    for key, (model, message) in PREFERENCES.items():
+        if user_info.get(key) is not None and not db.session.get(model, user_info[key]):
+            return {"error": message}, 400
+    return None
+
+
+# Compiled serializers for the captains and free agents lists (see
+# serializers.py).
+dump_users = serializer(UserSchema, many=True, exclude=[
+    "password", "team.league_id", "team.users", "team.points"])
+dump_user = serializer(UserSchema, exclude=[
+    "password", "team.league_id", "team.users", "team.points"])
+
+
 
 # The register_user function in users_bp, accessible via 
 # POST request, handles new user registrations. It parses 
 # and validates incoming user data with UserSchema, excluding 
 # certain fields. The function then creates a new User object 
 # with the provided details, including securely hashed passwords, 
-# and adds it to the database. Upon successful registration, 
+# and adds it to the database. Hashing is handed to the hashing
+# service so it doesn't block the worker. Upon successful registration, 
 # it returns serialized user data, excluding sensitive 
 # information like passwords. The function also manages 
 # data integrity and key errors, ensuring unique email addresses 
@@ -34,7 +74,10 @@ def register_user():
     try:
         # Parse incoming POST body through the schema
         # Here the id is excluded from the request
-        user_info = UserSchema(exclude=["id", "admin", "date_created", "team"]).load(request.json) 
+        user_info = UserSchema(exclude=["id", "admin", "date_created", "team", "skill"]).load(request.json) 
+        failed = preference_error(user_info)
+        if failed:
+            return failed
         # Create a new user with the parsed data
         user = User(
             captain=user_info.get("captain"),
@@ -42,17 +85,22 @@ def register_user():
             last=user_info["last"],
             dob=user_info.get("dob"), # if not provided, default to None
             email=user_info["email"],
-            password=bcrypt.generate_password_hash(user_info["password"]).decode("utf8"),
+            password=hashing.generate_password_hash(user_info["password"]),
             bio=user_info.get("bio", ""),
             available=user_info.get("available"),
             phone=user_info.get("phone"),
+            sport_id=user_info.get("sport_id"),
+            league_id=user_info.get("league_id"),
         )
         # Add and commit the new user to the database
         db.session.add(user)
         # Return the new user
         db.session.commit()
+        free_agent_index.invalidate()
         # Password is excluded from the returned data dump
-        return UserSchema(exclude=["password"]).dump(user), 201 
+        response = with_etag(UserSchema(exclude=["password"]).dump(user), user_etag(user))
+        response.status_code = 201
+        return response
     except IntegrityError:
         return {"error": "Email address already exists"}, 409 # 409 is a conflict
     except KeyError:
@@ -63,7 +111,9 @@ def register_user():
 # The login function in users_bp, for POST requests, handles 
 # user logins. It validates email and password, checks credentials 
 # against the database, and if successful, generates a JWT token 
-# with a 10-hour expiry. Returns a token and user details on successful 
+# with a 10-hour expiry. The token carries the user's id, admin, captain
+# and team_id claims so the auth guards don't need to query the user on
+# every request. Returns a token and user details on successful 
 # login. If not, it provides an error for invalid credentials or missing 
 # fields, ensuring user authentication.
 @users_bp.route("/login", methods=["POST"])
@@ -72,8 +122,9 @@ def login():
         user_info = UserSchema(only=["email", "password"]).load(request.json)
         stmt = db.select(User).where(User.email==user_info["email"])
         user = db.session.scalar(stmt)
-        if user and bcrypt.check_password_hash(user.password, user_info["password"]):
-            token = create_access_token(identity=user.email, expires_delta=timedelta(hours=10))
+        if user and hashing.check_password_hash(user.password, user_info["password"]):
+            token = create_access_token(identity=user.email, expires_delta=TOKEN_LIFETIME,
+                                        additional_claims=token_claims(user))
             return {"token": token, "user": UserSchema(only=["first", "last", "email", "team.id"]).dump(user)}
         else:
             return {"error": "Invalid email or password"}, 401
@@ -81,6 +132,35 @@ def login():
         return {"error": "Must have email and password fields"}
 
 
+# logout revokes the token the request was sent with. The user's
+# other tokens, on other devices, keep working.
+@users_bp.route("/logout", methods=["POST"])
+@jwt_required()
+def logout():
+    revocation = revoke_token(get_jwt())
+    db.session.commit()
+    deny_list.add(revocation)
+    return {}, 200
+
+
+# revoke_user_tokens revokes every token issued to a user so far,
+# logging them out everywhere. Users can revoke their own tokens and
+# admins anyone's. Both are checked against the database, so a
+# demoted admin can't use an old token to do it.
+@users_bp.route("/<int:id>/revoke", methods=["POST"])
+@jwt_required()
+def revoke_user_tokens(id):
+    claims = current_claims(strict=True)
+    if not (claims["admin"] or claims["user_id"] == id):
+        return {"error": "You are not authorised to access this resource"}, 401
+    if not db.session.get(User, id):
+        return {"error": "User not found"}, 404
+    revocation = revoke_user(id)
+    db.session.commit()
+    deny_list.add(revocation)
+    return {}, 200
+
+
 # The captains function in users_bp, secured with JWT authentication,
 # retrieves all users who are team captains. It uses a SQLAlchemy query
 # to select users where the captain field is true, executing the query to
@@ -88,38 +168,50 @@ def login():
 # specific fields like 'password' and certain team-related attributes, and
 # returns this data. This setup provides an efficient way to access and display
 # captain information within the application, ensuring data security and
-# streamlined access to user roles.
+# streamlined access to user roles. Results are paginated with the
+# same "?after=" and "?limit=" cursor as the teams list, keyed on the
+# user id.
 @users_bp.route("/captains")
 @jwt_required()
 def captains():
     # select * from users;
     # Use a comma to separate conditions. Just like the AND operator.
     # to run it through an OR operator, wrap it with db._or() function.
-    # eg. stmt = db.select(User).where(db.or_(User.captain, User.team_id == 1))
-    # use the .order_by() function to sort the results
-    stmt = db.select(User).where(User.captain)
-    users = db.session.scalars(stmt)
-    return UserSchema(many=True, exclude=["password", "team.league_id", 
-                                          "team.users", "team.points"]).dump(users)
+    # eg. stmt = db.select(User).where(db.or_(User.captain, User.team_id == FREE_AGENTS_TEAM_ID))
+    # paginate() adds the .order_by() and the keyset condition
+    stmt = db.select(User).where(User.captain).options(*USER_LIST_LOAD_PLAN)
+    users, next_cursor = paginate(stmt, User.id)
+    return {
+        "data": dump_users(users),
+        "next": next_cursor,
+    }
     
 
 # THis route is protected by JWT 
-# and accessible only to captains. It fetches users who are potential 
-# free agents (not team captains and assigned to team ID 1). It uses 
-# a SQLAlchemy query with conditions to select such users, then serializes 
-# and returns their data, excluding fields 'password' and specific team 
-# details. This function efficiently identifies available 
-# players for team recruitment, providing captains and admins with crucial 
-# information for team management and player selection in the application.
+# and accessible only to captains. It searches the free agents (players
+# who aren't captains and are in the Free Agents pool or not on a team)
+# and ranks them against the needs of the captain's team: the open spots
+# left before the sport's max_players, the team's sport and its average
+# age. The query string can filter on "available", "sport", "league",
+# "min_age" and "max_age". Ranking runs over the in-memory candidate
+# index in matching.py, and only the page of users being returned is
+# loaded from the database. Results are paginated with "?after=" and
+# "?limit=" like the other lists, ordered by score.
 @users_bp.route("/freeagents")
 @jwt_required()
 def free_agents():
     captain_required()
-    # select all users that are not assigned a team;
-    stmt = db.select(User).where(db.and_(User.captain != True, User.team_id == 1))
-    users = db.session.scalars(stmt).all()
-    return UserSchema(many=True, exclude=["password", "team.league_id", 
-                                          "team.users", "team.points"]).dump(users)
+    filters = FreeAgentSearchSchema().load(request.args)
+    needs = team_needs(current_claims()["team_id"])
+    page, next_cursor = search(filters, needs, page_limit(), request.args.get("after"))
+
+    stmt = db.select(User).where(User.id.in_([id for id, score in page])).options(*USER_LIST_LOAD_PLAN)
+    users = {user.id: user for user in db.session.scalars(stmt)}
+    data = []
+    for id, score in page:
+        if id in users:
+            data.append(dict(dump_user(users[id]), score=score))
+    return {"data": data, "next": next_cursor, "needs": needs}
 
 
 # The update_user function in users_bp, using PUT/PATCH methods and 
@@ -128,17 +220,28 @@ def free_agents():
 # updating user details in the database and returning serialized user data, 
 # excluding sensitive information. This function enhances user profile 
 # management, providing error handling for non-existent users and email 
-# conflicts.
+# conflicts. Changing email or password is sensitive, so the user is
+# checked against the database rather than the token claims. Joining
+# a team that already has its sport's max_players returns a 409.
+# The response's ETag can be sent back in If-Match, and an If-Match
+# that isn't the user's current ETag gets a 412 (see etags.py).
+# Changing team revokes the user's tokens, as they carry the team_id
+# claim, so the user logs in again.
 @users_bp.route("/<int:id>", methods=["PUT", "PATCH"])
 @jwt_required()
 def update_user(id):
-    user_id_required(id)
+    user_id_required(id, strict=True)
     try:
+        # Skill ratings are set by admins through PATCH /users/bulk.
         user_info = UserInputSchema(exclude=["id", "admin", "date_created", 
-                                        "captain"]).load(request.json)
-        stmt = db.select(User).filter_by(id=id)
-        user = db.session.scalar(stmt)
+                                        "captain", "skill"]).load(request.json)
+        # The strict check above already loaded this user, so get()
+        # returns it from the session without another query.
+        user = db.session.get(User, id)
         if user: # Add and user email == email
+            failed = precondition_failed(user_etag(user))
+            if failed:
+                return failed
             # user.captain = user_info.get("captain", user.captain)
             user.first = user_info.get("first", user.first)
             user.last = user_info.get("last", user.last)
@@ -148,12 +251,33 @@ def update_user(id):
             user.bio = user_info.get("bio", user.bio)
             user.available = user_info.get("available", user.available)
             user.phone = user_info.get("phone", user.phone)
+            failed = preference_error(user_info)
+            if failed:
+                return failed
+            user.sport_id = user_info.get("sport_id", user.sport_id)
+            user.league_id = user_info.get("league_id", user.league_id)
+            old_team = user.team_id
             user.team_id = user_info.get("team_id", user.team_id)
+            # The player shows up in their team's roster, so both the
+            # old and new team (and their leagues) get new ETags, and
+            # the teams list too if the roster sizes change.
+            if user.team_id != old_team:
+                bump(*roster_keys(old_team, user.team_id))
+            else:
+                bump(*team_keys(old_team))
+            move_players([(old_team, user.team_id)])
+            revocation = revoke_user(id) if user.team_id != old_team else None
             db.session.commit()
-            return UserInputSchema(exclude=["admin", "date_created",
-                                       "password"]).dump(user)
+            if revocation:
+                deny_list.add(revocation)
+            free_agent_index.invalidate()
+            return with_etag(UserInputSchema(exclude=["admin", "date_created",
+                                       "password"]).dump(user), user_etag(user))
         else:
             return {"error": "User not found"}, 404
+    except RosterFull:
+        db.session.rollback()
+        return {"error": "Team is full"}, 409
     except IntegrityError:
         return {"error": "Email address already exists"}, 409 # 409 is a conflict
     except DataError:
@@ -161,22 +285,105 @@ def update_user(id):
 
     
 
+# bulk_update_users applies a list of roster changes in one request,
+# e.g. moving players between teams or marking them unavailable for
+# the next round. It works like PATCH /teams/bulk: items are
+# validated with UserInputSchema(many=True), teams and emails are
+# checked with one query each, and the valid items are written with
+# one executemany UPDATE and one commit. Passwords can't be changed
+# in bulk. Changing a user's captain or team revokes their tokens.
+# Players moving to a team without room for all of them get a
+# "Team is full" error and the rest of the items are still applied.
+@users_bp.route("/bulk", methods=["PATCH"])
+@jwt_required()
+def bulk_update_users():
+    admin_required()
+    items, errors = load_items(
+        UserInputSchema(many=True, exclude=["admin", "date_created", "password"]), request.json)
+
+    found = existing(User.id, [item["id"] for item in items.values()], User.team_id, User.captain,
+                     User.version_id)
+    old_teams = {id: row[0] for id, row in found.items()}
+    teams = existing(Team.id, [item.get("team_id") for item in items.values()])
+    preferences = {key: existing(model.id, [item.get(key) for item in items.values()])
+                   for key, (model, message) in PREFERENCES.items()}
+    owners = {email: row[0] for email, row in existing(
+        User.email, [item.get("email") for item in items.values()], User.id).items()}
+    emails = {}
+    for index, item in list(items.items()):
+        if item["id"] not in old_teams:
+            add_error(errors, index, "id", "User not found")
+        if item.get("team_id") is not None and item["team_id"] not in teams:
+            add_error(errors, index, "team_id", "Team not found")
+        for key, (model, message) in PREFERENCES.items():
+            if item.get(key) is not None and item[key] not in preferences[key]:
+                add_error(errors, index, key, message)
+        if "email" in item:
+            if owners.get(item["email"], item["id"]) != item["id"] or item["email"] in emails:
+                add_error(errors, index, "email", "Email address already exists")
+            emails[item["email"]] = index
+        if index in errors:
+            del items[index]
+
+    # The rosters are checked first, as moving the players is what
+    # can fail. A team without room for every player moving to it
+    # takes none of them, and the other moves are tried again.
+    while True:
+        changed = [item["id"] for item in items.values()]
+        if not changed:
+            return bulk_result([], errors), 400
+        try:
+            move_players([(old_teams[item["id"]], item["team_id"])
+                          for item in items.values() if "team_id" in item])
+            break
+        except RosterFull as full:
+            db.session.rollback()
+            for index, item in list(items.items()):
+                if item.get("team_id") in full.team_ids and item["team_id"] != old_teams[item["id"]]:
+                    add_error(errors, index, "team_id", "Team is full")
+                    del items[index]
+
+    # Tokens carry the captain and team_id claims, so users whose
+    # claims change have their tokens revoked and log in again.
+    stale = [item["id"] for item in items.values()
+             if item.get("captain", found[item["id"]][1]) != found[item["id"]][1]
+             or item.get("team_id", old_teams[item["id"]]) != old_teams[item["id"]]]
+    try:
+        update_rows(User, items.values(), {id: row[2] for id, row in found.items()})
+        new_teams = [item["team_id"] for item in items.values() if "team_id" in item]
+        moved = any(item.get("team_id", old_teams[item["id"]]) != old_teams[item["id"]] for item in items.values())
+        bump(*(roster_keys if moved else team_keys)(*[old_teams[id] for id in changed], *new_teams))
+        revocations = revoke_users(stale)
+        db.session.commit()
+    except (IntegrityError, DataError):
+        db.session.rollback()
+        return {"error": "Enter valid teams, unique emails and phone numbers of 10 digits or less."}, 409
+    deny_list.add(*revocations)
+    free_agent_index.invalidate()
+    return bulk_result(items.values(), errors)
+
+
 # The delete_user function is secured with JWT and requiring admin 
 # privileges. It allows for the deletion of a user by their id. 
 # It verifies the user's existence in the database and, if found, 
 # deletes and commits the change. Successful deletion returns a 200 
 # status, while a non-existent user triggers a 404 error response. 
 # This setup ensures secure and accurate user deletion within the 
-# application.
+# application. The user's tokens are revoked in the same commit.
 @users_bp.route("/<int:id>", methods=["DELETE"])
 @jwt_required()
 def delete_user(id):
-    admin_required()
+    admin_required(strict=True)
     stmt = db.select(User).filter_by(id=id)
     user = db.session.scalar(stmt)
     if user:
+        bump(*roster_keys(user.team_id))
+        move_players([(user.team_id, None)])
         db.session.delete(user)
+        revocation = revoke_user(id)
         db.session.commit()
+        deny_list.add(revocation)
+        free_agent_index.invalidate()
         return {}, 200
     else:
         return {"error": "User not found"}, 404
@@ -0,0 +1,75 @@
+from flask import abort
+from marshmallow.exceptions import ValidationError
+from setup import db
+
+
+# The bulk module holds the helpers shared by PATCH /teams/bulk and
+# PATCH /users/bulk. A bulk request is a JSON list of partial
+# updates, each with the "id" of the row it changes. Items are
+# checked one by one, and the errors of a bad item are reported
+# against its position in the list, so one typo doesn't throw away
+# a whole round of results. Every valid item is then written with
+# a single executemany UPDATE and one commit.
+MAX_ITEMS = 1000
+
+
+def add_error(errors, index, field, message):
+    errors.setdefault(index, {}).setdefault(field, []).append(message)
+
+
+# load_items validates the request body with a many=True schema and
+# returns the valid items by position along with the errors of the
+# others. Each valid item includes its integer "id".
+def load_items(schema, payload):
+    if not isinstance(payload, list) or not payload:
+        abort(400, description="Expected a list of updates")
+    if len(payload) > MAX_ITEMS:
+        abort(400, description=f"At most {MAX_ITEMS} updates can be sent at once")
+
+    try:
+        loaded, errors = schema.load(payload), {}
+    except ValidationError as err:
+        loaded, errors = err.valid_data, dict(err.messages)
+
+    items, seen = {}, set()
+    for index, data in enumerate(loaded):
+        raw = payload[index]
+        id = raw.get("id") if isinstance(raw, dict) else None
+        if type(id) is not int:
+            add_error(errors, index, "id", "An integer id is required.")
+        elif id in seen:
+            add_error(errors, index, "id", "Appears more than once.")
+        seen.add(id)
+        if index not in errors:
+            items[index] = dict(data, id=id)
+    return items, errors
+
+
+# existing returns the values of a column found in the database,
+# for checking foreign keys and unique columns in one query each.
+def existing(column, values, *extra):
+    values = {value for value in values if value is not None}
+    if not values:
+        return {}
+    stmt = db.select(column, *extra).where(column.in_(values))
+    return {row[0]: row[1:] for row in db.session.execute(stmt)}
+
+
+# update_rows runs an ORM bulk UPDATE by primary key. Items with the
+# same set of keys are sent together in one executemany. Models with
+# a version_id_col (see etags.py) are updated from "versions", the
+# rows' versions as the route read them along with the values it
+# validated, so a row changed since raises StaleDataError (a 412)
+# rather than being overwritten.
+def update_rows(model, items, versions):
+    if items:
+        version = model.__mapper__.version_id_col
+        items = [dict(item, **{version.key: versions[item["id"]]}) for item in items]
+        db.session.execute(db.update(model), items)
+
+
+def bulk_result(items, errors):
+    return {
+        "updated": sorted(item["id"] for item in items),
+        "errors": {str(index): messages for index, messages in sorted(errors.items())},
+    }
@@ -0,0 +1,117 @@
+from flask import make_response, request
+from sqlalchemy.dialects import postgresql, sqlite
+from models.version import Version
+from models.team import Team
+from models.league import League
+from setup import db
+
+
+# The etags module provides conditional GET support. Each document
+# is identified by one or more version keys. Its ETag is made from
+# their counters, so a client that sends the ETag back in
+# If-None-Match gets a 304 without the document being queried or
+# serialised. Write routes call bump() with the keys of every
+# document their change shows up in.
+UPSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+# bump increments the counters of the given keys, creating any that
+# don't exist yet, in a single upsert. It runs inside the caller's
+# transaction, so the new ETags appear together with the change.
+def bump(*keys):
+    keys = sorted({key for key in keys if key})
+    if not keys:
+        return
+    insert = UPSERTS[db.session.get_bind().dialect.name]
+    stmt = insert(Version).values([{"key": key, "version": 1} for key in keys])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Version.key], set_={"version": Version.version + 1})
+    db.session.execute(stmt)
+
+
+def league_keys(*league_ids):
+    return [f"league:{id}" for id in set(league_ids) if id]
+
+
+# team_keys returns the version keys that a change to a team's
+# roster or details invalidates: the team itself and the leagues
+# the teams belong to.
+def team_keys(*team_ids):
+    team_ids = {id for id in team_ids if id}
+    if not team_ids:
+        return []
+    leagues = db.session.scalars(db.select(Team.league).where(Team.id.in_(team_ids)))
+    return [f"team:{id}" for id in team_ids] + league_keys(*leagues)
+
+
+# roster_keys returns the keys invalidated by players joining or
+# leaving the teams: the teams' own keys and, as the teams list shows
+# every team's roster_size, the list's "teams" key.
+def roster_keys(*team_ids):
+    keys = team_keys(*team_ids)
+    return ["teams", *keys] if keys else []
+
+
+# sport_keys returns the keys invalidated by a change to a sport:
+# the sport and every league, since leagues nest their sport.
+def sport_keys(sport_id):
+    leagues = db.session.scalars(db.select(League.id).where(League.sport == sport_id))
+    return [f"sport:{sport_id}"] + league_keys(*leagues)
+
+
+def versions_statement(keys):
+    return db.select(Version.key, Version.version).where(Version.key.in_(keys))
+
+
+# format_etag builds the ETag of a document from its keys' counters.
+# A key that has never been bumped counts as version 0.
+def format_etag(keys, versions):
+    return "-".join(f"{key}.{versions.get(key, 0)}" for key in keys)
+
+
+def read_versions(keys):
+    return dict(db.session.execute(versions_statement(keys)).all())
+
+
+def current_etag(*keys):
+    return format_etag(keys, read_versions(keys))
+
+
+# not_modified returns a 304 response when the client already has
+# the current version of the document, and None otherwise.
+def not_modified(etag):
+    if request.if_none_match.contains(etag):
+        response = make_response("", 304)
+        response.set_etag(etag)
+        return response
+    return None
+
+
+# The PUT/PATCH routes of teams, users and leagues take the ETag the
+# client last read in If-Match. If the document has changed since,
+# i.e. its current ETag isn't in If-Match, precondition_failed returns
+# a 412 so the client's copy doesn't overwrite the newer one. Requests
+# without If-Match are applied as before. Teams and leagues are
+# compared with the ETag GET returns, and users, which have no GET,
+# with user_etag(), returned by register and every update.
+#
+# The check is made against the row as read at the start of the
+# request. The rows' version_id columns cover the time from there to
+# the commit: SQLAlchemy only updates the row if its version_id is
+# still the one read, and raises StaleDataError otherwise, which
+# setup.py also turns into a 412. Edits are never blocked on a lock
+# held by another request, they fail instead.
+def precondition_failed(etag):
+    if request.if_match and not request.if_match.contains(etag):
+        return {"error": "The resource has changed since it was read, fetch it and try again"}, 412
+    return None
+
+
+def user_etag(user):
+    return format_etag([f"user:{user.id}"], {f"user:{user.id}": user.version_id})
+
+
+def with_etag(body, etag):
+    response = make_response(body)
+    response.set_etag(etag)
+    return response
@@ -0,0 +1,156 @@
+from datetime import timedelta
+import numpy as np
+from models.match import Match
+from models.team import Team, FREE_AGENTS_TEAM_ID
+from setup import db
+
+
+# The fixtures module generates a league's season. Teams are paired
+# with the circle method: one team stays put while the others rotate
+# one place each round, which gives every pair of teams exactly one
+# match per leg in n - 1 rounds. With an odd number of teams a
+# phantom team is added, and whoever is drawn against it has a bye
+# that round. The pairings for every round are built at once as
+# numpy arrays, so a league of several hundred teams takes
+# milliseconds.
+#
+# Rounds are then laid out on game nights, every "interval_days"
+# from the league's start date, skipping blackout dates. A night has
+# "slots_per_night" venue slots, so a round with more matches than
+# slots carries on over the following nights. A round always starts
+# on a new night, so no team plays twice on the same night.
+BYE = -1
+
+
+class FixtureError(Exception):
+    pass
+
+
+# round_robin returns three arrays, the round, home team and away
+# team of every match, sorted by round. Home and away are swapped in
+# every second leg.
+def round_robin(team_ids, legs=1):
+    ids = list(team_ids)
+    if len(ids) % 2:
+        ids.append(BYE)
+    ids = np.array(ids, dtype=np.int64)
+    n = len(ids)
+    half = n // 2
+    rounds = np.arange(n - 1)
+
+    # Position 0 is fixed, the rest rotate. Each row is the order of
+    # the teams in one round, and position i plays position n - 1 - i.
+    positions = np.concatenate([
+        np.zeros((n - 1, 1), dtype=np.int64),
+        (rounds[:, None] + np.arange(n - 1)[None, :]) % (n - 1) + 1,
+    ], axis=1)
+    first, second = positions[:, :half], positions[:, ::-1][:, :half]
+    # The fixed team is at home every other round. Every other pair
+    # swaps by its position, which, as the teams rotate through the
+    # positions, keeps each team's home and away games within one of
+    # each other and never more than two in a row.
+    pair = np.arange(half)[None, :]
+    swap = np.where(pair == 0, rounds[:, None] % 2 == 1, pair % 2 == 1)
+    home = ids[np.where(swap, second, first)].ravel()
+    away = ids[np.where(swap, first, second)].ravel()
+    round_numbers = np.repeat(rounds + 1, half)
+
+    legs_round, legs_home, legs_away = [], [], []
+    for leg in range(legs):
+        legs_round.append(round_numbers + leg * (n - 1))
+        legs_home.append(away if leg % 2 else home)
+        legs_away.append(home if leg % 2 else away)
+    round_numbers, home, away = (np.concatenate(part) for part in (legs_round, legs_home, legs_away))
+
+    played = (home != BYE) & (away != BYE)
+    return round_numbers[played], home[played], away[played]
+
+
+def game_nights(start, end, interval_days, blackout_dates, count):
+    nights = []
+    night = start
+    blackout = set(blackout_dates)
+    while len(nights) < count:
+        if night > end:
+            raise FixtureError(
+                f"The season needs {count} game nights but only {len(nights)} fit "
+                f"between {start} and {end}")
+        if night not in blackout:
+            nights.append(night)
+        night += timedelta(days=interval_days)
+    return nights
+
+
+# schedule gives every match a game night and a venue slot. Matches
+# must be sorted by round, as round_robin returns them.
+def schedule(round_numbers, start, end, slots_per_night, interval_days, blackout_dates):
+    if not len(round_numbers):
+        return [], np.array([], dtype=np.int64)
+    _, first, counts = np.unique(round_numbers, return_index=True, return_counts=True)
+    position = np.arange(len(round_numbers)) - np.repeat(first, counts)
+    slots = slots_per_night or int(counts.max())
+    nights_per_round = -(-counts // slots)
+    night_offset = np.repeat(np.cumsum(nights_per_round) - nights_per_round, counts)
+    night = night_offset + position // slots
+    nights = game_nights(start, end, interval_days, blackout_dates, int(nights_per_round.sum()))
+    return [nights[n] for n in night.tolist()], position % slots
+
+
+def league_teams(league_id):
+    stmt = db.select(Team.id).where(Team.league == league_id, Team.id != FREE_AGENTS_TEAM_ID).order_by(Team.id)
+    return db.session.scalars(stmt).all()
+
+
+# season_rows builds the match rows of a league's season.
+def season_rows(league, options):
+    team_ids = league_teams(league.id)
+    if len(team_ids) < 2:
+        raise FixtureError(f"League {league.id} needs at least two teams")
+    if not league.start_date or not league.end_date:
+        raise FixtureError(f"League {league.id} needs a start and end date")
+    round_numbers, home, away = round_robin(team_ids, options["legs"])
+    dates, slots = schedule(
+        round_numbers, league.start_date, league.end_date, options.get("slots_per_night"),
+        options["interval_days"], options["blackout_dates"])
+    return [
+        {"league": league.id, "round": round, "date": date, "slot": slot,
+         "home_team": home_team, "away_team": away_team}
+        for round, date, slot, home_team, away_team
+        in zip(round_numbers.tolist(), dates, slots.tolist(), home.tolist(), away.tolist())
+    ]
+
+
+# clear_fixtures makes room for a new season. Leagues with fixtures
+# keep them unless "replace" is set, and fixtures that already have
+# results are never replaced, since the results ledger refers to them.
+def clear_fixtures(league_ids, replace):
+    stmt = db.select(Match.league, db.func.count(), db.func.count(Match.result_id)).where(
+        Match.league.in_(league_ids)).group_by(Match.league)
+    for league, fixtures, results in db.session.execute(stmt):
+        if results:
+            raise FixtureError(f"League {league} already has results")
+        if not replace:
+            raise FixtureError(f"League {league} already has {fixtures} fixtures, send replace to regenerate them")
+    db.session.execute(db.delete(Match).where(Match.league.in_(league_ids)))
+
+
+# generate_fixtures builds the seasons of the given leagues and
+# inserts all of their matches with one executemany INSERT. Nothing
+# is written unless every league's season fits.
+def generate_fixtures(leagues, options):
+    rows = []
+    summary = []
+    for league in leagues:
+        league_rows = season_rows(league, options)
+        rows.extend(league_rows)
+        summary.append({
+            "league": league.id,
+            "matches": len(league_rows),
+            "rounds": league_rows[-1]["round"],
+            "first_night": league_rows[0]["date"].isoformat(),
+            "last_night": max(row["date"] for row in league_rows).isoformat(),
+        })
+    clear_fixtures([league.id for league in leagues], options.get("replace"))
+    if rows:
+        db.session.execute(db.insert(Match), rows)
+    return summary
@@ -0,0 +1,92 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import bcrypt
+from time import perf_counter
+from flask import abort
+from metrics import HASH_SECONDS, HASH_QUEUE_DEPTH
+
+
+# bcrypt is deliberately slow, and hashing inline holds the
+# request's worker (and the GIL) for the whole hash. The functions
+# below run in a separate process instead, so other requests keep
+# being served while a login or registration is hashing. They are
+# module level functions so the process pool can pickle them.
+def _generate_hash(password, rounds):
+    return bcrypt.hashpw(password.encode("utf8"), bcrypt.gensalt(rounds)).decode("utf8")
+
+
+def _check_hash(pw_hash, password):
+    return bcrypt.checkpw(password.encode("utf8"), pw_hash.encode("utf8"))
+
+
+# The operation label of password_hash_duration_seconds, see metrics.py
+OPERATIONS = {_generate_hash: "hash", _check_hash: "check"}
+
+
+# HashingService is set up in setup.py like the other extensions.
+# HASH_WORKERS caps how many hashes run at once (0 hashes inline,
+# which the CLI commands use). HASH_MAX_PENDING caps how many
+# requests may be waiting on a hash. Once the queue is full, new
+# requests are turned away with a 503 and a Retry-After header
+# rather than tying up every worker during a login burst.
+class HashingService:
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._pool = None
+        self._pool_pid = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("HASH_WORKERS", os.cpu_count() or 1)
+        app.config.setdefault("HASH_MAX_PENDING", max(app.config["HASH_WORKERS"], 1) * 8)
+        app.config.setdefault("HASH_RETRY_AFTER", 2)
+        app.config.setdefault("BCRYPT_LOG_ROUNDS", 12)
+        self.app = app
+        HASH_QUEUE_DEPTH.set((), 0)
+
+    # queue_depth is the number of requests currently waiting on or
+    # running a hash in this process, reported by GET /metrics as
+    # password_hash_queue_depth.
+    @property
+    def queue_depth(self):
+        return self._pending
+
+    # The pool is created on first use and re-created after a fork,
+    # so a pool started in a pre-forking server's master process is
+    # never shared with its workers.
+    def _executor(self):
+        if self._pool is None or self._pool_pid != os.getpid():
+            self._pool = ProcessPoolExecutor(max_workers=self.app.config["HASH_WORKERS"])
+            self._pool_pid = os.getpid()
+        return self._pool
+
+    def _run(self, fn, *args):
+        with self._lock:
+            if self._pending >= self.app.config["HASH_MAX_PENDING"]:
+                abort(503, description="Server is busy, please try again shortly",
+                      retry_after=self.app.config["HASH_RETRY_AFTER"])
+            self._pending += 1
+            HASH_QUEUE_DEPTH.set((), self._pending)
+            if self.app.config["HASH_WORKERS"]:
+                pool = self._executor()
+        start = perf_counter()
+        try:
+            if not self.app.config["HASH_WORKERS"]:
+                return fn(*args)
+            return pool.submit(fn, *args).result()
+        finally:
+            HASH_SECONDS.observe((OPERATIONS[fn],), perf_counter() - start)
+            with self._lock:
+                self._pending -= 1
+                HASH_QUEUE_DEPTH.set((), self._pending)
+
+    # Produces the same "$2b$" hashes as Flask-Bcrypt, so existing
+    # passwords keep working.
+    def generate_password_hash(self, password):
+        return self._run(_generate_hash, password, self.app.config["BCRYPT_LOG_ROUNDS"])
+
+    def check_password_hash(self, pw_hash, password):
+        return self._run(_check_hash, pw_hash, password)
@@ -0,0 +1,202 @@
+from sqlalchemy import bindparam
+from models.match import Match, Result
+from models.team import Team
+from setup import db
+
+
+# The ledger module records match results and keeps the team
+# statistics derived from them. A result is appended to the results
+# table, never updated, and in the same transaction each team's
+# points, win, loss and draw columns are moved by the difference the
+# result makes: the match's previous result (if it is a correction)
+# is taken away and the new one added. The UPDATEs add to the
+# current values in SQL, so two results for different matches of
+# the same team can be recorded at once without losing either.
+# recompute() rebuilds the statistics from the whole ledger to check
+# that the incremental updates have stayed correct.
+POINTS_FOR_WIN = 2
+POINTS_FOR_DRAW = 1
+POINTS_FOR_LOSS = 0
+
+teams = Team.__table__
+matches = Match.__table__
+
+
+# StaleResult is raised when another request recorded a result for
+# the same match after this one read it.
+class StaleResult(Exception):
+    pass
+
+
+def points(win, loss, draw):
+    return win * POINTS_FOR_WIN + loss * POINTS_FOR_LOSS + draw * POINTS_FOR_DRAW
+
+
+# outcomes returns the (win, loss, draw) a score gives each team.
+def outcomes(home_team, away_team, home_score, away_score):
+    if home_score > away_score:
+        return {home_team: (1, 0, 0), away_team: (0, 1, 0)}
+    if home_score < away_score:
+        return {home_team: (0, 1, 0), away_team: (1, 0, 0)}
+    return {home_team: (0, 0, 1), away_team: (0, 0, 1)}
+
+
+def add_outcomes(totals, team_outcomes, sign=1):
+    for team, counts in team_outcomes.items():
+        total = totals.setdefault(team, [0, 0, 0])
+        for n, count in enumerate(counts):
+            total[n] += sign * count
+
+
+ADD_TO_TEAM = teams.update().where(teams.c.id == bindparam("team_id")).values(
+    win=db.func.coalesce(teams.c.win, 0) + bindparam("add_win"),
+    loss=db.func.coalesce(teams.c.loss, 0) + bindparam("add_loss"),
+    draw=db.func.coalesce(teams.c.draw, 0) + bindparam("add_draw"),
+    points=db.func.coalesce(teams.c.points, 0) + bindparam("add_points"),
+)
+
+# CLAIM_MATCH moves a match onto its new result, but only if its
+# result is still the one that was read.
+CLAIM_MATCH = matches.update().where(
+    matches.c.id == bindparam("match_id"),
+    matches.c.result_id.is_not_distinct_from(bindparam("previous_id")),
+).values(
+    result_id=bindparam("new_id"),
+    home_score=bindparam("new_home_score"),
+    away_score=bindparam("new_away_score"),
+)
+
+
+# record_results appends one result per (match, home_score,
+# away_score) entry and updates the teams, all in the caller's
+# transaction. The team UPDATEs are sent as one executemany, in id
+# order so concurrent transactions lock the teams in the same order.
+# It returns the new results and the totals each team changed by.
+def record_results(entries, user_id=None):
+    results = [
+        Result(match_id=match.id, home_score=home_score, away_score=away_score, recorded_by=user_id)
+        for match, home_score, away_score in entries
+    ]
+    db.session.add_all(results)
+    db.session.flush()
+
+    deltas = {}
+    for (match, home_score, away_score), result in zip(entries, results):
+        if match.result_id is not None:
+            add_outcomes(deltas, outcomes(
+                match.home_team, match.away_team, match.home_score, match.away_score), -1)
+        add_outcomes(deltas, outcomes(match.home_team, match.away_team, home_score, away_score))
+        claimed = db.session.execute(CLAIM_MATCH, {
+            "match_id": match.id,
+            "previous_id": match.result_id,
+            "new_id": result.id,
+            "new_home_score": home_score,
+            "new_away_score": away_score,
+        }).rowcount
+        if claimed != 1:
+            raise StaleResult(match.id)
+        db.session.expire(match)
+
+    add_to_teams(deltas)
+    return results, deltas
+
+
+# add_to_teams adds {team id: [win, loss, draw]} to the teams'
+# statistics with one executemany UPDATE.
+def add_to_teams(deltas):
+    rows = [
+        {"team_id": team, "add_win": win, "add_loss": loss, "add_draw": draw,
+         "add_points": points(win, loss, draw)}
+        for team, (win, loss, draw) in sorted(deltas.items()) if (win, loss, draw) != (0, 0, 0)
+    ]
+    if rows:
+        db.session.execute(ADD_TO_TEAM, rows)
+
+
+# current_results selects the latest ledger row of every match that
+# has a result, along with the match's teams and stored score.
+def current_results():
+    latest = (
+        db.select(db.func.max(Result.id).label("id"))
+        .group_by(Result.match_id)
+        .subquery()
+    )
+    return (
+        db.select(Match.id, Match.home_team, Match.away_team, Match.result_id,
+                  Match.home_score, Match.away_score,
+                  Result.id.label("latest_id"), Result.home_score.label("latest_home"),
+                  Result.away_score.label("latest_away"))
+        .join(Result, Result.match_id == Match.id)
+        .join(latest, latest.c.id == Result.id)
+    )
+
+
+# expected_totals adds up every team's wins, losses and draws from
+# the ledger in SQL, so recompute() doesn't pull millions of results
+# into Python.
+def expected_totals():
+    current = current_results().subquery()
+    home, away = current.c.latest_home, current.c.latest_away
+    sides = db.union_all(
+        db.select(
+            current.c.home_team.label("team"),
+            db.case((home > away, 1), else_=0).label("win"),
+            db.case((home < away, 1), else_=0).label("loss"),
+            db.case((home == away, 1), else_=0).label("draw")),
+        db.select(
+            current.c.away_team.label("team"),
+            db.case((away > home, 1), else_=0).label("win"),
+            db.case((away < home, 1), else_=0).label("loss"),
+            db.case((home == away, 1), else_=0).label("draw")),
+    ).subquery()
+    stmt = db.select(
+        sides.c.team, db.func.sum(sides.c.win), db.func.sum(sides.c.loss), db.func.sum(sides.c.draw),
+    ).group_by(sides.c.team)
+    return {team: (int(win), int(loss), int(draw)) for team, win, loss, draw in db.session.execute(stmt)}
+
+
+SET_TEAM = teams.update().where(teams.c.id == bindparam("team_id")).values(
+    win=bindparam("set_win"), loss=bindparam("set_loss"),
+    draw=bindparam("set_draw"), points=bindparam("set_points"),
+)
+SET_MATCH = matches.update().where(matches.c.id == bindparam("match_id")).values(
+    result_id=bindparam("set_result_id"),
+    home_score=bindparam("set_home_score"),
+    away_score=bindparam("set_away_score"),
+)
+
+
+# recompute compares every team's statistics, and every match's
+# current score, with what the ledger says they should be. It
+# returns the teams and matches that differ, and when "fix" is set
+# overwrites them with the ledger's values in the current session.
+def recompute(fix=False):
+    expected = expected_totals()
+    teams_off = []
+    for id, win, loss, draw, team_points in db.session.execute(
+            db.select(Team.id, Team.win, Team.loss, Team.draw, Team.points)):
+        stored = (win or 0, loss or 0, draw or 0, team_points or 0)
+        should = expected.get(id, (0, 0, 0))
+        should = should + (points(*should),)
+        if stored != should:
+            teams_off.append({"team_id": id, "stored": stored, "expected": should})
+
+    matches_off = db.session.execute(current_results().where(db.or_(
+        Match.result_id.is_distinct_from(Result.id),
+        Match.home_score.is_distinct_from(Result.home_score),
+        Match.away_score.is_distinct_from(Result.away_score),
+    ))).all()
+
+    if fix and teams_off:
+        db.session.execute(SET_TEAM, [
+            {"team_id": team["team_id"], "set_win": team["expected"][0], "set_loss": team["expected"][1],
+             "set_draw": team["expected"][2], "set_points": team["expected"][3]}
+            for team in teams_off
+        ])
+    if fix and matches_off:
+        db.session.execute(SET_MATCH, [
+            {"match_id": row.id, "set_result_id": row.latest_id,
+             "set_home_score": row.latest_home, "set_away_score": row.latest_away}
+            for row in matches_off
+        ])
+    return teams_off, [row.id for row in matches_off]
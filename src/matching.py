@@ -0,0 +1,186 @@
+import threading
+import time
+from datetime import date
+import numpy as np
+from flask import current_app
+from models.user import User
+from models.team import Team, FREE_AGENTS_TEAM_ID
+from models.league import League
+from models.sport import Sport
+from pagination import decode_cursor, encode_cursor
+from setup import db
+from routing import read_from_primary
+
+
+# The matching module ranks free agents for a captain. The pool of
+# free agents is copied into numpy arrays (the candidate index) so
+# a search filters and scores every candidate in a handful of
+# vectorised operations instead of looping over users in Python.
+# The index is rebuilt when a user route invalidates it, or after
+# FREE_AGENT_INDEX_TTL seconds, which bounds how stale it can be in
+# other worker processes.
+DAYS_PER_YEAR = 365.25
+
+# Weights of the parts of a candidate's score. Availability matters
+# most; after that, players from the team's own sport pool and
+# players close to the team's average age are preferred. The sport
+# weight is scaled by the share of the roster still open, so a team
+# that is short of many players is offered its sport's pool first,
+# while one that is nearly full ranks more on age.
+AVAILABLE_WEIGHT = 1.0
+SPORT_WEIGHT = 0.5
+AGE_WEIGHT = 0.5
+AGE_SCALE = 10.0
+
+
+# index_statement selects the candidates of the index. Free agents
+# all share the Free Agents team, so their sport and league are the
+# ones they asked for (see the User model): the league's sport when
+# they chose a league, and their sport_id otherwise.
+def index_statement():
+    return (
+        db.select(User.id, User.available, User.skill, User.dob, User.league_id.label("league"),
+                  db.func.coalesce(League.sport, User.sport_id).label("sport"))
+        .outerjoin(League, User.league_id == League.id)
+        .where(free_agent_filter())
+    )
+
+
+# free_agent_filter selects users who aren't captains and are either
+# in the Free Agents pool or haven't been placed on any team yet.
+def free_agent_filter():
+    return db.and_(
+        User.captain.isnot(True),
+        db.or_(User.team_id == FREE_AGENTS_TEAM_ID, User.team_id.is_(None)),
+    )
+
+
+class CandidateIndex:
+    def __init__(self, rows):
+        self.size = len(rows)
+        self.ids = np.fromiter((row.id for row in rows), dtype=np.int64, count=self.size)
+        self.available = np.fromiter((bool(row.available) for row in rows), dtype=bool, count=self.size)
+        self.skill = np.fromiter(
+            (row.skill if row.skill is not None else np.nan for row in rows), dtype=np.float64, count=self.size)
+        self.dob = np.fromiter(
+            (row.dob.toordinal() if row.dob else np.nan for row in rows), dtype=np.float64, count=self.size)
+        self.league = np.fromiter(
+            (row.league if row.league is not None else -1 for row in rows), dtype=np.int64, count=self.size)
+        self.sport = np.fromiter(
+            (row.sport if row.sport is not None else -1 for row in rows), dtype=np.int64, count=self.size)
+        self.built_at = time.monotonic()
+
+    def ages(self):
+        return (date.today().toordinal() - self.dob) / DAYS_PER_YEAR
+
+
+class FreeAgentIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._index = None
+
+    def invalidate(self):
+        self._index = None
+
+    def _build(self):
+        read_from_primary(db.session)
+        return CandidateIndex(db.session.execute(index_statement()).all())
+
+    # get returns the current index, rebuilding it when it has been
+    # invalidated or is older than the TTL. Only one thread rebuilds
+    # at a time; the others wait and then use its result.
+    def get(self):
+        ttl = current_app.config.get("FREE_AGENT_INDEX_TTL", 60)
+        index = self._index
+        if index is None or time.monotonic() - index.built_at > ttl:
+            with self._lock:
+                index = self._index
+                if index is None or time.monotonic() - index.built_at > ttl:
+                    index = self._index = self._build()
+        return index
+
+
+free_agent_index = FreeAgentIndex()
+
+
+# team_needs describes the roster gap of a team: how many more
+# players it can take before reaching its sport's max_players, read
+# from the roster_size that rosters.py maintains. Teams outside a
+# league, and the Free Agents pool itself, have no needs.
+def team_needs(team_id):
+    if not team_id or team_id == FREE_AGENTS_TEAM_ID:
+        return None
+    stmt = (
+        db.select(Team.id, Team.roster_size, League.sport, Sport.max_players)
+        .join(League, Team.league == League.id)
+        .join(Sport, League.sport == Sport.id)
+        .where(Team.id == team_id)
+    )
+    team = db.session.execute(stmt).first()
+    if not team:
+        return None
+    # A roster is at most max_players long, so the birthdays are
+    # fetched and averaged here rather than in SQL.
+    dobs = db.session.scalars(db.select(User.dob).where(User.team_id == team_id)).all()
+    known = [dob.toordinal() for dob in dobs if dob]
+    average_age = None
+    if known:
+        average_age = (date.today().toordinal() - sum(known) / len(known)) / DAYS_PER_YEAR
+    return {
+        "team_id": team_id,
+        "sport": team.sport,
+        "max_players": team.max_players,
+        "roster_size": team.roster_size,
+        "open_spots": max((team.max_players or 0) - team.roster_size, 0),
+        "average_age": average_age,
+    }
+
+
+# search filters the candidate index, scores what is left against
+# the team's needs and returns one page of (user id, score) pairs,
+# best first, along with the cursor for the next page. The cursor
+# holds the score and id of the last candidate, so paging works the
+# same way as the SQL backed lists. A team with no open spots can't
+# take anyone, so it gets no suggestions.
+def search(filters, needs, limit, after=None):
+    if needs and not needs["open_spots"]:
+        return [], None
+    index = free_agent_index.get()
+    ages = index.ages()
+
+    mask = np.ones(index.size, dtype=bool)
+    if filters.get("available") is not None:
+        mask &= index.available == filters["available"]
+    if filters.get("sport") is not None:
+        mask &= index.sport == filters["sport"]
+    if filters.get("league") is not None:
+        mask &= index.league == filters["league"]
+    with np.errstate(invalid="ignore"):
+        if filters.get("min_age") is not None:
+            mask &= ages >= filters["min_age"]
+        if filters.get("max_age") is not None:
+            mask &= ages <= filters["max_age"]
+
+    score = AVAILABLE_WEIGHT * index.available
+    if needs:
+        share_open = needs["open_spots"] / needs["max_players"]
+        score = score + SPORT_WEIGHT * share_open * np.where(
+            index.sport == needs["sport"], 1.0, np.where(index.sport == -1, 0.5, 0.0))
+        if needs["average_age"] is not None:
+            fit = np.exp(-np.abs(ages - needs["average_age"]) / AGE_SCALE)
+            score = score + AGE_WEIGHT * np.nan_to_num(fit)
+    score = np.round(score, 6)
+
+    if after:
+        last_score, last_id = decode_cursor(after, float, int)
+        mask &= (score < last_score) | ((score == last_score) & (index.ids > last_id))
+
+    candidates = np.flatnonzero(mask)
+    order = candidates[np.lexsort((index.ids[candidates], -score[candidates]))][:limit + 1]
+    page = [(int(index.ids[i]), float(score[i])) for i in order]
+
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = encode_cursor([page[-1][1], page[-1][0]])
+    return page, next_cursor
@@ -0,0 +1,260 @@
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from time import perf_counter
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+# The metrics module counts requests, database queries, password
+# hashing and serialization, and renders them in the Prometheus text
+# format for GET /metrics. Recording a value is a dict update under a
+# lock, a few microseconds per request.
+#
+# Each process keeps its own numbers. When METRICS_DIR is set, every
+# process also writes a snapshot of them to "<METRICS_DIR>/<pid>.json"
+# (at most every METRICS_FLUSH_SECONDS, and whenever it is scraped),
+# and /metrics adds up all the snapshots in the directory, so any one
+# worker of a multi-process server reports the totals of them all.
+# Snapshots of workers that have exited are still counted, so the
+# totals never go backwards; clear the directory when deploying.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Metric:
+    def __init__(self, registry, kind, name, help, labels):
+        self.registry = registry
+        self.kind = kind
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values = {}
+
+
+class Counter(Metric):
+    def inc(self, labels, amount=1):
+        with self.registry.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+
+# A gauge holds a value that goes up and down, such as the length of
+# a queue. With METRICS_DIR, /metrics adds up the processes' values
+# as of their last snapshot.
+class Gauge(Metric):
+    def set(self, labels, value):
+        with self.registry.lock:
+            self.values[labels] = value
+
+
+# A histogram's value for a set of labels is a list of the count in
+# each bucket (not cumulative, the last one is +Inf), then the sum of
+# the observations and their count.
+class Histogram(Metric):
+    def __init__(self, registry, name, help, labels, buckets):
+        super().__init__(registry, "histogram", name, help, labels)
+        self.buckets = buckets
+
+    def observe(self, labels, value):
+        bucket = bisect_left(self.buckets, value)
+        with self.registry.lock:
+            counts = self.values.get(labels)
+            if counts is None:
+                counts = self.values[labels] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            counts[bucket] += 1
+            counts[-2] += value
+            counts[-1] += 1
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = []
+
+    def counter(self, name, help, labels):
+        metric = Counter(self, "counter", name, help, labels)
+        self.metrics.append(metric)
+        return metric
+
+    def gauge(self, name, help, labels):
+        metric = Gauge(self, "gauge", name, help, labels)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help, labels, buckets=DEFAULT_BUCKETS):
+        metric = Histogram(self, name, help, labels, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    # snapshot copies every value, for writing to METRICS_DIR and
+    # rendering.
+    def snapshot(self):
+        with self.lock:
+            return {
+                metric.name: [[list(labels), list(value) if metric.kind == "histogram" else value]
+                              for labels, value in metric.values.items()]
+                for metric in self.metrics
+            }
+
+
+registry = Registry()
+
+REQUESTS = registry.counter(
+    "http_requests_total", "Requests handled", ("blueprint", "endpoint", "method", "status"))
+REQUEST_SECONDS = registry.histogram(
+    "http_request_duration_seconds", "Time to produce a response", ("blueprint", "endpoint", "method"))
+DB_QUERIES = registry.counter(
+    "db_queries_total", "Database statements run by requests", ("blueprint", "endpoint"))
+DB_SECONDS = registry.counter(
+    "db_query_seconds_total", "Time requests spent in database statements", ("blueprint", "endpoint"))
+HASH_SECONDS = registry.histogram(
+    "password_hash_duration_seconds", "Time to hash or check a password, including queueing",
+    ("operation",), (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0))
+HASH_QUEUE_DEPTH = registry.gauge(
+    "password_hash_queue_depth", "Requests waiting on or running a password hash", ())
+SERIALIZE_SECONDS = registry.histogram(
+    "serialization_duration_seconds", "Time spent in compiled serializers", ("schema",),
+    (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0))
+
+
+# request_labels names the blueprint and endpoint of the current
+# request. Requests that matched no route share one label so stray
+# URLs can't create new series.
+def request_labels():
+    return (request.blueprint or "", request.endpoint or "unmatched")
+
+
+def before_request():
+    g.metrics_start = perf_counter()
+    g.metrics_queries = 0
+    g.metrics_db_seconds = 0.0
+
+
+def after_request(response):
+    start = g.pop("metrics_start", None)
+    if start is None:
+        return response
+    blueprint, endpoint = request_labels()
+    REQUEST_SECONDS.observe((blueprint, endpoint, request.method), perf_counter() - start)
+    REQUESTS.inc((blueprint, endpoint, request.method, str(response.status_code)))
+    if g.metrics_queries:
+        DB_QUERIES.inc((blueprint, endpoint), g.metrics_queries)
+        DB_SECONDS.inc((blueprint, endpoint), g.metrics_db_seconds)
+    flush()
+    return response
+
+
+# The engine events time every statement run on any engine (the
+# primary, the replicas and the async engines alike) and add it to
+# the request it ran in.
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._metrics_start = perf_counter()
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, "_metrics_start", None)
+    if start is not None and has_request_context() and "metrics_start" in g:
+        g.metrics_queries += 1
+        g.metrics_db_seconds += perf_counter() - start
+
+
+def instrument(app):
+    app.config.setdefault("METRICS_DIR", None)
+    app.config.setdefault("METRICS_FLUSH_SECONDS", 10)
+    app.before_request(before_request)
+    app.after_request(after_request)
+    if not event.contains(Engine, "before_cursor_execute", before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", after_cursor_execute)
+
+
+last_flush = 0.0
+
+
+# flush writes this process's snapshot to METRICS_DIR, at most once
+# every METRICS_FLUSH_SECONDS unless forced.
+def flush(force=False):
+    global last_flush
+    directory = current_app.config["METRICS_DIR"]
+    now = time.monotonic()
+    if not directory or (not force and now - last_flush < current_app.config["METRICS_FLUSH_SECONDS"]):
+        return
+    last_flush = now
+    path = os.path.join(directory, f"{os.getpid()}.json")
+    os.makedirs(directory, exist_ok=True)
+    temporary = f"{path}.{threading.get_ident()}.tmp"
+    with open(temporary, "w") as file:
+        json.dump(registry.snapshot(), file)
+    os.replace(temporary, path)
+
+
+def merge(snapshots):
+    totals = {metric.name: {} for metric in registry.metrics}
+    for snapshot in snapshots:
+        for name, values in snapshot.items():
+            if name not in totals:
+                continue
+            for labels, value in values:
+                labels = tuple(labels)
+                if isinstance(value, list):
+                    current = totals[name].setdefault(labels, [0] * len(value))
+                    totals[name][labels] = [a + b for a, b in zip(current, value)]
+                else:
+                    totals[name][labels] = totals[name].get(labels, 0) + value
+    return totals
+
+
+# collect returns the values to report: this process's own, or with
+# METRICS_DIR the sum of every process's latest snapshot.
+def collect():
+    directory = current_app.config["METRICS_DIR"]
+    if not directory:
+        return merge([registry.snapshot()])
+    flush(force=True)
+    snapshots = []
+    for name in os.listdir(directory):
+        if name.endswith(".json"):
+            try:
+                with open(os.path.join(directory, name)) as file:
+                    snapshots.append(json.load(file))
+            except (OSError, ValueError):
+                continue
+    return merge(snapshots)
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def format_labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in pairs) + "}"
+
+
+def format_number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# render formats the values in the Prometheus text exposition format.
+def render(totals):
+    lines = []
+    for metric in registry.metrics:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for labels, value in sorted(totals[metric.name].items()):
+            if metric.kind != "histogram":
+                lines.append(f"{metric.name}{format_labels(metric.labels, labels)} {format_number(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip([*metric.buckets, "+Inf"], value[:-2]):
+                cumulative += count
+                le = bound if bound == "+Inf" else format_number(float(bound))
+                lines.append(
+                    f"{metric.name}_bucket{format_labels(metric.labels, labels, [('le', le)])} {cumulative}")
+            lines.append(f"{metric.name}_sum{format_labels(metric.labels, labels)} {format_number(value[-2])}")
+            lines.append(f"{metric.name}_count{format_labels(metric.labels, labels)} {value[-1]}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,79 @@
+from setup import db
+from models.migration import Migration
+from migrations import (m0001_baseline, m0002_query_indexes, m0003_match_results, m0004_user_skill,
+                        m0005_revocations, m0006_search, m0007_roster_size,
+                        m0008_version_ids, m0009_free_agent_preferences)
+
+
+# The migrate module applies and reverts the schema migrations in
+# the migrations folder. Each migration is a module with a
+# "revision", a "description", and upgrade()/downgrade() functions
+# that take a connection. They run in the order listed here, each
+# in its own transaction together with its schema_migrations row.
+# New migrations are added to the end of the list.
+MIGRATIONS = [
+    m0001_baseline,
+    m0002_query_indexes,
+    m0003_match_results,
+    m0004_user_skill,
+    m0005_revocations,
+    m0006_search,
+    m0007_roster_size,
+    m0008_version_ids,
+    m0009_free_agent_preferences,
+]
+
+
+def applied():
+    with db.engine.begin() as connection:
+        Migration.__table__.create(connection, checkfirst=True)
+        return set(connection.scalars(db.select(Migration.revision)))
+
+
+# upgrade applies every pending migration, or the pending ones up to
+# and including "target", and returns the migrations it ran.
+def upgrade(target=None):
+    done = applied()
+    ran = []
+    for migration in MIGRATIONS:
+        if migration.revision not in done:
+            with db.engine.begin() as connection:
+                migration.upgrade(connection)
+                connection.execute(db.insert(Migration).values(revision=migration.revision))
+            ran.append(migration)
+        if migration.revision == target:
+            break
+    return ran
+
+
+# downgrade reverts the most recent migration, or every migration
+# after "target". A target of "base" reverts all of them. It returns
+# the migrations it reverted, latest first, the order they ran in.
+def downgrade(target=None):
+    done = applied()
+    revisions = [migration.revision for migration in MIGRATIONS]
+    if target not in (None, "base") and target not in revisions:
+        raise ValueError(f"Unknown revision {target}")
+    current = [migration for migration in MIGRATIONS if migration.revision in done]
+    if target is None:
+        revert = current[-1:]
+    elif target == "base":
+        revert = current
+    else:
+        revert = [m for m in current if revisions.index(m.revision) > revisions.index(target)]
+    revert.reverse()
+    for migration in revert:
+        with db.engine.begin() as connection:
+            migration.downgrade(connection)
+            connection.execute(db.delete(Migration).where(Migration.revision == migration.revision))
+    return revert
+
+
+# stamp marks every migration as applied without running it. It is
+# used after db.create_all() has built the latest schema directly.
+def stamp():
+    done = applied()
+    with db.engine.begin() as connection:
+        for migration in MIGRATIONS:
+            if migration.revision not in done:
+                connection.execute(db.insert(Migration).values(revision=migration.revision))
@@ -0,0 +1,71 @@
+from sqlalchemy import (BigInteger, Boolean, Column, Date, ForeignKey, Integer, MetaData, String,
+                        Table)
+from migrations.ops import create_tables, drop_tables
+
+
+# The tables as they were before migrations were introduced.
+revision = "0001"
+description = "Create the sports, leagues, teams, users and versions tables"
+
+metadata = MetaData()
+
+sports = Table(
+    "sports", metadata,
+    Column("id", Integer, primary_key=True, nullable=False, unique=True),
+    Column("name", String, nullable=False, unique=True),
+    Column("max_players", Integer),
+)
+
+leagues = Table(
+    "leagues", metadata,
+    Column("id", Integer, primary_key=True, nullable=False, unique=True),
+    Column("name", String),
+    Column("start_date", Date),
+    Column("end_date", Date),
+    Column("sport", Integer, ForeignKey("sports.id"), nullable=False),
+)
+
+teams = Table(
+    "teams", metadata,
+    Column("id", Integer, primary_key=True, nullable=False, unique=True),
+    Column("team_name", String, nullable=False, unique=True),
+    Column("date_created", Date, nullable=False),
+    Column("points", Integer),
+    Column("win", Integer),
+    Column("loss", Integer),
+    Column("draw", Integer),
+    Column("league", Integer, ForeignKey("leagues.id")),
+)
+
+users = Table(
+    "users", metadata,
+    Column("id", Integer, primary_key=True, nullable=False, unique=True),
+    Column("admin", Boolean),
+    Column("captain", Boolean),
+    Column("date_created", Date, nullable=False),
+    Column("first", String, nullable=False),
+    Column("last", String, nullable=False),
+    Column("dob", Date),
+    Column("email", String(60), nullable=False, unique=True),
+    Column("password", String, nullable=False),
+    Column("bio", String(200)),
+    Column("available", Boolean),
+    Column("phone", BigInteger),
+    Column("team_id", Integer, ForeignKey("teams.id")),
+)
+
+versions = Table(
+    "versions", metadata,
+    Column("key", String, primary_key=True, nullable=False),
+    Column("version", Integer, nullable=False),
+)
+
+TABLES = (sports, leagues, teams, users, versions)
+
+
+def upgrade(connection):
+    create_tables(connection, *TABLES)
+
+
+def downgrade(connection):
+    drop_tables(connection, *TABLES)
@@ -0,0 +1,47 @@
+from sqlalchemy import Boolean, Column, Index, Integer, MetaData, String, Table
+from migrations.ops import create_indexes, drop_indexes
+
+
+# Indexes for the foreign keys and filters the API queries on:
+# teams by league, leagues by sport and users by team for the eager
+# loads, the captains list, the free agents search and the sorted
+# teams list.
+revision = "0002"
+description = "Index foreign keys, captains, free agents and team names"
+
+metadata = MetaData()
+
+users = Table(
+    "users", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("captain", Boolean),
+    Column("team_id", Integer),
+)
+teams = Table(
+    "teams", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("team_name", String),
+    Column("league", Integer),
+)
+leagues = Table(
+    "leagues", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("sport", Integer),
+)
+
+INDEXES = (
+    Index("ix_users_team_id", users.c.team_id),
+    Index("ix_users_captain_id", users.c.captain, users.c.id),
+    Index("ix_users_free_agents", users.c.team_id, users.c.captain),
+    Index("ix_teams_league", teams.c.league),
+    Index("ix_teams_team_name", teams.c.team_name),
+    Index("ix_leagues_sport", leagues.c.sport),
+)
+
+
+def upgrade(connection):
+    create_indexes(connection, *INDEXES)
+
+
+def downgrade(connection):
+    drop_indexes(connection, *INDEXES)
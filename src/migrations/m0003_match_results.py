@@ -0,0 +1,48 @@
+from sqlalchemy import Column, Date, DateTime, ForeignKey, Index, Integer, MetaData, Table
+from migrations.ops import create_tables, drop_tables, referenced
+
+
+# Fixtures and the append-only results ledger that team statistics
+# are derived from. Existing statistics aren't backed by any results,
+# so run "flask db recompute-stats" after upgrading to see them, and
+# "--fix" to reset them to the ledger.
+revision = "0003"
+description = "Create the matches and results tables"
+
+metadata = MetaData()
+referenced(metadata, "leagues", "teams")
+
+matches = Table(
+    "matches", metadata,
+    Column("id", Integer, primary_key=True, nullable=False, unique=True),
+    Column("league", Integer, ForeignKey("leagues.id"), nullable=False, index=True),
+    Column("round", Integer),
+    Column("date", Date),
+    Column("slot", Integer),
+    Column("home_team", Integer, ForeignKey("teams.id"), nullable=False, index=True),
+    Column("away_team", Integer, ForeignKey("teams.id"), nullable=False, index=True),
+    Column("home_score", Integer),
+    Column("away_score", Integer),
+    Column("result_id", Integer),
+)
+
+results = Table(
+    "results", metadata,
+    Column("id", Integer, primary_key=True, nullable=False, unique=True),
+    Column("match_id", Integer, ForeignKey("matches.id"), nullable=False),
+    Column("home_score", Integer, nullable=False),
+    Column("away_score", Integer, nullable=False),
+    Column("recorded_at", DateTime, nullable=False),
+    Column("recorded_by", Integer),
+    Index("ix_results_match_id_id", "match_id", "id"),
+)
+
+TABLES = (matches, results)
+
+
+def upgrade(connection):
+    create_tables(connection, *TABLES)
+
+
+def downgrade(connection):
+    drop_tables(connection, *TABLES)
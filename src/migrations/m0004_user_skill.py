@@ -0,0 +1,17 @@
+from sqlalchemy import Column, Float, MetaData, Table
+from migrations.ops import add_column, drop_column
+
+
+# The optional skill rating the team builder balances teams on.
+revision = "0004"
+description = "Add users.skill"
+
+users = Table("users", MetaData(), Column("skill", Float))
+
+
+def upgrade(connection):
+    add_column(connection, users.c.skill)
+
+
+def downgrade(connection):
+    drop_column(connection, users.c.skill)
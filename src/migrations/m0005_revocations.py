@@ -0,0 +1,30 @@
+from sqlalchemy import Column, DateTime, Index, Integer, MetaData, String, Table
+from migrations.ops import create_tables, drop_tables
+
+
+# The table of revoked tokens behind POST /users/logout and
+# POST /users/<id>/revoke.
+revision = "0005"
+description = "Create the revocations table"
+
+metadata = MetaData()
+
+revocations = Table(
+    "revocations", metadata,
+    Column("id", Integer, primary_key=True, nullable=False, unique=True),
+    Column("jti", String(36)),
+    Column("user_id", Integer),
+    Column("revoked_at", DateTime, nullable=False),
+    Column("expires_at", DateTime, nullable=False),
+    Index("ix_revocations_revoked_at", "revoked_at"),
+)
+
+TABLES = (revocations,)
+
+
+def upgrade(connection):
+    create_tables(connection, *TABLES)
+
+
+def downgrade(connection):
+    drop_tables(connection, *TABLES)
@@ -0,0 +1,80 @@
+from sqlalchemy import Column, Index, Integer, MetaData, String, Table, func, literal_column
+from migrations.ops import create_indexes, drop_indexes
+
+
+# Full-text search of players and teams for GET /search: GIN indexes
+# of the tsvector documents on PostgreSQL, or FTS5 tables filled from
+# the existing rows and kept in step by triggers on SQLite.
+revision = "0006"
+description = "Add full-text search indexes on users and teams"
+
+metadata = MetaData()
+
+users = Table(
+    "users", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("first", String),
+    Column("last", String),
+    Column("bio", String(200)),
+)
+teams = Table(
+    "teams", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("team_name", String),
+)
+
+CONFIG = literal_column("'simple'::regconfig")
+NAME = func.setweight(
+    func.to_tsvector(CONFIG, users.c.first.op("||")(literal_column("' '")).op("||")(users.c.last)),
+    literal_column("'A'"))
+ABOUT = func.setweight(
+    func.to_tsvector(CONFIG, func.coalesce(users.c.bio, literal_column("''"))), literal_column("'B'"))
+
+INDEXES = (
+    Index("ix_users_search", NAME.op("||")(ABOUT), postgresql_using="gin"),
+    Index("ix_teams_search", func.to_tsvector(CONFIG, teams.c.team_name), postgresql_using="gin"),
+)
+
+# The FTS5 table of each table on SQLite, its columns and the bm25
+# weight of each column.
+FTS_TABLES = {
+    "users": ("users_fts", {"first": 10.0, "last": 10.0, "bio": 1.0}),
+    "teams": ("teams_fts", {"team_name": 1.0}),
+}
+
+
+def fts_statements(table_name, fts, weights):
+    columns = ", ".join(weights)
+    new = ", ".join(f"new.{column}" for column in weights)
+    old = ", ".join(f"old.{column}" for column in weights)
+    delete = f"INSERT INTO {fts}({fts}, rowid, {columns}) VALUES ('delete', old.id, {old});"
+    insert = f"INSERT INTO {fts}(rowid, {columns}) VALUES (new.id, {new});"
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({columns}, content='{table_name}', "
+        f"content_rowid='id', prefix='2 3', tokenize='unicode61 remove_diacritics 2')",
+        f"INSERT INTO {fts}({fts}, rank) VALUES ('rank', 'bm25({', '.join(map(str, weights.values()))})')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {table_name} BEGIN {insert} END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {table_name} BEGIN {delete} END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE OF {columns} ON {table_name} "
+        f"BEGIN {delete} {insert} END",
+        f"INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+    ]
+
+
+def upgrade(connection):
+    if connection.dialect.name == "sqlite":
+        for table_name, (fts, weights) in FTS_TABLES.items():
+            for statement in fts_statements(table_name, fts, weights):
+                connection.exec_driver_sql(statement)
+        return
+    create_indexes(connection, *INDEXES)
+
+
+def downgrade(connection):
+    if connection.dialect.name == "sqlite":
+        for fts, weights in FTS_TABLES.values():
+            for trigger in ("insert", "delete", "update"):
+                connection.exec_driver_sql(f"DROP TRIGGER IF EXISTS {fts}_{trigger}")
+            connection.exec_driver_sql(f"DROP TABLE IF EXISTS {fts}")
+        return
+    drop_indexes(connection, *INDEXES)
@@ -0,0 +1,32 @@
+from sqlalchemy import Column, Integer, MetaData, Table, func, select, text, update
+from migrations.ops import add_column, drop_column
+
+
+# The roster_size counter of each team, counted from its users.
+revision = "0007"
+description = "Add teams.roster_size"
+
+metadata = MetaData()
+
+teams = Table(
+    "teams", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("roster_size", Integer, server_default=text("0"), nullable=False),
+)
+users = Table(
+    "users", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("team_id", Integer),
+)
+
+RECOUNT = update(teams).values(
+    roster_size=select(func.count()).where(users.c.team_id == teams.c.id).scalar_subquery())
+
+
+def upgrade(connection):
+    add_column(connection, teams.c.roster_size)
+    connection.execute(RECOUNT)
+
+
+def downgrade(connection):
+    drop_column(connection, teams.c.roster_size)
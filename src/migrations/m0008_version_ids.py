@@ -0,0 +1,25 @@
+from sqlalchemy import Column, Integer, MetaData, Table, text
+from migrations.ops import add_column, drop_column
+
+
+# The version_id columns that optimistic concurrency control checks
+# on every update (see etags.py). Existing rows start at version 1.
+revision = "0008"
+description = "Add version_id to teams, users and leagues"
+
+metadata = MetaData()
+
+TABLES = tuple(
+    Table(name, metadata, Column("version_id", Integer, server_default=text("1"), nullable=False))
+    for name in ("teams", "users", "leagues")
+)
+
+
+def upgrade(connection):
+    for table in TABLES:
+        add_column(connection, table.c.version_id)
+
+
+def downgrade(connection):
+    for table in TABLES:
+        drop_column(connection, table.c.version_id)
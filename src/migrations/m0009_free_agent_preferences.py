@@ -0,0 +1,29 @@
+from sqlalchemy import Column, ForeignKey, Integer, MetaData, Table
+from migrations.ops import add_column, drop_column, referenced
+
+
+# The sport and league a free agent wants to play in, which the free
+# agent search and the team builder pool them by.
+revision = "0009"
+description = "Add users.sport_id and users.league_id"
+
+metadata = MetaData()
+referenced(metadata, "sports", "leagues")
+
+users = Table(
+    "users", metadata,
+    Column("sport_id", Integer, ForeignKey("sports.id", ondelete="SET NULL")),
+    Column("league_id", Integer, ForeignKey("leagues.id", ondelete="SET NULL")),
+)
+
+COLUMNS = (users.c.sport_id, users.c.league_id)
+
+
+def upgrade(connection):
+    for column in COLUMNS:
+        add_column(connection, column)
+
+
+def downgrade(connection):
+    for column in reversed(COLUMNS):
+        drop_column(connection, column)
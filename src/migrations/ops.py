@@ -0,0 +1,61 @@
+from sqlalchemy import Column, Integer, Table, inspect, text
+from sqlalchemy.schema import CreateColumn
+
+
+# Helpers shared by the migration modules. Each migration spells out
+# the tables, columns and indexes it adds in its own MetaData, as
+# they were when it was written, so later changes to the models
+# never change what an old migration does. Every helper checks the
+# live database first, so a migration can run safely against a
+# database that was built by "flask db create" before migrations
+# existed.
+def create_tables(connection, *tables):
+    for table in tables:
+        table.create(connection, checkfirst=True)
+
+
+def drop_tables(connection, *tables):
+    for table in reversed(tables):
+        table.drop(connection, checkfirst=True)
+
+
+# referenced declares the tables a migration's foreign keys point at,
+# with just their id, so the keys can be resolved without describing
+# the rest of those tables.
+def referenced(metadata, *names):
+    for name in names:
+        Table(name, metadata, Column("id", Integer, primary_key=True))
+
+
+def create_indexes(connection, *indexes):
+    for index in indexes:
+        index.create(connection, checkfirst=True)
+
+
+def drop_indexes(connection, *indexes):
+    for index in indexes:
+        index.drop(connection, checkfirst=True)
+
+
+def has_column(connection, table_name, column_name):
+    return any(column["name"] == column_name for column in inspect(connection).get_columns(table_name))
+
+
+# add_column adds a column of a migration's table to the live table.
+# A foreign key is added with the column, as SQLite can't add one to
+# an existing column.
+def add_column(connection, column):
+    table_name = column.table.name
+    if not has_column(connection, table_name, column.name):
+        ddl = str(CreateColumn(column).compile(dialect=connection.dialect))
+        for key in column.foreign_keys:
+            ddl += f" REFERENCES {key.column.table.name} ({key.column.name})"
+            if key.ondelete:
+                ddl += f" ON DELETE {key.ondelete}"
+        connection.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {ddl}"))
+
+
+def drop_column(connection, column):
+    table_name = column.table.name
+    if has_column(connection, table_name, column.name):
+        connection.execute(text(f"ALTER TABLE {table_name} DROP COLUMN {column.name}"))
@@ -15,15 +15,20 @@ class League(db.Model):
     name = db.Column(db.String)
     start_date = db.Column(db.Date())
     end_date = db.Column(db.Date())
+    # version_id goes up with every update, which only applies if it
+    # still has the value that was read (see etags.py).
+    version_id = db.Column(db.Integer, default=1, server_default=db.text("1"), nullable=False)
 
 
     teams = db.relationship("Team", back_populates="league_id")
 
     # Foreign Key - establishes a relationship at the database level
-    sport = db.Column(db.Integer, db.ForeignKey("sports.id"), nullable=False) # Foreign Key
+    sport = db.Column(db.Integer, db.ForeignKey("sports.id"), nullable=False, index=True) # Foreign Key
     # SQLAlchemy relationship - nests an instance of a related model
     sport_id = db.relationship("Sport", back_populates="leagues")
 
+    __mapper_args__ = {"version_id_col": version_id}
+
 
 # In the LeagueSchema class, all of the fields are defined.
 # This allows client routes to verify the field names. 
@@ -0,0 +1,91 @@
+from setup import db, ma
+from datetime import datetime
+from marshmallow import fields
+from marshmallow.validate import Range
+
+
+# The Match model is one fixture of a league: the two teams, the
+# round, and when and in which venue slot it is played. The score
+# columns hold the match's current result and are empty until one
+# is recorded. "result_id" points at the results row that score came
+# from. It isn't a foreign key because results already reference
+# matches, and recording a result only succeeds if result_id is
+# still the one the request read, so two concurrent corrections of
+# the same match can't both be counted.
+class Match(db.Model):
+    __tablename__ = "matches"
+
+    id = db.Column(db.Integer, primary_key=True, nullable=False, unique=True)
+
+    league = db.Column(db.Integer, db.ForeignKey("leagues.id"), nullable=False, index=True)
+    round = db.Column(db.Integer)
+    date = db.Column(db.Date)
+    slot = db.Column(db.Integer)
+    home_team = db.Column(db.Integer, db.ForeignKey("teams.id"), nullable=False, index=True)
+    away_team = db.Column(db.Integer, db.ForeignKey("teams.id"), nullable=False, index=True)
+    home_score = db.Column(db.Integer)
+    away_score = db.Column(db.Integer)
+    result_id = db.Column(db.Integer)
+
+
+# The Result model is the append-only ledger of scores. Recording or
+# correcting a score adds a row and never changes an old one, so the
+# ledger is the audit trail of every result, and the latest row of
+# each match is its current score. Team points, wins, losses and
+# draws are totals over those current scores. recorded_by keeps the
+# user's id even if the user is later deleted.
+class Result(db.Model):
+    __tablename__ = "results"
+
+    id = db.Column(db.Integer, primary_key=True, nullable=False, unique=True)
+
+    match_id = db.Column(db.Integer, db.ForeignKey("matches.id"), nullable=False)
+    home_score = db.Column(db.Integer, nullable=False)
+    away_score = db.Column(db.Integer, nullable=False)
+    recorded_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    recorded_by = db.Column(db.Integer)
+
+    # A match's results are read newest first
+    __table_args__ = (
+        db.Index("ix_results_match_id_id", "match_id", "id"),
+    )
+
+
+class MatchSchema(ma.Schema):
+
+    league = fields.Integer(required=True)
+    round = fields.Integer(validate=Range(min=1))
+    date = fields.Date()
+    slot = fields.Integer(validate=Range(min=0))
+    home_team = fields.Integer(required=True)
+    away_team = fields.Integer(required=True)
+    home_score = fields.Integer()
+    away_score = fields.Integer()
+
+    class Meta:
+        fields = ("id", "league", "round", "date", "slot", "home_team",
+                  "away_team", "home_score", "away_score")
+
+
+class ResultSchema(ma.Schema):
+
+    home_score = fields.Integer(required=True, validate=Range(min=0))
+    away_score = fields.Integer(required=True, validate=Range(min=0))
+    recorded_at = fields.DateTime()
+
+    class Meta:
+        fields = ("id", "match_id", "home_score", "away_score", "recorded_at", "recorded_by")
+
+
+# FixtureOptionsSchema is the body of the fixture generating routes.
+# "legs" is how many times each pair of teams meets, and the season
+# is played every "interval_days" from the league's start date, with
+# at most "slots_per_night" matches a night (no limit if left out).
+# Nothing is played on the blackout dates.
+class FixtureOptionsSchema(ma.Schema):
+
+    legs = fields.Integer(load_default=1, validate=Range(min=1, max=4))
+    slots_per_night = fields.Integer(validate=Range(min=1))
+    interval_days = fields.Integer(load_default=7, validate=Range(min=1, max=28))
+    blackout_dates = fields.List(fields.Date(), load_default=list)
+    replace = fields.Boolean(load_default=False)
@@ -0,0 +1,13 @@
+from setup import db
+from datetime import datetime
+
+
+# The Migration model records which schema migrations have been
+# applied to the database. "flask db upgrade" runs every migration
+# in migrations/ that isn't listed here, and "flask db downgrade"
+# reverts them in reverse order.
+class Migration(db.Model):
+    __tablename__ = "schema_migrations"
+
+    revision = db.Column(db.String, primary_key=True, nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
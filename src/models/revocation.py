@@ -0,0 +1,22 @@
+from setup import db
+
+
+# The Revocation model is the table behind the token deny list (see
+# revocation.py). A row either revokes one token, by its "jti", or
+# every token of a user issued up to "revoked_at", when "user_id" is
+# set instead. "expires_at" is when the revoked tokens would have
+# expired anyway, after which the row no longer matters.
+class Revocation(db.Model):
+    __tablename__ = "revocations"
+
+    id = db.Column(db.Integer, primary_key=True, nullable=False, unique=True)
+
+    jti = db.Column(db.String(36))
+    user_id = db.Column(db.Integer)
+    revoked_at = db.Column(db.DateTime, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+    # Workers read the rows revoked since their last refresh
+    __table_args__ = (
+        db.Index("ix_revocations_revoked_at", "revoked_at"),
+    )
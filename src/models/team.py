@@ -1,7 +1,13 @@
 from setup import db, ma 
 from datetime import date 
-from marshmallow import fields
-from marshmallow.validate import Length, Regexp, And
+from marshmallow import fields, EXCLUDE
+from marshmallow.validate import Length, Regexp, And, Range
+
+
+# team_search_document is a team's full-text document on PostgreSQL.
+# Like user_search_document, it is the exact expression of the index.
+def team_search_document(team_name):
+    return db.func.to_tsvector(db.literal_column("'simple'::regconfig"), team_name)
 
 
 # The Team model contains the fields "id", "team_name",
@@ -12,25 +18,50 @@ from marshmallow.validate import Length, Regexp, And
 # dictate the positions of each team.
 # "win", "loss" and "draw" record the team wins record.
 # THe final field is a foreign key for the assigned league 
+# The "Free Agents" team created by the seed command holds every
+# player who hasn't joined a real team yet.
+FREE_AGENTS_TEAM_ID = 1
+
+
+
 class Team(db.Model):
     __tablename__ = "teams"
 
     id = db.Column(db.Integer, primary_key=True, nullable=False, unique=True)
 
-    team_name = db.Column(db.String, default="Team Name", nullable=False, unique=True)
+    # team_name is indexed because the teams list is sorted and
+    # paginated on it.
+    team_name = db.Column(db.String, default="Team Name", nullable=False, unique=True, index=True)
     date_created = db.Column(db.Date, default=date.today(), nullable=False)
     points = db.Column(db.Integer, default=0)
     win = db.Column(db.Integer, default=0)
     loss = db.Column(db.Integer, default=0)
     draw = db.Column(db.Integer, default=0)
+    # roster_size counts the users on the team. It is kept up to date
+    # by rosters.py as players join and leave, so a team's size is
+    # known without loading its users.
+    roster_size = db.Column(db.Integer, default=0, server_default=db.text("0"), nullable=False)
+    # version_id counts the changes to the team's details (roster_size
+    # changes don't count). SQLAlchemy checks it in the WHERE clause of
+    # every update of the row, so two edits made from the same copy of
+    # the team can't overwrite each other.
+    version_id = db.Column(db.Integer, default=1, server_default=db.text("1"), nullable=False)
     
     # The relationship with the User model is made, then
     # backpopulates the "team" relationship.
     users = db.relationship("User", back_populates="team")
 
-    league = db.Column(db.Integer, db.ForeignKey("leagues.id")) #Foreign Key
+    league = db.Column(db.Integer, db.ForeignKey("leagues.id"), index=True) #Foreign Key
     league_id = db.relationship("League", back_populates="teams") 
 
+    # GET /search uses a GIN index of the team names' full-text
+    # documents on PostgreSQL (an FTS5 table on SQLite, see search.py).
+    __table_args__ = (
+        db.Index("ix_teams_search", team_search_document(team_name),
+                 postgresql_using="gin").ddl_if(dialect="postgresql"),
+    )
+    __mapper_args__ = {"version_id_col": version_id}
+
 
 
 # The TeamSchema class is a Marshmallow schema that validates and serializes 
@@ -48,6 +79,7 @@ class TeamSchema(ma.Schema):
     win = fields.Integer()
     loss = fields.Integer()
     draw = fields.Integer()
+    roster_size = fields.Integer(dump_only=True)
 
     users = fields.List(fields.Nested("UserSchema", exclude=[
         "id", "dob", "team", "password", "date_created", "admin",
@@ -58,7 +90,7 @@ class TeamSchema(ma.Schema):
     class Meta:
         fields = (
             "id", "team_name", "date_created", "points", 
-            "win", "loss", "draw", "league_id", "users"
+            "win", "loss", "draw", "roster_size", "league_id", "users"
             )
         
 # The TeamInputSchema schema is almost identical to TeamSchema. The 
@@ -88,4 +120,38 @@ class TeamInputSchema(ma.Schema):
         fields = (
             "id", "team_name", "date_created", "points", 
             "win", "loss", "draw", "league", "users"
-            )
\ No newline at end of file
+            )
+
+# TeamBuildOptionsSchema is the body of POST /leagues/<id>/build. It
+# filters the free agents pool; only available players are used
+# unless "available" is sent. "seed" makes the proposal repeatable.
+class TeamBuildOptionsSchema(ma.Schema):
+
+    available = fields.Boolean(load_default=True, allow_none=True)
+    min_age = fields.Integer(validate=Range(min=0))
+    max_age = fields.Integer(validate=Range(min=0))
+    seed = fields.Integer(validate=Range(min=0))
+
+
+# BuiltTeamSchema is one team of a build proposal, as sent back to
+# POST /leagues/<id>/build/commit. Any other fields of the proposal
+# (the averages) are ignored.
+class BuiltTeamSchema(ma.Schema):
+
+    team_name = fields.String(
+        required=True,
+        validate=And(
+            Regexp("^[a-zA-Z ]+$", error="Must only contain letters and spaces."),
+            Length(min=3, max=20, error="Team name must be between 3 and 20 characters long")))
+    players = fields.List(fields.Integer(), required=True, validate=Length(min=1))
+
+    class Meta:
+        unknown = EXCLUDE
+
+
+class TeamBuildSchema(ma.Schema):
+
+    teams = fields.List(fields.Nested(BuiltTeamSchema), required=True, validate=Length(min=1))
+
+    class Meta:
+        unknown = EXCLUDE
@@ -1,8 +1,21 @@
 from setup import db, ma
 from datetime import date
-from marshmallow import fields
+from marshmallow import fields, EXCLUDE
 from marshmallow.validate import Length, Regexp, Range
 
+
+# user_search_document is a user's full-text document on PostgreSQL:
+# the name, weighted above the bio. The GIN index is built on this
+# expression and GET /search matches against the same one, so its
+# constants are SQL literals rather than bound parameters.
+def user_search_document(first, last, bio):
+    config = db.literal_column("'simple'::regconfig")
+    name = db.func.to_tsvector(config, first.op("||")(db.literal_column("' '")).op("||")(last))
+    about = db.func.to_tsvector(config, db.func.coalesce(bio, db.literal_column("''")))
+    return db.func.setweight(name, db.literal_column("'A'")).op("||")(
+        db.func.setweight(about, db.literal_column("'B'")))
+
+
 # User model is defined with fields for id, admin,
 # captain, date_created, first, last, dob, email, 
 # password, bio, available, phone, and team_id.
@@ -17,6 +30,11 @@ from marshmallow.validate import Length, Regexp, Range
 # Because of the social aspect of the app,
 # a bio is included where users can let others
 # know a little about themselves.
+# "skill" is an optional rating from 0 to 10 that the
+# team builder balances teams on. Free agents can say which sport,
+# and optionally which league, they want to play in with "sport_id"
+# and "league_id", which is where the free agent search and the
+# team builder look for them. A league's sport wins over sport_id.
 class User(db.Model):
     __tablename__ = "users"
 
@@ -33,11 +51,30 @@ class User(db.Model):
     bio = db.Column(db.String(200), default="Introduce yourself")
     available = db.Column(db.Boolean, default=True)
     phone = db.Column(db.BigInteger())
+    skill = db.Column(db.Float)
+    # version_id is the user's ETag, checked against If-Match by
+    # PUT /users/<id> (see etags.py), and goes up with every update.
+    version_id = db.Column(db.Integer, default=1, server_default=db.text("1"), nullable=False)
 
-    team_id = db.Column(db.Integer, db.ForeignKey("teams.id"))
+    team_id = db.Column(db.Integer, db.ForeignKey("teams.id"), index=True)
     #SQLAlchemy is used to access an instance of the Team model
     team = db.relationship("Team", back_populates="users") 
 
+    sport_id = db.Column(db.Integer, db.ForeignKey("sports.id", ondelete="SET NULL"))
+    league_id = db.Column(db.Integer, db.ForeignKey("leagues.id", ondelete="SET NULL"))
+
+    # The captains list filters on captain and pages by id, and the
+    # free agents search filters on team_id and captain together.
+    # GET /search uses a GIN index of the users' full-text documents
+    # on PostgreSQL (SQLite gets an FTS5 table instead, see search.py).
+    __table_args__ = (
+        db.Index("ix_users_captain_id", "captain", "id"),
+        db.Index("ix_users_free_agents", "team_id", "captain"),
+        db.Index("ix_users_search", user_search_document(first, last, bio),
+                 postgresql_using="gin").ddl_if(dialect="postgresql"),
+    )
+    __mapper_args__ = {"version_id_col": version_id}
+
 
 # The UserSchema class is a Marshmallow schema designed for user 
 # data validation and serialization. It includes fields for 
@@ -65,6 +102,7 @@ class UserSchema(ma.Schema):
     
     available = fields.Boolean()
     phone = fields.Integer()
+    skill = fields.Float(allow_none=True, validate=Range(min=0, max=10))
     email = fields.Email()
     
     password = fields.String(
@@ -77,11 +115,13 @@ class UserSchema(ma.Schema):
     # Here the "team" db.relationship needs to be defined so that
     # marshmallow can nest the data.
     team = fields.Nested("TeamSchema", exclude=["date_created", "win", "loss", "draw"])
+    sport_id = fields.Integer(allow_none=True)
+    league_id = fields.Integer(allow_none=True)
 
     class Meta:
         fields = ("id", "admin", "captain", "date_created",
                   "first", "last", "dob", "email", "password",
-                  "bio", "available", "phone", "team")
+                  "bio", "available", "phone", "skill", "team", "sport_id", "league_id")
         
 
 class UserInputSchema(ma.Schema):
@@ -97,6 +137,7 @@ class UserInputSchema(ma.Schema):
     bio = fields.String()
     available = fields.Boolean()
     phone = fields.Integer()
+    skill = fields.Float(allow_none=True, validate=Range(min=0, max=10))
     email = fields.Email()
     password = fields.String(
         validate=[Length(min=6, max=12), 
@@ -106,6 +147,8 @@ class UserInputSchema(ma.Schema):
         ])
     
     team_id = fields.Integer()
+    sport_id = fields.Integer(allow_none=True)
+    league_id = fields.Integer(allow_none=True)
 
     # Here the "team" db.relationship needs to be defined so that
     # marshmallow can nest the data.
@@ -114,5 +157,21 @@ class UserInputSchema(ma.Schema):
     class Meta:
         fields = ("id", "admin", "captain", "date_created",
                   "first", "last", "dob", "email", "password",
-                  "bio", "available", "phone", "team_id")
+                  "bio", "available", "phone", "skill", "team_id", "sport_id", "league_id")
         
+
+
+# FreeAgentSearchSchema validates the query string of the free agents
+# search. Every filter is optional, and the pagination arguments are
+# left for the pagination helpers.
+class FreeAgentSearchSchema(ma.Schema):
+
+    available = fields.Boolean()
+    sport = fields.Integer()
+    league = fields.Integer()
+    min_age = fields.Integer(validate=Range(min=0))
+    max_age = fields.Integer(validate=Range(min=0))
+
+    class Meta:
+        unknown = EXCLUDE
+        fields = ("available", "sport", "league", "min_age", "max_age")
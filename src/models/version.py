@@ -0,0 +1,14 @@
+from setup import db
+
+
+# The Version model stores a counter for every cached document the
+# API serves, such as "league:3" or "team:12". Write routes bump
+# the counters of the documents they change in the same transaction
+# as the change, and the GET routes build their ETags from them.
+# Keeping the counters in the database means every worker process
+# hands out the same ETag for the same data.
+class Version(db.Model):
+    __tablename__ = "versions"
+
+    key = db.Column(db.String, primary_key=True, nullable=False)
+    version = db.Column(db.Integer, default=0, nullable=False)
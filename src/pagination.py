@@ -0,0 +1,94 @@
+import base64
+import json
+from datetime import date, datetime
+from flask import abort, request
+from setup import db
+
+
+# The pagination module holds the helpers that let list routes
+# return their rows one page at a time. Instead of OFFSET, which
+# makes the database walk past every skipped row, the routes use
+# keyset pagination. The last row of a page is encoded into an
+# opaque "next" cursor, and the following page starts directly
+# after it with a WHERE clause the index can seek to.
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+
+# encode_cursor packs the sort key values of the last row on a
+# page into a url safe string. Clients should treat the cursor as
+# opaque and simply pass it back as "?after=".
+def encode_cursor(values):
+    raw = json.dumps(list(values), default=str, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf8")).decode("ascii").rstrip("=")
+
+
+# cursor_value checks one value of a cursor against the Python type
+# of its sort key. Dates were encoded as ISO strings and are parsed
+# back, and whole numbers are accepted for floats, as JSON doesn't
+# keep them apart. Integers must fit in a BIGINT. Anything else
+# raises ValueError.
+def cursor_value(value, python_type):
+    if python_type in (date, datetime) and isinstance(value, str):
+        return python_type.fromisoformat(value)
+    if python_type is float and type(value) is int:
+        return float(value)
+    if type(value) is not python_type:
+        raise ValueError(f"Expected {python_type.__name__}")
+    if python_type is int and not -2 ** 63 <= value < 2 ** 63:
+        raise ValueError("Out of range")
+    return value
+
+
+# decode_cursor reverses encode_cursor, given the Python type of each
+# sort key. A cursor that has been tampered with, or that was made
+# for a different sort order, aborts the request with a 400 instead
+# of reaching the database and raising a 500.
+def decode_cursor(cursor, *types):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if not isinstance(values, list) or len(values) != len(types):
+            raise ValueError("Wrong number of values")
+        return [cursor_value(value, python_type) for value, python_type in zip(values, types)]
+    except (ValueError, TypeError):
+        abort(400, description="Invalid cursor")
+
+
+# page_limit reads "?limit=" from the query string and clamps it
+# between 1 and MAX_LIMIT so a client can't ask for the whole table.
+def page_limit():
+    limit = request.args.get("limit", DEFAULT_LIMIT, type=int)
+    return max(1, min(limit, MAX_LIMIT))
+
+
+# page_statement orders the statement by the given columns, which
+# must together be unique (the primary key is always the last one),
+# and applies the "?after=" cursor and "?limit=". One extra row is
+# fetched so we know whether another page exists without running a
+# separate COUNT query.
+def page_statement(stmt, *columns):
+    limit = page_limit()
+    after = request.args.get("after")
+    if after:
+        values = decode_cursor(after, *[column.type.python_type for column in columns])
+        stmt = stmt.where(db.tuple_(*columns) > db.tuple_(*values))
+    return stmt.order_by(*[column.asc() for column in columns]).limit(limit + 1), limit
+
+
+# page_rows trims the extra row off and builds the cursor for the
+# next page from the last row that is returned.
+def page_rows(rows, limit, *columns):
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(getattr(rows[-1], column.key) for column in columns)
+    return rows, next_cursor
+
+
+# paginate returns one page of rows from the statement along with
+# the cursor for the next page. The async routes in asgi.py run the
+# two halves around their own session.
+def paginate(stmt, *columns):
+    stmt, limit = page_statement(stmt, *columns)
+    return page_rows(db.session.scalars(stmt).all(), limit, *columns)
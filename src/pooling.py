@@ -0,0 +1,112 @@
+import threading
+import time
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+
+
+# The pooling module builds SQLALCHEMY_ENGINE_OPTIONS from the
+# environment and records how the connection pool is used, so the
+# pool can be sized for the number of workers instead of guessed.
+# Each variable is optional; unset ones keep SQLAlchemy's defaults.
+#
+#   DB_POOL_SIZE          connections kept open by each process
+#   DB_MAX_OVERFLOW       extra connections allowed under load
+#   DB_POOL_TIMEOUT       seconds to wait for a free connection
+#   DB_POOL_RECYCLE       seconds before a connection is replaced
+#   DB_POOL_PRE_PING      test connections before handing them out
+#   DB_STATEMENT_TIMEOUT  milliseconds before PostgreSQL cancels a
+#                         statement
+POOL_SETTINGS = {
+    "DB_POOL_SIZE": "pool_size",
+    "DB_MAX_OVERFLOW": "max_overflow",
+    "DB_POOL_TIMEOUT": "pool_timeout",
+    "DB_POOL_RECYCLE": "pool_recycle",
+}
+
+
+# TimedQueuePool is a QueuePool that counts checkouts and measures
+# how long each one waited for a connection. A long or growing wait
+# means requests are queueing for the pool rather than the database.
+class TimedQueuePool(QueuePool):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeout:
+            with self._stats_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            with self._stats_lock:
+                self.checkouts += 1
+                self.wait_total += waited
+                self.wait_max = max(self.wait_max, waited)
+
+    def stats(self):
+        with self._stats_lock:
+            checkouts, timeouts = self.checkouts, self.timeouts
+            wait_total, wait_max = self.wait_total, self.wait_max
+        return {
+            "size": self.size(),
+            "checked_out": self.checkedout(),
+            "checked_in": self.checkedin(),
+            "overflow": max(self.overflow(), 0),
+            "max_overflow": self._max_overflow,
+            "checkouts": checkouts,
+            "timeouts": timeouts,
+            "wait_total_ms": round(wait_total * 1000, 3),
+            "wait_avg_ms": round(wait_total * 1000 / checkouts, 3) if checkouts else 0.0,
+            "wait_max_ms": round(wait_max * 1000, 3),
+        }
+
+
+# engine_options returns the SQLALCHEMY_ENGINE_OPTIONS for a
+# database URI. In-memory SQLite keeps Flask-SQLAlchemy's single
+# shared connection, as a pool of them would each see an empty
+# database.
+def engine_options(uri, environ):
+    options = {}
+    uri = uri or ""
+    if uri.startswith("sqlite") and (":memory:" in uri or uri.rstrip("/") == "sqlite:"):
+        return options
+
+    options["poolclass"] = TimedQueuePool
+    for key, option in POOL_SETTINGS.items():
+        if environ.get(key):
+            options[option] = int(environ[key])
+    if environ.get("DB_POOL_PRE_PING"):
+        options["pool_pre_ping"] = environ["DB_POOL_PRE_PING"].lower() in ("1", "true", "yes")
+
+    # The statement timeout is set for every session when PostgreSQL
+    # accepts the connection, so it also covers CLI commands.
+    if environ.get("DB_STATEMENT_TIMEOUT") and uri.startswith("postgres"):
+        options["connect_args"] = {"options": f"-c statement_timeout={int(environ['DB_STATEMENT_TIMEOUT'])}"}
+    return options
+
+
+# pool_stats describes the pool of an engine. Pools other than
+# TimedQueuePool only report what SQLAlchemy itself tracks.
+def pool_stats(engine):
+    pool = engine.pool
+    if isinstance(pool, TimedQueuePool):
+        stats = pool.stats()
+    elif isinstance(pool, QueuePool):
+        stats = {
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": max(pool.overflow(), 0),
+        }
+    else:
+        stats = {}
+    stats["class"] = type(pool).__name__
+    return stats
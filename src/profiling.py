@@ -0,0 +1,132 @@
+import re
+import threading
+from time import perf_counter
+from flask import current_app, g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+# The profiling module is a development and staging aid, switched on
+# with SQL_PROFILE. Every statement a request runs is timed and
+# grouped by its shape: the SQL with whitespace collapsed and any
+# list of bound parameters, such as an IN (...) list, reduced to one.
+# Each response gets X-Query-Count and X-DB-Time (milliseconds)
+# headers, and a SELECT shape that runs more than SQL_PROFILE_REPEAT
+# times in one request (the N+1 pattern of a lazy loaded
+# relationship) is logged as a warning.
+#
+# The requests are also added up per route in a report, served by
+# GET /admin/profile and written by "flask db profile". The report
+# holds the most times each statement shape ran in one request, so
+# two releases' reports can be diffed to see which routes gained
+# queries.
+DEFAULT_REPEAT = 5
+
+PARAMETER = r"(?:\?|%s|%\(\w+\)s|\$\d+|:\w+)"
+PARAMETER_LIST = re.compile(rf"\(\s*{PARAMETER}(?:\s*,\s*{PARAMETER})*\s*\)")
+WHITESPACE = re.compile(r"\s+")
+
+
+def statement_shape(statement):
+    return PARAMETER_LIST.sub("(?)", WHITESPACE.sub(" ", statement).strip())
+
+
+def is_select(shape):
+    return shape.startswith(("SELECT", "WITH"))
+
+
+class RouteReport:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+
+    def add(self, endpoint, statements, repeated):
+        queries = sum(count for count, _ in statements.values())
+        seconds = sum(seconds for _, seconds in statements.values())
+        with self._lock:
+            route = self._routes.setdefault(endpoint, {
+                "requests": 0, "queries": 0, "db_seconds": 0.0, "max_queries": 0,
+                "statements": {}, "repeated": set(),
+            })
+            route["requests"] += 1
+            route["queries"] += queries
+            route["db_seconds"] += seconds
+            route["max_queries"] = max(route["max_queries"], queries)
+            for shape, (count, _) in statements.items():
+                route["statements"][shape] = max(route["statements"].get(shape, 0), count)
+            route["repeated"].update(repeated)
+
+    def clear(self):
+        with self._lock:
+            self._routes = {}
+
+    # as_dict returns the report in a stable order, ready to be
+    # written as JSON and diffed.
+    def as_dict(self):
+        with self._lock:
+            return {
+                endpoint: {
+                    "requests": route["requests"],
+                    "queries_per_request": round(route["queries"] / route["requests"], 2),
+                    "max_queries": route["max_queries"],
+                    "db_ms_per_request": round(route["db_seconds"] * 1000 / route["requests"], 3),
+                    "statements": dict(sorted(route["statements"].items())),
+                    "repeated": sorted(route["repeated"]),
+                }
+                for endpoint, route in sorted(self._routes.items())
+            }
+
+
+report = RouteReport()
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._profile_start = perf_counter()
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, "_profile_start", None)
+    statements = g.get("sql_profile") if start is not None else None
+    if statements is not None:
+        entry = statements.setdefault(statement_shape(statement), [0, 0.0])
+        entry[0] += 1
+        entry[1] += perf_counter() - start
+
+
+def listen():
+    if not event.contains(Engine, "after_cursor_execute", after_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", after_cursor_execute)
+
+
+def before_request():
+    if current_app.config["SQL_PROFILE"]:
+        listen()
+        g.sql_profile = {}
+
+
+def after_request(response):
+    statements = g.pop("sql_profile", None)
+    if statements is None:
+        return response
+    endpoint = request.endpoint or "unmatched"
+    limit = current_app.config["SQL_PROFILE_REPEAT"]
+    repeated = [shape for shape, (count, _) in statements.items() if count > limit and is_select(shape)]
+    for shape in repeated:
+        current_app.logger.warning(
+            "Possible N+1 in %s %s: ran %d times: %s",
+            request.method, endpoint, statements[shape][0], shape)
+    report.add(endpoint, statements, repeated)
+    response.headers["X-Query-Count"] = str(sum(count for count, _ in statements.values()))
+    response.headers["X-DB-Time"] = f"{sum(seconds for _, seconds in statements.values()) * 1000:.3f}"
+    return response
+
+
+# init_app registers the request hooks. They do nothing until
+# SQL_PROFILE is set, and the engine events are only attached once
+# it is, so production requests don't pay for them.
+def init_app(app):
+    app.config.setdefault("SQL_PROFILE", False)
+    app.config.setdefault("SQL_PROFILE_REPEAT", DEFAULT_REPEAT)
+    app.before_request(before_request)
+    app.after_request(after_request)
@@ -0,0 +1,71 @@
+import json
+from setup import db
+from models.user import User
+from models.team import Team
+from models.league import League
+from models.sport import Sport
+from models.version import Version
+from matching import index_statement
+
+
+# query_plans checks that the queries behind each endpoint can use an
+# index. ENDPOINT_QUERIES mirrors the statements the blueprints run,
+# including the eager loads, and the free agent index is built with
+# matching.index_statement itself. "flask db explain" asks the database to
+# EXPLAIN each one and reports any full table scan of a table holding
+# more than a given number of rows.
+def endpoint_queries():
+    return {
+        "GET /teams": db.select(Team).order_by(Team.team_name, Team.id).limit(51),
+        "GET /teams?after=": db.select(Team)
+            .where(db.tuple_(Team.team_name, Team.id) > db.tuple_("M", 1))
+            .order_by(Team.team_name, Team.id).limit(51),
+        "GET /teams/<id>": db.select(Team).where(Team.id == 2),
+        "GET /teams/<id> users": db.select(User).where(User.team_id.in_([2])),
+        "GET /leagues/<id>": db.select(League, Sport).join(Sport, League.sport == Sport.id).where(League.id == 1),
+        "GET /leagues/<id> teams": db.select(Team).where(Team.league.in_([1])),
+        "GET /sports/<id>": db.select(Sport).where(Sport.id == 1),
+        "GET /sports/<id> leagues": db.select(League).where(League.sport.in_([1])),
+        "GET /users/captains": db.select(User).where(User.captain).order_by(User.id).limit(51),
+        "GET /users/freeagents": index_statement(),
+        "GET /users/freeagents users": db.select(User).where(User.id.in_([2])),
+        "ETag lookup": db.select(Version.version).where(Version.key.in_(["team:1"])),
+    }
+
+
+def table_rows(connection, table_name):
+    return connection.execute(db.select(db.func.count()).select_from(db.table(table_name))).scalar()
+
+
+# scans returns the tables a statement reads with a full scan.
+def scans(connection, sql):
+    if connection.dialect.name == "postgresql":
+        plan = connection.execute(db.text(f"EXPLAIN (FORMAT JSON) {sql}")).scalar()
+        plan = json.loads(plan) if isinstance(plan, str) else plan
+        found = []
+        nodes = [plan[0]["Plan"]]
+        while nodes:
+            node = nodes.pop()
+            if node["Node Type"] == "Seq Scan":
+                found.append(node["Relation Name"])
+            nodes.extend(node.get("Plans", []))
+        return found
+    # SQLite reports "SCAN users" for a table scan, and "SEARCH" or
+    # "SCAN ... USING INDEX" when an index is used.
+    rows = connection.execute(db.text(f"EXPLAIN QUERY PLAN {sql}")).all()
+    return [row[-1].split()[1] for row in rows
+            if row[-1].startswith("SCAN ") and "USING" not in row[-1]]
+
+
+# check returns (endpoint, table, rows) for every sequential scan of
+# a table with more than min_rows rows.
+def check(min_rows):
+    problems = []
+    with db.engine.connect() as connection:
+        for endpoint, stmt in endpoint_queries().items():
+            sql = stmt.compile(dialect=connection.dialect, compile_kwargs={"literal_binds": True})
+            for table_name in scans(connection, str(sql)):
+                rows = table_rows(connection, table_name)
+                if rows > min_rows:
+                    problems.append((endpoint, table_name, rows))
+    return problems
@@ -0,0 +1,157 @@
+import threading
+import time
+from datetime import datetime, timezone
+from flask import current_app
+from models.revocation import Revocation
+from auth import TOKEN_LIFETIME
+from setup import db, jwt
+
+
+# The revocation module is the deny list checked on every JWT
+# request. POST /users/logout revokes one token by its "jti", and
+# POST /users/<id>/revoke, deleting a user or changing a user's
+# captain or team (which the token's claims carry) revokes every
+# token the user was issued until then. Revocations are written to
+# the revocations table, so every worker process sees them.
+#
+# Each process keeps the unexpired revocations in memory: a dict of
+# revoked jtis and a dict of user ids with the time their tokens
+# were revoked up to. Checking a token is a lookup in each, with no
+# query. The dicts are refreshed from the table at most once every
+# REVOCATION_REFRESH_SECONDS, reading only the rows revoked since
+# the last refresh, so a revocation made by another worker takes
+# effect within that time. Revocations made by this process are
+# added to the dicts straight away.
+#
+# A Bloom filter in front of the dicts wouldn't save anything here:
+# it would be hashed in Python on every request, while a dict lookup
+# already is a single hash of the jti.
+DEFAULT_REFRESH_SECONDS = 1.0
+
+# Rows are read from a little before the newest one already seen, so
+# a revocation whose transaction committed after a later one's is
+# still picked up.
+REFRESH_OVERLAP_SECONDS = 30
+
+# Expired entries are dropped from memory at most this often
+PRUNE_SECONDS = 60
+
+
+def utc_now():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def timestamp(value):
+    return value.replace(tzinfo=timezone.utc).timestamp()
+
+
+class DenyList:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._jtis = {}
+        self._users = {}
+        self._newest = None
+        self._refreshed = None
+        self._pruned = 0.0
+
+    # add applies revocation rows. A user's entry keeps the latest
+    # time their tokens were revoked up to, and its expiry.
+    def add(self, *revocations):
+        with self._lock:
+            for revocation in revocations:
+                expires = timestamp(revocation.expires_at)
+                if revocation.jti:
+                    self._jtis[revocation.jti] = expires
+                if revocation.user_id is not None:
+                    revoked = timestamp(revocation.revoked_at)
+                    current = self._users.get(revocation.user_id)
+                    if current is None or current[0] < revoked:
+                        self._users[revocation.user_id] = (revoked, expires)
+
+    # refresh reads the revocations since the last refresh on a
+    # connection of its own, so it runs outside the request's
+    # transaction and always on the primary. Only one thread
+    # refreshes at a time; the others check against the entries
+    # they already have.
+    def refresh(self):
+        interval = current_app.config.get("REVOCATION_REFRESH_SECONDS", DEFAULT_REFRESH_SECONDS)
+        if self._refreshed is not None and time.monotonic() - self._refreshed < interval:
+            return
+        if not self._lock.acquire(blocking=self._refreshed is None):
+            return
+        try:
+            if self._refreshed is not None and time.monotonic() - self._refreshed < interval:
+                return
+            now = utc_now()
+            stmt = db.select(Revocation.jti, Revocation.user_id, Revocation.revoked_at, Revocation.expires_at)
+            stmt = stmt.where(Revocation.expires_at > now)
+            if self._newest is not None:
+                since = datetime.fromtimestamp(self._newest - REFRESH_OVERLAP_SECONDS, timezone.utc)
+                stmt = stmt.where(Revocation.revoked_at >= since.replace(tzinfo=None))
+            with db.engine.connect() as connection:
+                rows = connection.execute(stmt).all()
+            self._refreshed = time.monotonic()
+        finally:
+            self._lock.release()
+
+        self.add(*rows)
+        with self._lock:
+            for row in rows:
+                self._newest = max(self._newest or 0.0, timestamp(row.revoked_at))
+            if time.monotonic() - self._pruned > PRUNE_SECONDS:
+                self.prune(timestamp(now))
+
+    def prune(self, now):
+        self._jtis = {jti: expires for jti, expires in self._jtis.items() if expires > now}
+        self._users = {user: entry for user, entry in self._users.items() if entry[1] > now}
+        self._pruned = time.monotonic()
+
+    # is_revoked checks a decoded token. A user's revocation covers
+    # the tokens issued up to it, by their "issued" claim (see
+    # auth.token_claims). Tokens from before that claim existed only
+    # have the whole seconds of "iat", so one issued in the same
+    # second as the revocation counts as revoked.
+    def is_revoked(self, payload):
+        self.refresh()
+        if payload.get("jti") in self._jtis:
+            return True
+        entry = self._users.get(payload.get("user_id"))
+        return entry is not None and payload.get("issued", payload.get("iat", 0)) <= entry[0]
+
+
+deny_list = DenyList()
+
+
+# revoke_token and revoke_user add a revocation to the session, to
+# be committed with the rest of the request's changes. Once it is
+# committed, pass the returned row to deny_list.add() so this process
+# stops accepting the tokens immediately.
+def revoke_token(payload):
+    now = utc_now()
+    expires_at = now + TOKEN_LIFETIME
+    if payload.get("exp"):
+        expires_at = datetime.fromtimestamp(payload["exp"], timezone.utc).replace(tzinfo=None)
+    revocation = Revocation(jti=payload["jti"], revoked_at=now, expires_at=expires_at)
+    db.session.add(revocation)
+    return revocation
+
+
+def revoke_user(user_id):
+    now = utc_now()
+    revocation = Revocation(user_id=user_id, revoked_at=now, expires_at=now + TOKEN_LIFETIME)
+    db.session.add(revocation)
+    return revocation
+
+
+def revoke_users(user_ids):
+    return [revoke_user(user_id) for user_id in user_ids]
+
+
+@jwt.token_in_blocklist_loader
+def token_revoked(jwt_header, jwt_payload):
+    return deny_list.is_revoked(jwt_payload)
+
+
+@jwt.revoked_token_loader
+def revoked_token_response(jwt_header, jwt_payload):
+    return {"error": "Token has been revoked"}, 401
@@ -0,0 +1,84 @@
+from collections import Counter
+from sqlalchemy import bindparam
+from models.league import League
+from models.sport import Sport
+from models.team import Team, FREE_AGENTS_TEAM_ID
+from models.user import User
+from setup import db
+
+
+# The rosters module keeps each team's roster_size, the number of
+# users on it, and stops players joining a team that already has its
+# sport's max_players. A move is applied to the counters in SQL, in
+# the same transaction as the change to the players' team_id, and a
+# team only takes players with an UPDATE whose WHERE clause checks
+# there is room. Concurrent joins of the same team queue on that one
+# row's lock, and each one sees the count the last one left, so the
+# last free places can't be taken twice however many requests race
+# for them. The Free Agents pool and teams without a league (so
+# without a sport) have no limit.
+teams = Team.__table__
+users = User.__table__
+
+
+# RosterFull is raised with the ids of the teams that didn't have
+# room for the players moving to them.
+class RosterFull(Exception):
+    def __init__(self, team_ids):
+        super().__init__(f"Teams are full: {', '.join(map(str, team_ids))}")
+        self.team_ids = team_ids
+
+
+# The max_players of a team's sport, or NULL for a team outside a
+# league.
+MAX_PLAYERS = (
+    db.select(Sport.max_players)
+    .join(League, League.sport == Sport.id)
+    .where(League.id == teams.c.league)
+    .scalar_subquery()
+)
+
+ADD_PLAYERS = teams.update().where(
+    teams.c.id == bindparam("team"),
+    db.or_(
+        teams.c.id == FREE_AGENTS_TEAM_ID,
+        MAX_PLAYERS.is_(None),
+        teams.c.roster_size + bindparam("change") <= MAX_PLAYERS,
+    ),
+).values(roster_size=teams.c.roster_size + bindparam("change"))
+
+REMOVE_PLAYERS = teams.update().where(teams.c.id == bindparam("team")).values(
+    roster_size=teams.c.roster_size + bindparam("change"))
+
+# RECOUNT sets every team's roster_size from its users, after seeding
+# or migrating.
+RECOUNT = teams.update().values(
+    roster_size=db.select(db.func.count()).where(users.c.team_id == teams.c.id).scalar_subquery())
+
+
+# move_players applies (old team, new team) moves to the counters,
+# either of which may be None. The moves are added up into one change
+# per team, and the teams are updated in id order so two requests
+# moving players between the same teams can't deadlock. If any team
+# is full, RosterFull is raised once every team has been tried, and
+# the caller rolls back.
+def move_players(moves):
+    changes = Counter()
+    for old, new in moves:
+        if old == new:
+            continue
+        if old is not None:
+            changes[old] -= 1
+        if new is not None:
+            changes[new] += 1
+
+    full = []
+    for team in sorted(changes):
+        change = changes[team]
+        if change > 0:
+            if not db.session.execute(ADD_PLAYERS, {"team": team, "change": change}).rowcount:
+                full.append(team)
+        elif change < 0:
+            db.session.execute(REMOVE_PLAYERS, {"team": team, "change": change})
+    if full:
+        raise RosterFull(full)
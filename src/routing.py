@@ -0,0 +1,104 @@
+import math
+import random
+import time
+from flask import current_app, g, has_request_context, request
+from flask_sqlalchemy.session import Session
+from pooling import engine_options
+
+
+# The routing module spreads reads across read replicas. Replicas
+# are listed in DB_REPLICA_URIS (comma separated) and become the
+# "replica0", "replica1", ... binds. GET and HEAD requests read from
+# one replica, picked per request, while every other request, every
+# write and every CLI command uses the primary DB_URI.
+#
+# Replicas lag behind the primary, so a client that has just written
+# something would otherwise not see it on its next read. After a
+# request commits a write, the response sets the PRIMARY_COOKIE
+# cookie to the time until which the client reads from the primary,
+# READ_YOUR_WRITES_SECONDS (default 5) from then. The client sends it
+# with its next requests, so whichever worker or host gets them
+# keeps it on the primary. The window should be longer than the
+# replicas' usual lag. A client can only send itself to the primary,
+# so the cookie isn't signed.
+REPLICA_PREFIX = "replica"
+PRIMARY_COOKIE = "read_primary_until"
+
+
+# replica_binds returns the SQLALCHEMY_BINDS for the replicas. Each
+# replica gets its own pool, configured like the primary's.
+def replica_binds(uris, environ):
+    uris = [uri.strip() for uri in (uris or "").split(",") if uri.strip()]
+    return {f"{REPLICA_PREFIX}{n}": dict(engine_options(uri, environ), url=uri) for n, uri in enumerate(uris)}
+
+
+def replica_keys(engines):
+    return [key for key in engines if key and key.startswith(REPLICA_PREFIX)]
+
+
+# wrote_recently tells whether the client of the current request
+# wrote within its read-your-writes window, from the cookie an
+# earlier write's response set.
+def wrote_recently():
+    try:
+        until = float(request.cookies.get(PRIMARY_COOKIE, 0))
+    except ValueError:
+        return False
+    return until > time.time()
+
+
+# after_request sets the cookie on the response of a request that
+# committed a write. It expires with the window, and the time in it
+# covers clients that keep cookies longer.
+def after_request(response):
+    until = g.get("read_primary_until")
+    if until is not None:
+        seconds = current_app.config.get("READ_YOUR_WRITES_SECONDS", 5)
+        response.set_cookie(PRIMARY_COOKIE, f"{until:.3f}", max_age=math.ceil(seconds),
+                            httponly=True, samesite="Lax")
+    return response
+
+
+def init_app(app):
+    app.after_request(after_request)
+
+
+# read_from_primary keeps the rest of a session's reads on the
+# primary. Caches that outlive the request, like the standings
+# tables, are built this way so replica lag isn't cached with them.
+def read_from_primary(session):
+    session.info["primary"] = True
+
+
+# RoutingSession is passed to SQLAlchemy() as the session class.
+# get_bind() is where Flask-SQLAlchemy picks an engine for each
+# statement, so the replica is chosen there. Anything that writes,
+# a flush or an INSERT/UPDATE/DELETE statement, goes to the primary
+# and keeps the rest of the session on the primary too.
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            if self._flushing or (clause is not None and clause.is_dml):
+                self.info["wrote"] = True
+            elif self._read_from_replica():
+                return self._db.engines[self.info["replica"]]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _read_from_replica(self):
+        if self.info.get("wrote") or self.info.get("primary") or not has_request_context():
+            return False
+        if request.method not in ("GET", "HEAD"):
+            return False
+        if "replica" not in self.info:
+            replicas = replica_keys(self._db.engines)
+            if not replicas or wrote_recently():
+                self.info["primary"] = True
+                return False
+            self.info["replica"] = random.choice(replicas)
+        return True
+
+    def commit(self):
+        wrote = self.info.get("wrote") or bool(self.new or self.dirty or self.deleted)
+        super().commit()
+        if wrote and has_request_context():
+            g.read_primary_until = time.time() + current_app.config.get("READ_YOUR_WRITES_SECONDS", 5)
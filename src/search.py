@@ -0,0 +1,122 @@
+import re
+from sqlalchemy import event
+from models.user import User, user_search_document
+from models.team import Team, team_search_document
+from setup import db
+
+
+# The search module backs GET /search, a full-text search of players
+# (first name, last name and bio) and team names. Every word of the
+# query must match, as a prefix of a word in the document, and the
+# results are ranked by relevance, a player's name counting for more
+# than their bio.
+#
+# On PostgreSQL the documents are tsvectors and each table has a GIN
+# index on its document expression (see the models), which
+# PostgreSQL keeps in step with every write itself. On SQLite, used
+# for local runs, each table has an FTS5 table with triggers that
+# copy every insert, update and delete across, created along with
+# the table by "flask db create" or by migration 0006.
+CONFIG = db.literal_column("'simple'::regconfig")
+
+# A query is at most this many words, each at most MAX_TERM_LENGTH
+# characters. Words shorter than MIN_PREFIX only match whole words,
+# as a one letter prefix matches most of the table.
+MAX_TERMS = 8
+MAX_TERM_LENGTH = 32
+MIN_PREFIX = 2
+
+TERM = re.compile(r"[^\W_]+")
+
+# The FTS5 table of each table, its columns and the bm25 weight of
+# each column.
+FTS_TABLES = {
+    "users": ("users_fts", {"first": 10.0, "last": 10.0, "bio": 1.0}),
+    "teams": ("teams_fts", {"team_name": 1.0}),
+}
+
+
+def query_terms(q):
+    return [term[:MAX_TERM_LENGTH] for term in TERM.findall((q or "").lower())][:MAX_TERMS]
+
+
+def fts_statements(table_name):
+    fts, weights = FTS_TABLES[table_name]
+    columns = ", ".join(weights)
+    new = ", ".join(f"new.{column}" for column in weights)
+    old = ", ".join(f"old.{column}" for column in weights)
+    delete = f"INSERT INTO {fts}({fts}, rowid, {columns}) VALUES ('delete', old.id, {old});"
+    insert = f"INSERT INTO {fts}(rowid, {columns}) VALUES (new.id, {new});"
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({columns}, content='{table_name}', "
+        f"content_rowid='id', prefix='2 3', tokenize='unicode61 remove_diacritics 2')",
+        f"INSERT INTO {fts}({fts}, rank) VALUES ('rank', 'bm25({', '.join(map(str, weights.values()))})')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {table_name} BEGIN {insert} END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {table_name} BEGIN {delete} END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE OF {columns} ON {table_name} "
+        f"BEGIN {delete} {insert} END",
+    ]
+
+
+# create_fts adds a table's FTS5 table and triggers, unless they
+# already exist. "rebuild" fills it from the rows already in the
+# table.
+def create_fts(connection, table_name, rebuild=False):
+    fts = FTS_TABLES[table_name][0]
+    for statement in fts_statements(table_name):
+        connection.exec_driver_sql(statement)
+    if rebuild:
+        connection.exec_driver_sql(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+def drop_fts(connection, table_name):
+    fts = FTS_TABLES[table_name][0]
+    for trigger in ("insert", "delete", "update"):
+        connection.exec_driver_sql(f"DROP TRIGGER IF EXISTS {fts}_{trigger}")
+    connection.exec_driver_sql(f"DROP TABLE IF EXISTS {fts}")
+
+
+def after_create(target, connection, **kw):
+    if connection.dialect.name == "sqlite":
+        create_fts(connection, target.name)
+
+
+def before_drop(target, connection, **kw):
+    if connection.dialect.name == "sqlite":
+        drop_fts(connection, target.name)
+
+
+for name in FTS_TABLES:
+    event.listen(db.metadata.tables[name], "after_create", after_create)
+    event.listen(db.metadata.tables[name], "before_drop", before_drop)
+
+
+def tsquery(terms):
+    return " & ".join(f"{term}:*" if len(term) >= MIN_PREFIX else term for term in terms)
+
+
+def fts_query(terms):
+    return " ".join(f'"{term}"*' if len(term) >= MIN_PREFIX else f'"{term}"' for term in terms)
+
+
+# ranked returns the ids and scores of the best matches of a table,
+# best first. Scores are higher for better matches on both
+# databases, but aren't comparable between them.
+def ranked(model, document, terms, limit):
+    if db.session.get_bind().dialect.name == "sqlite":
+        fts = FTS_TABLES[model.__tablename__][0]
+        stmt = db.text(
+            f"SELECT rowid, -rank FROM {fts} WHERE {fts} MATCH :match ORDER BY rank LIMIT :limit")
+        return db.session.execute(stmt, {"match": fts_query(terms), "limit": limit}).all()
+    query = db.func.to_tsquery(CONFIG, tsquery(terms))
+    rank = db.func.ts_rank(document, query)
+    stmt = db.select(model.id, rank).where(document.op("@@")(query)).order_by(rank.desc(), model.id).limit(limit)
+    return db.session.execute(stmt).all()
+
+
+def search_users(terms, limit):
+    return ranked(User, user_search_document(User.first, User.last, User.bio), terms, limit)
+
+
+def search_teams(terms, limit):
+    return ranked(Team, team_search_document(Team.team_name), terms, limit)
@@ -0,0 +1,265 @@
+import csv
+import io
+import random
+from datetime import date, datetime, timedelta
+from models.user import User
+from models.team import Team, FREE_AGENTS_TEAM_ID
+from models.match import Match, Result
+from models.sport import Sport
+from models.league import League
+from setup import db
+from ledger import outcomes, add_outcomes, add_to_teams
+
+
+# The seeding module generates synthetic sports, leagues, teams
+# and users for capacity testing. Everything is drawn from a
+# random.Random seeded by the caller, so the same options always
+# produce the same rows. Rows are written straight to the tables
+# in chunks, with COPY on PostgreSQL and executemany INSERTs on
+# other databases, instead of going through the ORM one object at
+# a time.
+CHUNK_SIZE = 50000
+
+SPORT_NAMES = [
+    "Touch Football", "Soccer", "Netball", "Softball", "Basketball",
+    "Hockey", "Touch Rugby", "Volleyball", "Futsal", "Ultimate",
+    "Dodgeball", "Cricket", "Handball", "Lacrosse", "Korfball",
+]
+ADJECTIVES = [
+    "Flying", "Mighty", "Sneaky", "Golden", "Rusty", "Lucky", "Wild",
+    "Silent", "Fearless", "Raging", "Cosmic", "Happy", "Frozen", "Iron",
+]
+NOUNS = [
+    "Ducks", "Bandits", "Gurus", "Fryers", "Steppers", "Potatoes",
+    "Sharks", "Owls", "Comets", "Llamas", "Rockets", "Pumpkins",
+]
+FIRST_NAMES = [
+    "John", "Jasper", "Gary", "May", "Steven", "Darren", "Sarah", "Sam",
+    "Katherine", "Olivia", "Noah", "Amelia", "Jack", "Isla", "Leo",
+    "Mia", "Oscar", "Ava", "Henry", "Grace", "Lucas", "Chloe", "Ethan",
+]
+LAST_NAMES = [
+    "Johnson", "Fez", "Smith", "Pham", "Williams", "Phillips", "Highland",
+    "Taylor", "Platz", "Nguyen", "Brown", "Wilson", "Martin", "Lee",
+    "Walker", "Harris", "Clarke", "Young", "King", "Wright",
+]
+BIOS = [
+    "Here to meet new people",
+    "Looking to make new friends.",
+    "I usually play on the wing. Not very experienced.",
+    "Hi everyone! Here to make friends.",
+    "Where's the beers at?",
+    "Been playing for years, happy to play anywhere.",
+]
+
+
+# next_id returns the first free id of a table, so the generated
+# rows can carry explicit ids and reference each other without
+# reading anything back from the database.
+def next_id(model):
+    return (db.session.scalar(db.select(db.func.max(model.id))) or 0) + 1
+
+
+# insert_rows writes a list of dicts into a table. On PostgreSQL
+# the rows are streamed through COPY, which is several times faster
+# than INSERT for large batches. Every other database gets a single
+# executemany INSERT per chunk.
+def insert_rows(table, rows):
+    if not rows:
+        return
+    connection = db.session.connection()
+    if connection.dialect.name == "postgresql":
+        columns = list(rows[0].keys())
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow(["" if row[c] is None else row[c] for c in columns])
+        buffer.seek(0)
+        cursor = connection.connection.cursor()
+        cursor.copy_expert(
+            f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+    else:
+        connection.execute(table.insert(), rows)
+
+
+# open_places lists the free places on every team from first_team on
+# (or on every team), one entry per place: each team's sport's
+# max_players less the users already on it. The Free Agents pool has
+# no places, since it is where the users left over go.
+def open_places(first_team):
+    players = db.select(db.func.count()).where(User.team_id == Team.id).scalar_subquery()
+    stmt = (
+        db.select(Team.id, Sport.max_players - players)
+        .join(League, Team.league == League.id)
+        .join(Sport, League.sport == Sport.id)
+        .where(Team.id != FREE_AGENTS_TEAM_ID)
+    )
+    if first_team is not None:
+        stmt = stmt.where(Team.id >= first_team)
+    return [team for team, places in db.session.execute(stmt) for _ in range(max(places or 0, 0))]
+
+
+# Because the generated rows use explicit ids, PostgreSQL's id
+# sequences have to be moved past them, otherwise the next row
+# created through the API would collide.
+def reset_sequences(*models):
+    if db.session.connection().dialect.name != "postgresql":
+        return
+    for model in models:
+        table = model.__tablename__
+        db.session.execute(db.text(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+            f"(SELECT COALESCE(MAX(id), 1) FROM {table}))"))
+
+
+# generate adds the requested number of rows on top of whatever is
+# already in the database and returns how many of each were made.
+# Every user gets the same password hash, which the caller computes
+# once, since hashing a million passwords would take hours.
+def generate(sports, leagues_per_sport, teams_per_league, users, seed, password, rounds=0):
+    rng = random.Random(seed)
+    today = date.today()
+
+    sport_rows = []
+    sport_id = next_id(Sport)
+    for n in range(sports):
+        sport_rows.append({
+            "id": sport_id + n,
+            "name": f"{SPORT_NAMES[n % len(SPORT_NAMES)]} {sport_id + n}",
+            "max_players": rng.randint(5, 22),
+        })
+    insert_rows(Sport.__table__, sport_rows)
+    sport_ids = [row["id"] for row in sport_rows] or db.session.scalars(db.select(Sport.id)).all()
+
+    league_rows = []
+    league_id = next_id(League)
+    for sport in sport_ids if leagues_per_sport else []:
+        for n in range(leagues_per_sport):
+            start = date(2024, 1, 1) + timedelta(days=rng.randrange(0, 365))
+            league_rows.append({
+                "id": league_id + len(league_rows),
+                "name": chr(ord("A") + n % 26),
+                "start_date": start,
+                "end_date": start + timedelta(weeks=12),
+                "sport": sport,
+            })
+    insert_rows(League.__table__, league_rows)
+    league_ids = [row["id"] for row in league_rows] or db.session.scalars(db.select(League.id)).all()
+
+    team_rows = []
+    team_id = next_id(Team)
+    for league in league_ids if teams_per_league else []:
+        for n in range(teams_per_league):
+            id = team_id + len(team_rows)
+            team_rows.append({
+                "id": id,
+                "team_name": f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {id}",
+                "date_created": today,
+                "points": 0,
+                "win": 0,
+                "loss": 0,
+                "draw": 0,
+                "league": league,
+            })
+    insert_rows(Team.__table__, team_rows)
+
+    # Users fill the free places on the new teams (or on every team,
+    # when no teams are generated) in random order, so no team goes
+    # over its sport's max_players. The users left over once the
+    # teams are full join the Free Agents pool, most of them asking
+    # for one of the sports. Users are written in chunks so memory
+    # stays flat however many are requested. The first player placed
+    # on each team becomes its captain.
+    places = open_places(team_rows[0]["id"] if team_rows else None)
+    rng.shuffle(places)
+    free_agents = FREE_AGENTS_TEAM_ID if db.session.get(Team, FREE_AGENTS_TEAM_ID) else None
+    user_id = next_id(User)
+    captained = {free_agents}
+    chunk = []
+    for n in range(users):
+        id = user_id + n
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        team = places[n] if n < len(places) else free_agents
+        chunk.append({
+            "id": id,
+            "admin": False,
+            "captain": team is not None and team not in captained,
+            "date_created": today,
+            "first": first,
+            "last": last,
+            "dob": date(1970, 1, 1) + timedelta(days=rng.randrange(0, 13000)),
+            "email": f"{first}.{last}.{id}@example.com".lower(),
+            "password": password,
+            "bio": rng.choice(BIOS),
+            "available": rng.random() < 0.8,
+            "phone": rng.randrange(10000000, 99999999),
+            "skill": round(min(max(rng.gauss(5, 2), 0), 10), 1),
+            "team_id": team,
+            "sport_id": rng.choice(sport_ids) if team == free_agents and sport_ids and rng.random() < 0.9 else None,
+            "league_id": None,
+        })
+        captained.add(team)
+        if len(chunk) >= CHUNK_SIZE:
+            insert_rows(User.__table__, chunk)
+            chunk = []
+    insert_rows(User.__table__, chunk)
+
+    # Team statistics come from results, so the generated leagues
+    # play their rounds once their teams exist.
+    season = [
+        (row["id"], row["start_date"], [team["id"] for team in team_rows if team["league"] == row["id"]])
+        for row in league_rows
+    ]
+    results = generate_results(season, rounds, rng)
+
+    reset_sequences(Sport, League, Team, User, Match, Result)
+    return {
+        "sports": len(sport_rows),
+        "leagues": len(league_rows),
+        "teams": len(team_rows),
+        "users": users,
+        "results": results,
+    }
+
+
+# generate_results plays "rounds" weekly rounds in each league of
+# the season, given as (league id, start date, team ids). Each round
+# pairs the league's teams at random, with a bye for one team when
+# there's an odd number. Every match gets one result, and the teams'
+# statistics are then updated with the totals, just as recording
+# the results through the API would. Returns the number of results.
+def generate_results(season, rounds, rng):
+    match_id, result_id = next_id(Match), next_id(Result)
+    recorded_at = datetime.utcnow()
+    match_rows, result_rows, totals = [], [], {}
+    count = 0
+    for league, start, team_ids in season:
+        if len(team_ids) < 2:
+            continue
+        for round in range(1, rounds + 1):
+            order = list(team_ids)
+            rng.shuffle(order)
+            for home, away in zip(order[0::2], order[1::2]):
+                home_score, away_score = rng.randint(0, 5), rng.randint(0, 5)
+                match_rows.append({
+                    "id": match_id, "league": league, "round": round,
+                    "date": start + timedelta(weeks=round - 1), "slot": None,
+                    "home_team": home, "away_team": away,
+                    "home_score": home_score, "away_score": away_score, "result_id": result_id,
+                })
+                result_rows.append({
+                    "id": result_id, "match_id": match_id, "home_score": home_score,
+                    "away_score": away_score, "recorded_at": recorded_at, "recorded_by": None,
+                })
+                add_outcomes(totals, outcomes(home, away, home_score, away_score))
+                match_id += 1
+                result_id += 1
+                count += 1
+            if len(match_rows) >= CHUNK_SIZE:
+                insert_rows(Match.__table__, match_rows)
+                insert_rows(Result.__table__, result_rows)
+                match_rows, result_rows = [], []
+    insert_rows(Match.__table__, match_rows)
+    insert_rows(Result.__table__, result_rows)
+    add_to_teams(totals)
+    return count
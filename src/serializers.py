@@ -0,0 +1,162 @@
+import datetime
+import threading
+from time import perf_counter
+from marshmallow import fields, missing
+from marshmallow.decorators import POST_DUMP, PRE_DUMP
+from metrics import SERIALIZE_SECONDS
+
+
+# The serializers module turns a marshmallow schema, together with
+# its only/exclude options, into a plain Python dump function.
+# marshmallow works out, for every field of every object, how the
+# value should be fetched and formatted. The compiled function does
+# that work once: it is generated source code with one line per
+# field, using the same formatting marshmallow would use. Fields the
+# compiler doesn't know how to inline are still serialised by their
+# marshmallow field, so the output always matches schema.dump().
+# Compiled functions read attributes, so they are meant for model
+# instances and result rows rather than dicts.
+#
+# Blueprints ask for their serializers with serializer() at import
+# time. Schemas refer to each other by name, so compiling waits
+# until compile_all() runs once every model is imported (see
+# app.py), or until the serializer is first used.
+
+_date_isoformat = datetime.date.isoformat
+
+
+# Inferred fields (names listed in Meta.fields with no declared
+# field) pick their format from the value's type at dump time. The
+# common types are handled inline; anything else goes through the
+# marshmallow field.
+def _inferred(field, name):
+    def serialize(value, obj):
+        kind = type(value)
+        if value is None or kind is int or kind is str or kind is bool:
+            return value
+        if kind is datetime.date:
+            return _date_isoformat(value)
+        return field._serialize(value, name, obj)
+    return serialize
+
+
+class Compiler:
+    def __init__(self):
+        self.namespace = {"_missing": missing, "_date_isoformat": _date_isoformat}
+        self.count = 0
+
+    def _name(self, prefix, value):
+        self.count += 1
+        name = f"_{prefix}{self.count}"
+        self.namespace[name] = value
+        return name
+
+    # expression returns the source of an expression formatting the
+    # value "v" for a field, mirroring the field's _serialize().
+    def expression(self, field, name):
+        kind = type(field)
+        if kind is fields.Integer and not field.as_string:
+            return "None if v is None else int(v)"
+        if kind in (fields.String, fields.Email):
+            return "None if v is None else str(v)"
+        if kind is fields.Boolean and field.truthy == fields.Boolean.truthy and field.falsy == fields.Boolean.falsy:
+            fallback = self._name("field", field)
+            return f"v if v is None or v is True or v is False else {fallback}._serialize(v, {name!r}, obj)"
+        if kind is fields.Date and field.format in (None, "iso", "iso8601"):
+            return "None if v is None else _date_isoformat(v)"
+        if kind is fields.Inferred:
+            return f"{self._name('inferred', _inferred(field, name))}(v, obj)"
+        if kind is fields.Nested:
+            dump = self._name("nested", self.compile_schema(field.schema))
+            if field.schema.many or field.many:
+                return f"None if v is None else [{dump}(x) for x in v]"
+            return f"None if v is None else {dump}(v)"
+        if kind is fields.List and type(field.inner) is fields.Nested and not field.inner.many:
+            dump = self._name("nested", self.compile_schema(field.inner.schema))
+            return f"None if v is None else [None if x is None else {dump}(x) for x in v]"
+        return None
+
+    # compile_schema generates the dump function for a single object.
+    def compile_schema(self, schema):
+        # Schemas with pre/post dump hooks are left to marshmallow
+        if schema._has_processors(PRE_DUMP) or schema._has_processors(POST_DUMP):
+            return lambda obj: schema.dump(obj, many=False)
+
+        lines = ["def dump(obj):", "    ret = {}"]
+        for name, field in schema.dump_fields.items():
+            attribute = field.attribute if field.attribute is not None else name
+            key = field.data_key if field.data_key is not None else name
+            expression = self.expression(field, name)
+            if expression is None or "." in attribute or not field._CHECK_ATTRIBUTE:
+                # Fall back to the marshmallow field for anything unusual
+                generic = self._name("field", field)
+                accessor = self._name("accessor", schema.get_attribute)
+                lines.append(f"    v = {generic}.serialize({name!r}, obj, accessor={accessor})")
+                lines.append(f"    if v is not _missing:")
+                lines.append(f"        ret[{key!r}] = v")
+                continue
+            lines.append(f"    v = getattr(obj, {attribute!r}, _missing)")
+            if field.dump_default is not missing:
+                default = self._name("default", field.dump_default)
+                call = "()" if callable(field.dump_default) else ""
+                lines.append(f"    if v is _missing:")
+                lines.append(f"        v = {default}{call}")
+            lines.append(f"    if v is not _missing:")
+            lines.append(f"        ret[{key!r}] = {expression}")
+        lines.append("    return ret")
+
+        namespace = dict(self.namespace)
+        exec(compile("\n".join(lines), f"<serializer {type(schema).__name__}>", "exec"), namespace)
+        return namespace["dump"]
+
+
+# Serializer is the callable handed out by serializer(). It holds the
+# schema options and compiles itself the first time it is needed.
+class Serializer:
+    def __init__(self, schema_cls, many, only, exclude):
+        self.schema_cls = schema_cls
+        self.many = many
+        self.only = only
+        self.exclude = exclude
+        self._dump = None
+        self._lock = threading.Lock()
+
+    def schema(self):
+        return self.schema_cls(many=self.many, only=self.only, exclude=self.exclude)
+
+    def compile(self):
+        with self._lock:
+            if self._dump is None:
+                dump = Compiler().compile_schema(self.schema_cls(only=self.only, exclude=self.exclude))
+                self._dump = (lambda objs: [dump(obj) for obj in objs]) if self.many else dump
+        return self._dump
+
+    # Every call is timed into serialization_duration_seconds.
+    def __call__(self, obj):
+        start = perf_counter()
+        try:
+            return (self._dump or self.compile())(obj)
+        finally:
+            SERIALIZE_SECONDS.observe((self.schema_cls.__name__,), perf_counter() - start)
+
+
+_registry = {}
+
+
+# serializer returns the compiled serializer for a schema class and
+# its options. Asking twice for the same combination returns the
+# same object.
+def serializer(schema_cls, many=False, only=None, exclude=()):
+    key = (schema_cls, many, tuple(only) if only is not None else None, tuple(exclude))
+    if key not in _registry:
+        _registry[key] = Serializer(schema_cls, many, key[2], key[3])
+    return _registry[key]
+
+
+def registered():
+    return list(_registry.values())
+
+
+def compile_all():
+    for entry in _registry.values():
+        entry.compile()
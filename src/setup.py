@@ -3,7 +3,14 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_marshmallow import Marshmallow
 from flask_bcrypt import Bcrypt
 from flask_jwt_extended import JWTManager
+from hashing import HashingService
+from metrics import instrument
+import profiling
+from pooling import engine_options
+import routing
+from routing import RoutingSession, replica_binds
 from marshmallow.exceptions import ValidationError
+from sqlalchemy.orm.exc import StaleDataError
 from os import environ
 
 # The module is initialised and assigned to
@@ -27,14 +34,75 @@ app.config["JWT_SECRET_KEY"] = environ.get("JWT_KEY")
 app.config["SQLALCHEMY_DATABASE_URI"] = environ.get("DB_URI")
 
 
+# The connection pool and statement timeout are tuned with the
+# DB_POOL_* and DB_STATEMENT_TIMEOUT variables, see pooling.py.
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(environ.get("DB_URI"), environ)
+
+
+# Read-only requests can be served from read replicas listed in
+# DB_REPLICA_URIS. READ_YOUR_WRITES_SECONDS is how long a client
+# keeps reading from the primary after it writes, see routing.py.
+app.config["SQLALCHEMY_BINDS"] = replica_binds(environ.get("DB_REPLICA_URIS"), environ)
+if environ.get("READ_YOUR_WRITES_SECONDS"):
+    app.config["READ_YOUR_WRITES_SECONDS"] = float(environ["READ_YOUR_WRITES_SECONDS"])
+
+
+# Password hashing runs in a pool of HASH_WORKERS processes.
+# HASH_MAX_PENDING is how many requests may queue for a hash before
+# new ones get a 503, and HASH_RETRY_AFTER is the number of seconds
+# those clients are asked to wait. Unset values use the defaults
+# in hashing.py.
+for key in ("HASH_WORKERS", "HASH_MAX_PENDING", "HASH_RETRY_AFTER"):
+    if environ.get(key):
+        app.config[key] = int(environ[key])
+
+
+# Request, query, hashing and serialization metrics are served at
+# /metrics, see metrics.py. Multi-process servers set METRICS_DIR to
+# a directory the workers share, and scrapers without an admin token
+# can be given METRICS_TOKEN.
+for key in ("METRICS_DIR", "METRICS_TOKEN"):
+    if environ.get(key):
+        app.config[key] = environ[key]
+if environ.get("METRICS_FLUSH_SECONDS"):
+    app.config["METRICS_FLUSH_SECONDS"] = float(environ["METRICS_FLUSH_SECONDS"])
+
+
+# SQL_PROFILE turns on per-request query profiling for development
+# and staging, see profiling.py. SQL_PROFILE_REPEAT is how many times
+# one SELECT may run in a request before it is logged as an N+1.
+if environ.get("SQL_PROFILE"):
+    app.config["SQL_PROFILE"] = environ["SQL_PROFILE"].lower() in ("1", "true", "yes")
+if environ.get("SQL_PROFILE_REPEAT"):
+    app.config["SQL_PROFILE_REPEAT"] = int(environ["SQL_PROFILE_REPEAT"])
+
+
+# REVOCATION_REFRESH_SECONDS is how often each process reads new
+# token revocations, so how long a token revoked by another worker
+# keeps working there, see revocation.py.
+if environ.get("REVOCATION_REFRESH_SECONDS"):
+    app.config["REVOCATION_REFRESH_SECONDS"] = float(environ["REVOCATION_REFRESH_SECONDS"])
+
+
 # With  imports from SQLAlchemy, Marshmallow,
 # Bcrypt and JWTManager, the app is initialised
 # then assigned to four separate variables.
 # These are then used throughout our program.
-db = SQLAlchemy(app)
+db = SQLAlchemy(app, session_options={"class_": RoutingSession})
 ma = Marshmallow(app)
 bcrypt = Bcrypt(app)
 jwt = JWTManager(app)
+hashing = HashingService(app)
+instrument(app)
+profiling.init_app(app)
+routing.init_app(app)
+
+
+# Bad requests, such as an invalid pagination cursor, are
+# returned with the description passed to abort().
+@app.errorhandler(400)
+def bad_request(err):
+    return {"error": err.description}, 400
 
 
 # Here a error handler is defined which deals with 401
@@ -42,7 +110,16 @@ jwt = JWTManager(app)
 # A custom error message is returned which is useful for the client.
 @app.errorhandler(401)
 def unauthorized(err):
-    return {"error": "You are not authorised to access this resource"}
+    return {"error": "You are not authorised to access this resource"}, 401
+
+
+# 503 is returned when the server sheds load, for example when too
+# many requests are waiting on password hashing. The Retry-After
+# header tells the client when to try again.
+@app.errorhandler(503)
+def service_unavailable(err):
+    headers = {"Retry-After": str(err.retry_after)} if err.retry_after else {}
+    return {"error": err.description}, 503, headers
 
 
 # A general error handler for ValidationError's are handled within
@@ -51,3 +128,13 @@ def unauthorized(err):
 @app.errorhandler(ValidationError)
 def validation_error(err):
     return {"error": err.messages}
+
+
+# StaleDataError is raised when a team, user or league changed
+# between being read and being written (see the version_id columns),
+# so the write wasn't applied. It's the same 412 that an out of date
+# If-Match gets.
+@app.errorhandler(StaleDataError)
+def stale_data(err):
+    db.session.rollback()
+    return {"error": "The resource has changed since it was read, fetch it and try again"}, 412
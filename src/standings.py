@@ -0,0 +1,148 @@
+import bisect
+import threading
+from models.team import Team, FREE_AGENTS_TEAM_ID
+from models.league import League
+from setup import db
+from routing import read_from_primary
+from etags import read_versions
+
+
+# Standings are the most polled view on game nights, so rather than
+# selecting and sorting every team of a league on each request, a
+# ranked table per league is kept in memory. A league's table is
+# built the first time it is asked for, and after that the team
+# routes move single teams within it as their results change.
+#
+# Each worker process keeps its own tables, tagged with the version
+# of the league's "league:<id>" key (see etags.py) they were built
+# at. Every write that changes a league's standings bumps that key,
+# so a table is only served while the version is unchanged, and a
+# worker that didn't handle the write rebuilds it on the next read.
+
+# ranking_key orders teams by points, then wins, then fewest
+# losses, and finally by name so the order is always stable.
+def ranking_key(team):
+    return (-(team.points or 0), -(team.win or 0), team.loss or 0, team.team_name, team.id)
+
+
+# league_versions returns the current version of each league's key,
+# one query for any number of leagues.
+def league_versions(*league_ids):
+    versions = read_versions([f"league:{id}" for id in league_ids])
+    return {id: versions.get(f"league:{id}", 0) for id in league_ids}
+
+
+def standing_row(team):
+    return {
+        "id": team.id,
+        "team_name": team.team_name,
+        "played": (team.win or 0) + (team.loss or 0) + (team.draw or 0),
+        "points": team.points or 0,
+        "win": team.win or 0,
+        "loss": team.loss or 0,
+        "draw": team.draw or 0,
+    }
+
+
+# LeagueTable holds one league's teams in ranked order. "keys" is
+# kept sorted, so moving a team is a binary search to remove its
+# old position and another to insert the new one.
+class LeagueTable:
+    def __init__(self, teams):
+        self.keys = sorted(ranking_key(team) for team in teams)
+        self.rows = {team.id: (ranking_key(team), standing_row(team)) for team in teams}
+
+    def remove(self, team_id):
+        if team_id in self.rows:
+            key, row = self.rows.pop(team_id)
+            del self.keys[bisect.bisect_left(self.keys, key)]
+
+    def update(self, team_id, key, row):
+        self.remove(team_id)
+        bisect.insort(self.keys, key)
+        self.rows[team_id] = (key, row)
+
+    def ranked(self):
+        return [
+            dict(self.rows[key[-1]][1], position=position)
+            for position, key in enumerate(self.keys, start=1)
+        ]
+
+
+class Standings:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tables = {}
+
+    # table returns the ranked standings of a league, or None if the
+    # league doesn't exist. The league's version is read before its
+    # teams, so a table built while another write commits carries
+    # the older version and is rebuilt on the next read.
+    def table(self, league_id):
+        read_from_primary(db.session)
+        version = league_versions(league_id)[league_id]
+        with self._lock:
+            cached = self._tables.get(league_id)
+            if cached is not None and cached[0] == version:
+                return cached[1].ranked()
+
+        stmt = db.select(Team).where(Team.league == league_id, Team.id != FREE_AGENTS_TEAM_ID)
+        teams = db.session.scalars(stmt).all()
+        if not teams and not db.session.get(League, league_id):
+            self.drop_league(league_id)
+            return None
+        table = LeagueTable(teams)
+        with self._lock:
+            cached = self._tables.get(league_id)
+            if cached is None or cached[0] <= version:
+                self._tables[league_id] = (version, table)
+            return table.ranked()
+
+    # update is called once a transaction that changed the results,
+    # names or leagues of teams has committed, with all of those
+    # teams and, for teams that moved, the leagues they left.
+    def update(self, teams, old_leagues=None):
+        old_leagues = old_leagues or {}
+        changes = []
+        for team in teams:
+            changes.append((team.id, old_leagues.get(team.id, team.league), team.league,
+                            ranking_key(team), standing_row(team)))
+        self._apply(changes)
+
+    def remove(self, team_id, league_id):
+        self._apply([(team_id, league_id, None, None, None)])
+
+    def drop_league(self, league_id):
+        with self._lock:
+            self._tables.pop(league_id, None)
+
+    # _apply moves the changed teams within the loaded tables of their
+    # leagues, as long as the transaction that changed them is the
+    # only change since the table was built, i.e. it bumped the
+    # league's version by exactly one. A table built after the commit
+    # already has the change, and one that missed another change is
+    # dropped, to be rebuilt when it is next read.
+    def _apply(self, changes):
+        with self._lock:
+            leagues = {league for change in changes for league in change[1:3] if league in self._tables}
+        if not leagues:
+            return
+        versions = league_versions(*leagues)
+        with self._lock:
+            for league in leagues:
+                cached = self._tables.get(league)
+                if cached is None or versions[league] <= cached[0]:
+                    continue
+                if versions[league] != cached[0] + 1:
+                    del self._tables[league]
+                    continue
+                version, table = cached
+                for team_id, old_league, new_league, key, row in changes:
+                    if old_league == league and new_league != league:
+                        table.remove(team_id)
+                    elif new_league == league and team_id != FREE_AGENTS_TEAM_ID:
+                        table.update(team_id, key, row)
+                self._tables[league] = (versions[league], table)
+
+
+standings = Standings()
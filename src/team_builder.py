@@ -0,0 +1,219 @@
+from datetime import date
+import numpy as np
+from matching import free_agent_index, free_agent_filter
+from models.team import Team
+from models.user import User
+from rosters import move_players, RosterFull
+from setup import db
+
+
+# The team builder splits the free agents pool of a league into new
+# teams for it. Candidates come from the free agent index in
+# matching.py, so the pool is already in numpy arrays. The pool is
+# the free agents who asked for the league, then those who asked for
+# its sport without naming another league, then those who haven't
+# asked for any sport, filtered by availability and age. Each team gets the sport's max_players, and
+# the players left over once no full team can be made stay free
+# agents (the longest registered are placed first).
+#
+# Teams are balanced on skill and, with less weight, on average age.
+# Both are standardised and a missing value counts as the pool's
+# average. A snake draft on skill gives the first assignment: teams
+# pick in turn, best player first, reversing the order every round.
+# A local search then swaps players between teams while that brings
+# the teams' totals closer to the average team. Each pass scores a
+# few thousand random swaps at once with numpy and applies the best
+# ones that don't touch the same team twice.
+AGE_WEIGHT = 0.5
+SWAP_SAMPLE = 4096
+MAX_PASSES = 300
+# The search stops after this many passes in a row find nothing
+IDLE_PASSES = 5
+
+
+class BuildError(Exception):
+    pass
+
+
+def team_codes():
+    n = 0
+    while True:
+        n += 1
+        code, rest = "", n
+        while rest:
+            rest, letter = divmod(rest - 1, 26)
+            code = chr(ord("A") + letter) + code
+        yield code
+
+
+# team_names proposes names like "Premier AB" that aren't taken. Team
+# names may only hold letters and spaces, so the teams are lettered
+# rather than numbered.
+def team_names(league_name, count):
+    prefix = (league_name or "Team").strip()[:12]
+    taken = set(db.session.scalars(db.select(Team.team_name).where(Team.team_name.like(f"{prefix} %"))))
+    names = []
+    for code in team_codes():
+        if len(names) == count:
+            return names
+        name = f"{prefix} {code}"
+        if name not in taken:
+            names.append(name)
+
+
+def standardise(values, weight):
+    known = np.isfinite(values)
+    if not known.any():
+        return np.zeros(len(values))
+    spread = values[known].std() or 1.0
+    return weight * np.where(known, (values - values[known].mean()) / spread, 0.0)
+
+
+def snake_draft(strength, teams):
+    order = np.argsort(-strength, kind="stable")
+    pick = np.arange(len(order))
+    draft_round, position = pick // teams, pick % teams
+    assignment = np.empty(len(order), dtype=np.int64)
+    assignment[order] = np.where(draft_round % 2 == 0, position, teams - 1 - position)
+    return assignment
+
+
+# local_search improves the assignment in place. "features" has one
+# row per player, and the aim is to bring every team's feature total
+# to the average. Swapping player i of team a with player j of team b
+# changes the sum of squared distances by 2d.(b - a) + 2|d|^2, where
+# d = features[i] - features[j], so every sampled swap is scored in
+# one vectorised step.
+def local_search(features, assignment, teams, rng):
+    totals = np.zeros((teams, features.shape[1]))
+    np.add.at(totals, assignment, features)
+    idle = 0
+    for _ in range(MAX_PASSES):
+        i = rng.integers(0, len(features), SWAP_SAMPLE)
+        j = rng.integers(0, len(features), SWAP_SAMPLE)
+        a, b = assignment[i], assignment[j]
+        d = features[i] - features[j]
+        change = 2 * np.einsum("kf,kf->k", d, totals[b] - totals[a]) + 2 * np.einsum("kf,kf->k", d, d)
+        better = np.flatnonzero((a != b) & (change < -1e-9))
+        if not len(better):
+            idle += 1
+            if idle >= IDLE_PASSES:
+                break
+            continue
+        idle = 0
+        touched = np.zeros(teams, dtype=bool)
+        for k in better[np.argsort(change[better])].tolist():
+            if touched[a[k]] or touched[b[k]]:
+                continue
+            touched[a[k]] = touched[b[k]] = True
+            assignment[i[k]], assignment[j[k]] = b[k], a[k]
+            totals[a[k]] -= d[k]
+            totals[b[k]] += d[k]
+    return assignment
+
+
+def team_average(values, assignment, teams):
+    known = np.isfinite(values)
+    totals = np.bincount(assignment[known], weights=values[known], minlength=teams)
+    counts = np.bincount(assignment[known], minlength=teams)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return totals / counts
+
+
+def rounded(value):
+    return round(float(value), 2) if np.isfinite(value) else None
+
+
+# propose builds teams for the league from the free agents that pass
+# the filters. Nothing is written; the teams it returns are sent back
+# to commit() to create them.
+def propose(league, team_size, options):
+    index = free_agent_index.get()
+    ages = index.ages()
+    wants_sport = (index.sport == league.sport) | (index.sport == -1)
+    wants_league = (index.league == league.id) | (index.league == -1)
+    mask = wants_sport & wants_league
+    if options.get("available") is not None:
+        mask &= index.available == options["available"]
+    with np.errstate(invalid="ignore"):
+        if options.get("min_age") is not None:
+            mask &= ages >= options["min_age"]
+        if options.get("max_age") is not None:
+            mask &= ages <= options["max_age"]
+
+    pool = np.flatnonzero(mask)
+    pool = pool[np.lexsort((index.ids[pool], index.sport[pool] != league.sport,
+                            index.league[pool] != league.id))]
+    teams = len(pool) // team_size
+    if not teams:
+        raise BuildError(f"{len(pool)} free agents match, which isn't enough for a team of {team_size}")
+    chosen, unassigned = pool[:teams * team_size], pool[teams * team_size:]
+
+    skill, age = index.skill[chosen], ages[chosen]
+    features = np.stack([standardise(skill, 1.0), standardise(age, AGE_WEIGHT)], axis=1)
+    rng = np.random.default_rng(options.get("seed"))
+    assignment = local_search(features, snake_draft(features[:, 0], teams), teams, rng)
+
+    average_skill = team_average(skill, assignment, teams)
+    average_age = team_average(age, assignment, teams)
+    ids = index.ids[chosen]
+    order = np.argsort(assignment, kind="stable")
+    rosters = np.split(ids[order], np.cumsum(np.bincount(assignment, minlength=teams))[:-1])
+    names = team_names(league.name, teams)
+    return {
+        "league": league.id,
+        "team_size": team_size,
+        "teams": [
+            {"team_name": names[n], "players": rosters[n].tolist(),
+             "average_skill": rounded(average_skill[n]), "average_age": rounded(average_age[n])}
+            for n in range(teams)
+        ],
+        "unassigned": index.ids[unassigned].tolist(),
+        "skill_range": rounded(np.nanmax(average_skill) - np.nanmin(average_skill))
+        if np.isfinite(average_skill).any() else None,
+        "age_range": rounded(np.nanmax(average_age) - np.nanmin(average_age))
+        if np.isfinite(average_age).any() else None,
+    }
+
+
+# commit creates the proposed teams in the league and moves their
+# players onto them in the caller's transaction. The teams are
+# inserted with one executemany, and each roster is moved with one
+# UPDATE that only matches players who are still free agents, so a
+# player who joined another team since the proposal fails the whole
+# build instead of being moved. The new teams' roster_size counters
+# are then set, and the Free Agents pool's lowered, by move_players.
+def commit(league, team_size, teams):
+    players = [player for team in teams for player in team["players"]]
+    if len(players) != len(set(players)):
+        raise BuildError("A player is on more than one team")
+    if team_size and any(len(team["players"]) > team_size for team in teams):
+        raise BuildError(f"Teams can have at most {team_size} players")
+    names = [team["team_name"] for team in teams]
+    if len(names) != len(set(names)):
+        raise BuildError("Team names must be unique")
+    taken = db.session.scalars(db.select(Team.team_name).where(Team.team_name.in_(names))).all()
+    if taken:
+        raise BuildError(f"Team names already exist: {', '.join(sorted(taken))}")
+    free = dict(db.session.execute(db.select(User.id, User.team_id).where(User.id.in_(players), free_agent_filter())).all())
+    if len(free) != len(players):
+        missing = sorted(set(players) - free.keys())
+        raise BuildError(f"Players are no longer free agents: {', '.join(map(str, missing[:20]))}")
+
+    today = date.today()
+    team_ids = db.session.scalars(
+        db.insert(Team).returning(Team.id, sort_by_parameter_order=True),
+        [{"team_name": name, "league": league.id, "date_created": today} for name in names]).all()
+    for team_id, team in zip(team_ids, teams):
+        moved = db.session.execute(
+            db.update(User).where(User.id.in_(team["players"]), free_agent_filter())
+            .values(team_id=team_id, version_id=User.version_id + 1)
+            .execution_options(synchronize_session=False)).rowcount
+        if moved != len(team["players"]):
+            raise BuildError("Players were moved by another request, please build again")
+    try:
+        move_players([(free[player], team_id)
+                      for team_id, team in zip(team_ids, teams) for player in team["players"]])
+    except RosterFull:
+        raise BuildError(f"Teams can have at most {team_size} players")
+    return team_ids
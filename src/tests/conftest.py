@@ -0,0 +1,71 @@
+import os
+from datetime import date
+import sys
+import tempfile
+import pytest
+
+
+# The tests run the app against the scratch database in TEST_DB_URI,
+# which is dropped, created and seeded with "flask db seed" once per
+# test run, so don't point it at a database you want to keep.
+# Without it they use a SQLite file in the temp directory.
+#
+#   TEST_DB_URI=postgresql+psycopg2://localhost/teams_test python -m pytest
+SRC = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SRC)
+
+os.environ["DB_URI"] = os.environ.get(
+    "TEST_DB_URI", "sqlite:///" + os.path.join(tempfile.gettempdir(), "teams_test.db"))
+os.environ.setdefault("JWT_KEY", "test")
+# The deny list is only refreshed at the start of a run, so every
+# request runs the same statements however long the tests take.
+os.environ["REVOCATION_REFRESH_SECONDS"] = "3600"
+
+from app import app as flask_app  # noqa: E402
+from setup import db  # noqa: E402
+from models.user import User  # noqa: E402
+from matching import free_agent_index  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def app():
+    runner = flask_app.test_cli_runner()
+    with flask_app.app_context():
+        db.drop_all()
+    for command in (["db", "create"], ["db", "seed"]):
+        result = runner.invoke(args=command)
+        assert result.exit_code == 0, result.output
+    return flask_app
+
+
+@pytest.fixture(scope="session")
+def client(app):
+    return app.test_client()
+
+
+def login(client, email, password="Password123!"):
+    response = client.post("/users/login", json={"email": email, "password": password})
+    assert response.status_code == 200, response.json
+    return {"Authorization": f"Bearer {response.json['token']}"}
+
+
+@pytest.fixture(scope="session")
+def admin(client):
+    return login(client, "admin@email.com")
+
+
+# add_free_agents flushes new users on the given team, with the given
+# sport or league preferences, and returns their ids. The caller
+# commits or rolls them back. They share the admin's password hash,
+# so they can log in.
+def add_free_agents(names, team_id, **preferences):
+    password = db.session.scalar(db.select(User.password).where(User.email == "admin@email.com"))
+    users = [
+        User(first=name, last="Agent", email=f"{name.lower()}.{team_id}@agents.com", password=password,
+             date_created=date.today(), team_id=team_id, captain=False, available=True, **preferences)
+        for name in names
+    ]
+    db.session.add_all(users)
+    db.session.flush()
+    free_agent_index.invalidate()
+    return [user.id for user in users]
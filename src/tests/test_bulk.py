@@ -0,0 +1,45 @@
+from datetime import date
+import bulk
+import blueprints.teams_bp as teams_bp_module
+import blueprints.users_bp as users_bp_module
+from models.team import Team
+from models.user import User
+from setup import db
+
+
+# changed_after_read makes "existing" commit a change to the row the
+# moment the route has read it, as a concurrent request would.
+def changed_after_read(monkeypatch, module, model, id, **values):
+    def existing(column, values_, *extra):
+        found = bulk.existing(column, values_, *extra)
+        if column is model.id:
+            db.session.execute(db.update(model).where(model.id == id)
+                               .values(version_id=model.version_id + 1, **values))
+            db.session.commit()
+        return found
+    monkeypatch.setattr(module, "existing", existing)
+
+
+def test_bulk_user_update_fails_if_the_user_changed_since_read(app, client, admin, monkeypatch):
+    with app.app_context():
+        user = User(first="Bulk", last="Raced", email="bulk.raced@email.com", password="x",
+                    date_created=date.today())
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+        roster = db.session.get(Team, 9).roster_size
+
+    changed_after_read(monkeypatch, users_bp_module, User, user_id)
+    response = client.patch("/users/bulk", headers=admin, json=[{"id": user_id, "team_id": 9}])
+    assert response.status_code == 412
+    with app.app_context():
+        assert db.session.get(User, user_id).team_id is None
+        assert db.session.get(Team, 9).roster_size == roster
+
+
+def test_bulk_team_update_fails_if_the_team_changed_since_read(app, client, admin, monkeypatch):
+    changed_after_read(monkeypatch, teams_bp_module, Team, 8)
+    response = client.patch("/teams/bulk", headers=admin, json=[{"id": 8, "team_name": "Raced Team"}])
+    assert response.status_code == 412
+    with app.app_context():
+        assert db.session.get(Team, 8).team_name != "Raced Team"
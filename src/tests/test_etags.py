@@ -0,0 +1,20 @@
+from datetime import date
+from models.user import User
+from setup import db
+
+
+# The teams list shows each team's roster_size, so its ETag has to
+# change when a player joins a team.
+def test_teams_list_etag_follows_roster_moves(app, client, admin):
+    with app.app_context():
+        user = User(first="Roster", last="Mover", email="roster.mover@email.com", password="x",
+                    date_created=date.today())
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+
+    etag = client.get("/teams/", headers=admin).headers["ETag"]
+    response = client.patch("/users/bulk", headers=admin, json=[{"id": user_id, "team_id": 9}])
+    assert response.status_code == 200, response.json
+    response = client.get("/teams/", headers=dict(admin, **{"If-None-Match": etag}))
+    assert response.status_code == 200
@@ -0,0 +1,60 @@
+from matching import free_agent_index, team_needs, search
+from models.team import Team, FREE_AGENTS_TEAM_ID
+from setup import db
+from conftest import add_free_agents
+
+
+def a_team():
+    stmt = db.select(Team).where(Team.league.isnot(None), Team.id != FREE_AGENTS_TEAM_ID)
+    return db.session.scalars(stmt.order_by(Team.id)).first()
+
+
+def test_needs_read_the_roster_size(app):
+    with app.app_context():
+        team = a_team()
+        needs = team_needs(team.id)
+        assert needs["roster_size"] == team.roster_size
+        assert needs["open_spots"] == needs["max_players"] - team.roster_size
+
+
+def test_full_team_gets_no_suggestions(app):
+    with app.app_context():
+        needs = dict(team_needs(a_team().id), open_spots=0)
+        assert search({}, needs, 10) == ([], None)
+
+
+# The sport part of the score shrinks as the roster fills up, so a
+# free agent from the team's sport scores less for a team with one
+# spot left than for an empty one.
+def test_sport_weight_follows_open_spots(app):
+    with app.app_context():
+        sport = free_agent_index.get().sport[0]
+        needs = dict(team_needs(a_team().id), sport=sport, average_age=None)
+        empty = dict(needs, open_spots=needs["max_players"])
+        nearly_full = dict(needs, open_spots=1)
+        [(_, empty_score)], _ = search({"sport": sport}, empty, 1)
+        [(_, nearly_full_score)], _ = search({"sport": sport}, nearly_full, 1)
+        assert empty_score > nearly_full_score
+
+
+# Free agents are indexed by the sport and league they asked for, so
+# each sport's filter finds its own players and ranks them first for
+# a team of that sport.
+def test_free_agents_are_found_by_the_sport_they_want(app):
+    with app.app_context():
+        first = add_free_agents(["Hal", "Ivy"], FREE_AGENTS_TEAM_ID, sport_id=1)
+        second = add_free_agents(["Jay", "Kim"], FREE_AGENTS_TEAM_ID, sport_id=2)
+        league = add_free_agents(["Lou"], FREE_AGENTS_TEAM_ID, league_id=7)
+        try:
+            ids = lambda page: {id for id, score in page}
+            assert ids(search({"sport": 1}, None, 1000)[0]) & set(first + second + league) == set(first)
+            assert ids(search({"sport": 2}, None, 1000)[0]) & set(first + second + league) == set(second + league)
+            assert ids(search({"league": 7}, None, 1000)[0]) == set(league)
+
+            needs = dict(team_needs(a_team().id), sport=2, average_age=None)
+            page, _ = search({"available": True}, needs, 1000)
+            scores = dict(page)
+            assert min(scores[id] for id in second) > max(scores[id] for id in first)
+        finally:
+            db.session.rollback()
+            free_agent_index.invalidate()
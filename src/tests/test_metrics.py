@@ -0,0 +1,34 @@
+import threading
+import hashing as hashing_module
+from setup import hashing
+
+
+def test_hash_queue_depth_gauge(client, admin):
+    body = client.get("/metrics", headers=admin).get_data(as_text=True)
+    assert "# TYPE password_hash_queue_depth gauge" in body
+    assert "\npassword_hash_queue_depth 0\n" in body
+
+
+# The gauge follows the hashes in flight: a check that is still
+# running shows up in it until it is done. Hashing runs inline here
+# (HASH_WORKERS 0) so bcrypt can be swapped for a slow stand-in.
+def test_hash_queue_depth_counts_pending(app, client, admin, monkeypatch):
+    started, release = threading.Event(), threading.Event()
+
+    def checkpw(password, pw_hash):
+        started.set()
+        release.wait(5)
+        return False
+
+    monkeypatch.setitem(app.config, "HASH_WORKERS", 0)
+    monkeypatch.setattr(hashing_module.bcrypt, "checkpw", checkpw)
+    thread = threading.Thread(target=hashing.check_password_hash, args=("hash", "password"))
+    thread.start()
+    try:
+        started.wait(5)
+        body = client.get("/metrics", headers=admin).get_data(as_text=True)
+        assert "\npassword_hash_queue_depth 1\n" in body
+    finally:
+        release.set()
+        thread.join()
+    assert "\npassword_hash_queue_depth 0\n" in client.get("/metrics", headers=admin).get_data(as_text=True)
@@ -0,0 +1,46 @@
+import os
+import tempfile
+from sqlalchemy import create_engine, inspect
+import migrate
+from setup import db
+
+
+def engine(name):
+    path = os.path.join(tempfile.gettempdir(), name)
+    if os.path.exists(path):
+        os.remove(path)
+    return create_engine("sqlite:///" + path)
+
+
+def schema(engine):
+    inspector = inspect(engine)
+    return {
+        table: (
+            sorted((column["name"], str(column["type"]), column["nullable"])
+                   for column in inspector.get_columns(table)),
+            sorted(index["name"] for index in inspector.get_indexes(table)),
+        )
+        for table in inspector.get_table_names()
+    }
+
+
+def run(engine, migrations, step):
+    for migration in migrations:
+        with engine.begin() as connection:
+            getattr(migration, step)(connection)
+
+
+# Upgrading an empty database through every migration has to build
+# the same schema as "flask db create" does from the models, and
+# downgrading has to take it all away again.
+def test_migrations_build_the_models_schema(app):
+    migrated = engine("teams_migrated.db")
+    created = engine("teams_created.db")
+    run(migrated, migrate.MIGRATIONS, "upgrade")
+    with app.app_context():
+        db.metadata.create_all(created, tables=[
+            table for name, table in db.metadata.tables.items() if name != "schema_migrations"])
+    assert schema(migrated) == schema(created)
+
+    run(migrated, reversed(migrate.MIGRATIONS), "downgrade")
+    assert inspect(migrated).get_table_names() == []
@@ -0,0 +1,31 @@
+import pytest
+from pagination import encode_cursor
+
+
+def test_pages_follow_on(client, admin):
+    first = client.get("/teams/?limit=2", headers=admin).json
+    second = client.get(f"/teams/?limit=2&after={first['next']}", headers=admin).json
+    assert first["next"] and len(first["data"]) == 2
+    assert first["data"][-1]["team_name"] < second["data"][0]["team_name"]
+
+
+# Cursors are decoded before they reach the database, so a tampered
+# one is a 400 rather than a DataError.
+@pytest.mark.parametrize("path, values", [
+    ("/teams/", ["Bandits", "3"]),
+    ("/teams/", [3, 3]),
+    ("/teams/", ["Bandits"]),
+    ("/teams/", ["Bandits", 2 ** 70]),
+    ("/users/captains", [True]),
+    ("/users/captains", [{"id": 1}]),
+    ("/users/freeagents", ["high", 3]),
+])
+def test_tampered_cursor(client, admin, path, values):
+    response = client.get(f"{path}?after={encode_cursor(values)}", headers=admin)
+    assert response.status_code == 400
+    assert response.json == {"error": "Invalid cursor"}
+
+
+def test_garbage_cursor(client, admin):
+    response = client.get("/teams/?after=not-a-cursor", headers=admin)
+    assert response.status_code == 400
@@ -0,0 +1,27 @@
+from conftest import login
+from models.user import User
+from setup import db
+
+
+# A captain's token carries their team, so moving team revokes it.
+def test_moving_team_revokes_tokens(client):
+    old = login(client, "feral@email.com")
+    assert client.put("/users/2", json={"team_id": 9}, headers=old).status_code == 200
+
+    response = client.patch("/teams/3", json={"team_name": "Hijacked"}, headers=old)
+    assert response.status_code == 401
+    # Logging in again straight away, within the same second
+    new = login(client, "feral@email.com")
+    assert client.patch("/teams/9", json={"team_name": "Moved In"}, headers=new).status_code == 200
+
+
+# Team writes check the captain's team in the database, so a token
+# that hasn't been revoked (yet) can't be used on the old team.
+def test_team_writes_ignore_stale_claims(app, client):
+    headers = login(client, "feral@email.com")
+    with app.app_context():
+        db.session.execute(db.update(User).where(User.id == 2).values(team_id=3))
+        db.session.commit()
+
+    assert client.patch("/teams/9", json={"team_name": "Stale Claims"}, headers=headers).status_code == 401
+    assert client.patch("/teams/3", json={"team_name": "Back Home"}, headers=headers).status_code == 200
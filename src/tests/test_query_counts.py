@@ -0,0 +1,39 @@
+import pytest
+from matching import free_agent_index
+from standings import standings
+
+
+# Each read route runs a fixed number of statements however many rows
+# it returns; a lazy loaded relationship creeping back into a dump
+# shows up here as a higher count. The counts come from the
+# X-Query-Count header that SQL_PROFILE adds (see profiling.py) and
+# include the ETag lookups, and the caches are cleared before each
+# request so building the standings table and the free agent index
+# are counted too. The deny list's periodic refresh (see
+# revocation.py) isn't, as it lands on whichever request comes first.
+QUERY_COUNTS = [
+    ("/teams/", 2),
+    ("/teams/2", 3),
+    ("/leagues/1", 3),
+    ("/sports/1", 3),
+    ("/users/captains", 1),
+    ("/users/freeagents", 4),
+    ("/leagues/1/standings", 2),
+]
+
+
+@pytest.fixture
+def profiled(app, client, admin):
+    client.get("/teams/", headers=admin)
+    standings.drop_league(1)
+    free_agent_index.invalidate()
+    app.config["SQL_PROFILE"] = True
+    yield
+    app.config["SQL_PROFILE"] = False
+
+
+@pytest.mark.parametrize("path, queries", QUERY_COUNTS)
+def test_query_count(client, admin, profiled, path, queries):
+    response = client.get(path, headers=admin)
+    assert response.status_code == 200
+    assert int(response.headers["X-Query-Count"]) == queries
@@ -0,0 +1,23 @@
+import time
+from conftest import login
+from routing import PRIMARY_COOKIE, wrote_recently
+
+
+def test_write_sets_the_primary_cookie(app, client):
+    headers = login(client, "admin@email.com")
+    response = client.get("/teams/", headers=headers)
+    assert PRIMARY_COOKIE not in response.headers.get("Set-Cookie", "")
+    response = client.post("/users/logout", headers=headers)
+    assert response.status_code == 200
+    assert response.headers["Set-Cookie"].startswith(PRIMARY_COOKIE + "=")
+    client.delete_cookie(PRIMARY_COOKIE)
+
+
+# Any worker reads the window from the cookie, so it holds however
+# the client's requests are spread.
+def test_reads_follow_the_cookie(app):
+    for until, expected in ((time.time() + 5, True), (time.time() - 1, False), ("junk", False)):
+        with app.test_request_context("/teams/", headers={"Cookie": f"{PRIMARY_COOKIE}={until}"}):
+            assert wrote_recently() is expected
+    with app.test_request_context("/teams/"):
+        assert not wrote_recently()
@@ -0,0 +1,18 @@
+from migrations import m0006_search
+from search import FTS_TABLES, create_fts
+from setup import db
+
+
+# "flask db create" already made the FTS5 tables and triggers, so
+# creating them again, directly or through migration 0006, has to
+# leave them as they are.
+def test_fts_tables_can_be_created_again(app, client, admin):
+    with app.app_context():
+        with db.engine.begin() as connection:
+            for table_name in FTS_TABLES:
+                create_fts(connection, table_name, rebuild=True)
+            m0006_search.upgrade(connection)
+    response = client.get("/search?q=jasper&type=users", headers=admin)
+    assert response.status_code == 200
+    ids = [user["id"] for user in response.json["users"]]
+    assert ids and len(ids) == len(set(ids))
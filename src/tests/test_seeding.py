@@ -0,0 +1,37 @@
+from models.league import League
+from models.sport import Sport
+from models.team import Team, FREE_AGENTS_TEAM_ID
+from models.user import User
+from seeding import generate
+from setup import db
+
+
+# Generates more users than the new teams have places for, checks
+# they were filled up to their sport's max_players and the rest went
+# to the Free Agents pool, then rolls the rows back again.
+def test_generated_teams_stay_within_max_players(app):
+    with app.app_context():
+        first_team = db.session.scalar(db.select(db.func.max(Team.id))) + 1
+        first_user = db.session.scalar(db.select(db.func.max(User.id))) + 1
+        try:
+            generate(2, 1, 3, 200, 7, "x")
+            players = db.func.count(User.id)
+            rows = db.session.execute(
+                db.select(Team.id, Sport.max_players, players)
+                .join(League, Team.league == League.id)
+                .join(Sport, League.sport == Sport.id)
+                .outerjoin(User, User.team_id == Team.id)
+                .where(Team.id >= first_team)
+                .group_by(Team.id, Sport.max_players)
+            ).all()
+            assert len(rows) == 6
+            assert all(count == max_players for _, max_players, count in rows)
+
+            free_agents = db.session.scalar(
+                db.select(db.func.count()).where(User.id >= first_user, User.team_id == FREE_AGENTS_TEAM_ID))
+            assert free_agents == 200 - sum(max_players for _, max_players, _ in rows)
+            captains = db.session.scalar(
+                db.select(db.func.count()).where(User.id >= first_user, User.captain))
+            assert captains == 6
+        finally:
+            db.session.rollback()
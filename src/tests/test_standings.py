@@ -0,0 +1,41 @@
+from etags import bump
+from models.team import Team, FREE_AGENTS_TEAM_ID
+from setup import db
+from standings import standings
+
+
+def league_team(league_id):
+    stmt = db.select(Team).where(Team.league == league_id, Team.id != FREE_AGENTS_TEAM_ID)
+    return db.session.scalars(stmt.order_by(Team.id)).first()
+
+
+def points(table, team_id):
+    return next(row["points"] for row in table if row["id"] == team_id)
+
+
+# A write handled by another worker only reaches this one through the
+# league's version, which the cached table has to notice.
+def test_table_is_rebuilt_after_another_workers_write(app):
+    with app.app_context():
+        team = league_team(1)
+        before = points(standings.table(1), team.id)
+        team.points = before + 3
+        bump("league:1")
+        db.session.commit()
+        assert points(standings.table(1), team.id) == before + 3
+
+
+# The worker that made the change moves the team itself and keeps
+# serving the table without rebuilding it.
+def test_update_keeps_the_table_current(app):
+    with app.app_context():
+        team = league_team(1)
+        before = points(standings.table(1), team.id)
+        team.points = before + 1
+        bump("league:1")
+        db.session.commit()
+        standings.update([team])
+        version, table = standings._tables[1]
+        assert points(table.ranked(), team.id) == before + 1
+        assert standings.table(1) == table.ranked()
+        assert standings._tables[1] == (version, table)
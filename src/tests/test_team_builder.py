@@ -0,0 +1,58 @@
+from conftest import login, add_free_agents
+from matching import free_agent_index
+from models.league import League
+from models.team import Team, FREE_AGENTS_TEAM_ID
+from models.user import User
+from setup import db
+from team_builder import propose
+
+
+# Free agents of league 7's sport, and those who named no sport, are
+# in its pool. Those who asked for the other sport, or for another
+# league of the same sport, aren't.
+def test_pool_is_scoped_to_the_leagues_sport(app):
+    with app.app_context():
+        league = db.session.get(League, 7)
+        other_sport = db.session.scalar(db.select(League.sport).where(League.sport != league.sport))
+        other_league = db.session.scalar(
+            db.select(League.id).where(League.sport == league.sport, League.id != league.id))
+        wanted = add_free_agents(["Ann", "Bob"], FREE_AGENTS_TEAM_ID, sport_id=league.sport)
+        wanted += add_free_agents(["Cat"], FREE_AGENTS_TEAM_ID, league_id=league.id)
+        wanted += add_free_agents(["Dan"], None)
+        unwanted = add_free_agents(["Eli", "Flo"], FREE_AGENTS_TEAM_ID, sport_id=other_sport)
+        unwanted += add_free_agents(["Gus"], None, league_id=other_league)
+        try:
+            proposal = propose(league, 2, {})
+            players = [player for team in proposal["teams"] for player in team["players"]]
+            pool = set(players + proposal["unassigned"])
+            assert set(wanted) <= pool
+            assert not pool & set(unwanted)
+        finally:
+            db.session.rollback()
+            free_agent_index.invalidate()
+
+
+def test_commit_revokes_the_players_tokens(app, client, admin):
+    with app.app_context():
+        players = add_free_agents(["Eve", "Fay"], FREE_AGENTS_TEAM_ID)
+        db.session.commit()
+    tokens = [login(client, f"{name}.{FREE_AGENTS_TEAM_ID}@agents.com") for name in ("eve", "fay")]
+    for headers in tokens:
+        assert client.get("/teams/", headers=headers).status_code == 200
+
+    response = client.post("/leagues/1/build/commit", headers=admin,
+                           json={"teams": [{"team_name": "Built Team", "players": players}]})
+    assert response.status_code == 201
+    for headers in tokens:
+        assert client.get("/teams/", headers=headers).status_code == 401
+
+
+# A player who has joined a team since the proposal fails the whole
+# build with a 409 and nothing is created.
+def test_commit_rejects_players_who_are_no_longer_free_agents(app, client, admin):
+    response = client.post("/leagues/1/build/commit", headers=admin,
+                           json={"teams": [{"team_name": "Taken Players", "players": [2, 3]}]})
+    assert response.status_code == 409
+    assert response.json["error"] == "Players are no longer free agents: 2, 3"
+    with app.app_context():
+        assert not db.session.scalar(db.select(Team).where(Team.team_name == "Taken Players"))